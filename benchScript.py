@@ -0,0 +1,23 @@
+import src.benchmark as benchmark
+
+# ---------- 1. Input variables ----------
+# Everything runs offline: a synthetic trip is generated and tiles come from a local stub server
+work_folder = "benchmark/"
+results_path = "benchmark/results.json"
+baseline_path = ""  # Set to a previous results.json to compare against it
+n_photos = 50
+n_locations = 5000
+n_days = 2
+n_frames = 10  # Frames rendered by each preset
+memory_frames = 0  # Frames rendered by each preset to check that memory does not grow. 0 to skip the check
+
+# ---------- 2. Run ----------
+if __name__ == '__main__':
+    benchmark.run_benchmark(work_folder, results_path, n_photos, n_locations, n_days, n_frames)
+    if baseline_path:
+        benchmark.compare_results(baseline_path, results_path)
+    if memory_frames:
+        list_failed = benchmark.run_memory_check(work_folder + "memory/", work_folder + "memory.json", memory_frames)
+        if list_failed:
+            print("ERROR: Memory grows with the frame count on", ", ".join(list_failed))
+            exit(-1)
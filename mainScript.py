@@ -2,8 +2,14 @@ import os.path
 import src.helpers as helpers
 import src.extractExif as extractExif
 import src.extractGoogleLocationHistory as extractGoogleLocation
+import src.trackImport as trackImport
+import src.track as track
 import src.mapplotAnimationPresets as mapplotAnimationPresets
 import src.extraAnimationPresets as extraAnimationPresets
+import src.renderMetrics as renderMetrics
+import src.mapplot as mapplot
+import src.mosaicCache as mosaicCache
+import src.memoryBudget as memoryBudget
 
 # ---------- 1. Input variables ----------
 # Remember that photos must be already ordered chronologically
@@ -13,6 +19,9 @@ timezone_hour_diff = 1  # Won't sync properly photos from different timezones
 force_regenerate = False  # To create again the csv from images and history location
 use_location_history = True  # Set to True if location history is available. Set to False to use exif data
 location_history_path = "location history.json"  # Can be full path
+track_sources = []  # GPX, FIT or csv tracks merged with the location history. Where they overlap the first ones are used
+resample_interval_s = 0  # Keep a location history sample every this seconds, for dense logs. 0 to keep all
+resample_distance_m = 0  # Keep a location history sample every this meters travelled. 0 to keep all
 
 # Proceed to step 3 to configure what plots are generated
 
@@ -26,9 +35,17 @@ dict_exif = extractExif.load_exif_data(aux_folder, timezone_hour_diff, autofix=F
 
 if use_location_history:
     if not os.path.isfile(aux_folder+"location_history.csv") or force_regenerate:
-        extractGoogleLocation.extract_from_location_history(
-            location_history_path, aux_folder, dict_exif['timestampMs'][0], dict_exif['timestampMs'][-1])
+        if track_sources:
+            list_track_paths = track_sources + ([location_history_path] if location_history_path else [])
+            trackImport.extract_tracks(list_track_paths, aux_folder, dict_exif['timestampMs'][0],
+                                       dict_exif['timestampMs'][-1])
+        else:
+            extractGoogleLocation.extract_from_location_history(
+                location_history_path, aux_folder, dict_exif['timestampMs'][0], dict_exif['timestampMs'][-1])
     dict_Loc_History = extractGoogleLocation.load_location_history_data(aux_folder)
+    if resample_interval_s > 0 or resample_distance_m > 0:
+        dict_Loc_History = track.resample(dict_Loc_History, resample_interval_s, resample_distance_m,
+                                          track.get_anchor_timestamps_ms(dict_exif))
 else:
     dict_Loc_History = extractExif.exif_data_to_loc_hist(dict_exif)
 
@@ -36,21 +53,52 @@ else:
 img_start = 0
 img_start_middle = 0
 img_end = -1  # Set to -1 to process all images in folder
+n_tween = 0  # Interpolated frames between consecutive photos on map plots. The marker moves along the location history
+look_ahead = 0  # Maps downloaded in background for the next photos while the current one is drawn. 0 to disable
+mosaic_cache_mb = 256  # Memory for the maps of previous areas, shared by the map presets. 0 to disable
+memory_budget_mb = 0  # Memory for the cache, background downloads and pending encodes together. 0 to not limit it
+metrics_folder = project_name + "/metrics/"  # Per frame stage timings are stored here as json lines
+helpers.ensure_directory(metrics_folder)
+if memory_budget_mb:
+    mapplot.MapPlot.memory_budget = memoryBudget.MemoryBudget(memory_budget_mb)
+if mosaic_cache_mb:
+    mapplot.MapPlot.mosaic_cache = mosaicCache.MosaicCache(mosaic_cache_mb, mapplot.MapPlot.memory_budget)
 
-mapplotAnimationPresets.region_all_data(
-    dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/region/")
+with renderMetrics.RenderMetrics(metrics_folder + "region.jsonl", name="region") as metrics:
+    mapplotAnimationPresets.region_all_data(
+        dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/region/",
+        n_tween=n_tween, look_ahead=look_ahead, metrics=metrics)
 
-mapplotAnimationPresets.centered_on_location(
-    dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/centered/")
+with renderMetrics.RenderMetrics(metrics_folder + "centered.jsonl", name="centered") as metrics:
+    mapplotAnimationPresets.centered_on_location(
+        dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/centered/",
+        n_tween=n_tween, look_ahead=look_ahead, metrics=metrics)
 
-mapplotAnimationPresets.region_expanding_by_day(
-    dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/region_expanding_day/")
+with renderMetrics.RenderMetrics(metrics_folder + "region_expanding_day.jsonl", name="region_expanding_day") as metrics:
+    mapplotAnimationPresets.region_expanding_by_day(
+        dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, project_name+"/region_expanding_day/",
+        n_tween=n_tween, look_ahead=look_ahead, metrics=metrics)
 
-mapplotAnimationPresets.region_expanding_by_last_n_pics(
-    dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, output_folder= project_name+"/region_expanding_last/")
+with renderMetrics.RenderMetrics(metrics_folder + "region_expanding_last.jsonl", name="region_expanding_last") as metrics:
+    mapplotAnimationPresets.region_expanding_by_last_n_pics(
+        dict_exif, dict_Loc_History, img_start, img_end, img_start_middle, output_folder= project_name+"/region_expanding_last/",
+        n_tween=n_tween, look_ahead=look_ahead, metrics=metrics)
 
-extraAnimationPresets.clocks(dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/clocks/")
-extraAnimationPresets.timeline(dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/timeline/")
-extraAnimationPresets.frame_count(dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/frame_count/")
+with renderMetrics.RenderMetrics(metrics_folder + "clocks.jsonl", name="clocks") as metrics:
+    extraAnimationPresets.clocks(
+        dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/clocks/",
+        metrics=metrics)
 
+with renderMetrics.RenderMetrics(metrics_folder + "timeline.jsonl", name="timeline") as metrics:
+    extraAnimationPresets.timeline(
+        dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/timeline/",
+        metrics=metrics)
+
+with renderMetrics.RenderMetrics(metrics_folder + "frame_count.jsonl", name="frame_count") as metrics:
+    extraAnimationPresets.frame_count(
+        dict_exif, img_start, img_end, img_start_middle, project_name+"/extra/frame_count/",
+        metrics=metrics)
+
+if mapplot.MapPlot.mosaic_cache:
+    mapplot.MapPlot.mosaic_cache.print_stats()
 print("PLOTTING ENDED -")
@@ -0,0 +1,63 @@
+import math
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# Scales per octave between levels. Views that grow or shrink over the same map switch between them
+LEVELS_PER_OCTAVE = 2
+# Levels kept per map. The least recently used are dropped
+MAX_LEVELS = 4
+
+
+def get_map_px_per_output_px(view_px, output_px):
+    """Map pixels shown per output pixel for a view of view_px (width, height) in an output of output_px"""
+    return max(view_px[0] / float(output_px[0]), view_px[1] / float(output_px[1]))
+
+
+class BasemapPyramid:
+    """
+    Copies of a map mosaic resampled close to the output resolution, as RGBA arrays ready for imshow. The mosaic is
+    resampled once per level instead of matplotlib resampling the full mosaic on every frame.
+    The first level matches the output resolution for the view the map was loaded for, so constant views are shown
+    1:1. Other views take the coarsest level that still has a map pixel per output pixel. Levels are LEVELS_PER_OCTAVE
+    steps per octave from the first one, up to the full resolution
+    """
+
+    def __init__(self, img, view_px, output_px):
+        """
+        :param img: PIL mosaic of the map
+        :param view_px: (width, height) in map pixels of the view the map was loaded for
+        :param output_px: (width, height) in pixels of the saved plots
+        """
+        self.img = img
+        ratio = get_map_px_per_output_px(view_px, output_px)
+        self.base_scale = min(1.0, 1 / ratio) if ratio > 0 else 1.0
+        self.dict_levels_ = OrderedDict()  # Scale: RGBA array, from least to most recently used
+        self.stats_resampled = 0
+
+    def get_scale(self, view_px, output_px):
+        """Scale of the level used for a view. 1 is the full resolution mosaic"""
+        ratio = get_map_px_per_output_px(view_px, output_px)
+        if ratio <= 0:
+            return 1.0
+        # Coarsest level k with base_scale * 2^(k / LEVELS_PER_OCTAVE) * ratio >= 1
+        k = math.ceil(LEVELS_PER_OCTAVE * math.log2(1 / (self.base_scale * ratio)) - 1e-9)
+        return min(1.0, self.base_scale * 2 ** (k / float(LEVELS_PER_OCTAVE)))
+
+    def get_image(self, view_px, output_px):
+        """Returns the RGBA array of the level for a view. It covers the whole mosaic, show it with its extent"""
+        scale = self.get_scale(view_px, output_px)
+        if scale in self.dict_levels_:
+            self.dict_levels_.move_to_end(scale)
+            return self.dict_levels_[scale]
+
+        img = self.img if self.img.mode == 'RGBA' else self.img.convert('RGBA')
+        if scale < 1:
+            size = (max(1, int(round(img.width * scale))), max(1, int(round(img.height * scale))))
+            img = img.resize(size, Image.LANCZOS)
+            self.stats_resampled += 1
+        level = np.asarray(img)
+        self.dict_levels_[scale] = level
+        while len(self.dict_levels_) > MAX_LEVELS:
+            self.dict_levels_.popitem(last=False)
+        return level
@@ -0,0 +1,392 @@
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import contextlib
+import multiprocessing
+import src.helpers as helpers
+import src.syntheticData as syntheticData
+
+# Render presets that can be benchmarked. Name: (module, function, needs location data)
+PRESETS = {
+    'region_all_data': ('src.mapplotAnimationPresets', 'region_all_data', True),
+    'centered_on_location': ('src.mapplotAnimationPresets', 'centered_on_location', True),
+    'region_expanding_by_day': ('src.mapplotAnimationPresets', 'region_expanding_by_day', True),
+    'region_expanding_by_last_n_pics': ('src.mapplotAnimationPresets', 'region_expanding_by_last_n_pics', True),
+    'clocks': ('src.extraAnimationPresets', 'clocks', False),
+    'timeline': ('src.extraAnimationPresets', 'timeline', False),
+    'frame_count': ('src.extraAnimationPresets', 'frame_count', False),
+}
+
+
+def get_peak_rss_kb():
+    """Returns the peak resident memory of the current process in KB. None if it can not be measured"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KB
+    if sys.platform == 'darwin':
+        peak = peak // 1024
+    return peak
+
+
+def get_current_rss_kb():
+    """Returns the current resident memory of the process in KB. None if it can not be measured, only Linux is read"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_memory_slope_kb(list_samples_kb, list_budget_kb=None, warm_up_ratio=0.25, full_ratio=0.9):
+    """
+    Memory growth in KB per frame: least squares slope of the samples taken after the warm up. Bounded memory
+    oscillates around the same values once the caches are full, a leak keeps raising them by the same amount every
+    frame, which the slope measures whatever the length of the run
+    :param list_budget_kb: Memory held in the memory budget at each sample (mosaic cache, prefetched maps and frames
+    waiting to be encoded). It is not counted, and the warm up lasts at least until it first reaches full_ratio of its
+    highest value, as the cache fills up to its size by design
+    """
+    idx_steady = int(len(list_samples_kb) * warm_up_ratio)
+    if list_budget_kb:
+        list_samples_kb = [sample_kb - budget_kb for sample_kb, budget_kb in zip(list_samples_kb, list_budget_kb)]
+        budget_full_kb = max(list_budget_kb) * full_ratio
+        idx_full = next(i for i, budget_kb in enumerate(list_budget_kb) if budget_kb >= budget_full_kb)
+        idx_steady = max(idx_steady, idx_full)
+    list_steady = list_samples_kb[idx_steady:]
+    n_samples = len(list_steady)
+    if n_samples < 2:
+        return 0.0
+    mean_x = (n_samples - 1) / 2.0
+    mean_y = sum(list_steady) / float(n_samples)
+    sum_xy = sum((i - mean_x) * (sample_kb - mean_y) for i, sample_kb in enumerate(list_steady))
+    sum_xx = sum((i - mean_x) ** 2 for i in range(n_samples))
+    return sum_xy / sum_xx
+
+
+# Stage functions run in a child process and return: seconds, item count, item unit, dictionary with extra results
+def stage_extract_exif(work_folder, trip):
+    """Extracts exif from the synthetic photos into the auxiliar folder"""
+    import src.extractExif as extractExif
+    aux_folder = work_folder + "auxiliar/"
+    helpers.ensure_directory(aux_folder)
+
+    time_start = time.perf_counter()
+    extractExif.extract_exif_folder(trip['pics_folder'], aux_folder)
+    return time.perf_counter() - time_start, trip['n_photos'], 'images', {}
+
+
+def stage_extract_history(work_folder, trip):
+    """Extracts the synthetic location history json between the first and last photo"""
+    import src.extractExif as extractExif
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    aux_folder = work_folder + "auxiliar/"
+    dict_exif = extractExif.load_exif_data(aux_folder, trip['timezone_hour_diff'], autofix=False)
+
+    time_start = time.perf_counter()
+    extractGoogleLocation.extract_from_location_history(
+        trip['location_history_path'], aux_folder, dict_exif['timestampMs'][0], dict_exif['timestampMs'][-1])
+    return time.perf_counter() - time_start, trip['n_locations'], 'locations', {}
+
+
+def stage_load_exif(work_folder, trip):
+    """Loads the exif csv"""
+    import src.extractExif as extractExif
+    time_start = time.perf_counter()
+    dict_exif = extractExif.load_exif_data(work_folder + "auxiliar/", trip['timezone_hour_diff'], autofix=False)
+    return time.perf_counter() - time_start, len(dict_exif['timestampMs']), 'rows', {}
+
+
+def stage_load_history(work_folder, trip):
+    """Loads the location history csv"""
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    with open(work_folder + "auxiliar/location_history.csv") as f:
+        n_rows = sum(1 for _ in f)
+
+    time_start = time.perf_counter()
+    extractGoogleLocation.load_location_history_data(work_folder + "auxiliar/")
+    return time.perf_counter() - time_start, n_rows, 'rows', {}
+
+
+def stage_preset(work_folder, trip, preset_name, n_frames, tileserver):
+    """Renders n_frames of a preset using the stub tile server"""
+    import importlib
+    import matplotlib
+    matplotlib.use('Agg')
+    import src.mapplot as mapplot
+    import src.renderMetrics as renderMetrics
+    import src.extractExif as extractExif
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    mapplot.MapPlot.tileserver = tileserver
+    mapplot.MapPlot.download_delay_s = 0
+
+    aux_folder = work_folder + "auxiliar/"
+    dict_exif = extractExif.load_exif_data(aux_folder, trip['timezone_hour_diff'], autofix=False)
+    dict_loc_history = extractGoogleLocation.load_location_history_data(aux_folder)
+
+    module_name, fcn_name, needs_location = PRESETS[preset_name]
+    preset_fcn = getattr(importlib.import_module(module_name), fcn_name)
+    img_end = min(n_frames, len(dict_exif['timestampMs']))
+    output_folder = work_folder + "render/" + preset_name + "/"
+    metrics = renderMetrics.RenderMetrics(name=preset_name)
+
+    time_start = time.perf_counter()
+    if needs_location:
+        preset_fcn(dict_exif, dict_loc_history, 0, img_end, 0, output_folder=output_folder, metrics=metrics)
+    else:
+        preset_fcn(dict_exif, 0, img_end, 0, output_folder=output_folder, metrics=metrics)
+    return time.perf_counter() - time_start, img_end, 'frames', {'stage_timings': metrics.summary()}
+
+
+def stage_memory(work_folder, trip, preset_name, n_frames, tileserver, mode, memory_budget_mb):
+    """Renders n_frames of a preset with background downloads and encoding, sampling the memory after every frame.
+    mode is 'rss' for the resident memory or 'tracemalloc' for the memory allocated through python"""
+    import importlib
+    import tracemalloc
+    import matplotlib
+    matplotlib.use('Agg')
+    import src.mapplot as mapplot
+    import src.memoryBudget as memoryBudget
+    import src.mosaicCache as mosaicCache
+    import src.renderMetrics as renderMetrics
+    import src.extractExif as extractExif
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    mapplot.MapPlot.tileserver = tileserver
+    mapplot.MapPlot.download_delay_s = 0
+    if memory_budget_mb:
+        mapplot.MapPlot.memory_budget = memoryBudget.MemoryBudget(memory_budget_mb)
+        mapplot.MapPlot.mosaic_cache = mosaicCache.MosaicCache(memory_budget_mb, mapplot.MapPlot.memory_budget)
+
+    aux_folder = work_folder + "auxiliar/"
+    dict_exif = extractExif.load_exif_data(aux_folder, trip['timezone_hour_diff'], autofix=False)
+    dict_loc_history = extractGoogleLocation.load_location_history_data(aux_folder)
+
+    if mode == 'rss' and get_current_rss_kb() is None:
+        mode = 'tracemalloc'
+    if mode == 'tracemalloc':
+        tracemalloc.start()
+        get_sample_kb = lambda: tracemalloc.get_traced_memory()[0] // 1024
+    else:
+        get_sample_kb = get_current_rss_kb
+    list_samples_kb = []
+    list_budget_kb = []
+
+    def sample_memory(record):
+        # Garbage waiting for the cyclic collector would make the samples climb and fall between collections
+        gc.collect()
+        list_samples_kb.append(get_sample_kb())
+        # The budget holds PIL images, which tracemalloc does not see, so it is only subtracted from the RSS
+        if mapplot.MapPlot.memory_budget and mode == 'rss':
+            list_budget_kb.append(mapplot.MapPlot.memory_budget.used_bytes // 1024)
+
+    module_name, fcn_name, needs_location = PRESETS[preset_name]
+    preset_fcn = getattr(importlib.import_module(module_name), fcn_name)
+    img_end = min(n_frames, len(dict_exif['timestampMs']))
+    output_folder = work_folder + "render/" + preset_name + "/"
+    metrics = renderMetrics.RenderMetrics(callback=sample_memory, name=preset_name)
+
+    time_start = time.perf_counter()
+    if needs_location:
+        preset_fcn(dict_exif, dict_loc_history, 0, img_end, 0, output_folder=output_folder, metrics=metrics,
+                   look_ahead=2)
+    else:
+        preset_fcn(dict_exif, 0, img_end, 0, output_folder=output_folder, metrics=metrics)
+    extra = {'memory_mode': mode, 'memory_samples_kb': list_samples_kb, 'memory_budget_samples_kb': list_budget_kb,
+             'memory_slope_kb': get_memory_slope_kb(list_samples_kb, list_budget_kb)}
+    if mapplot.MapPlot.memory_budget:
+        extra['memory_budget'] = mapplot.MapPlot.memory_budget.get_stats()
+    return time.perf_counter() - time_start, len(list_samples_kb), 'frames', extra
+
+
+def stage_worker(queue, stage_fcn, args):
+    """Runs a stage in a child process with the console output muted and reports the result"""
+    try:
+        with open(os.devnull, 'w') as f_null, contextlib.redirect_stdout(f_null):
+            seconds, count, unit, extra = stage_fcn(*args)
+        result = {'seconds': seconds, 'count': count, 'unit': unit, 'peak_rss_kb': get_peak_rss_kb()}
+        result.update(extra)
+        queue.put(result)
+    except BaseException as e:
+        queue.put({'error': repr(e)})
+
+
+def run_stage(name, stage_fcn, args, tile_server):
+    """Runs a stage in a fresh process, so peak RSS is measured per stage, and returns its result dictionary"""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    tiles_before = tile_server.tiles_served
+
+    process = ctx.Process(target=stage_worker, args=(queue, stage_fcn, args))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    result['name'] = name
+    result['tiles_fetched'] = tile_server.tiles_served - tiles_before
+    if 'seconds' in result:
+        result['rate_per_s'] = result['count'] / result['seconds'] if result['seconds'] > 0 else None
+    print("%-42s %.3fs %s %s, peak RSS %s KB, %d tiles" % (
+        name, result.get('seconds', 0), result.get('count'), result.get('unit'), result.get('peak_rss_kb'),
+        result['tiles_fetched']))
+    if 'error' in result:
+        print("    ERROR:", result['error'])
+    return result
+
+
+def run_benchmark(work_folder, results_path, n_photos=50, n_locations=5000, n_days=2, n_frames=10,
+                  presets=None, seed=0):
+    """
+    Generates a synthetic trip and benchmarks extraction, loading and render presets without network access
+    :param work_folder: Folder for the synthetic trip and rendered frames
+    :param results_path: Path of the json file where results are stored
+    :param n_photos: Number of synthetic photos
+    :param n_locations: Number of synthetic location history samples
+    :param n_days: Number of days of the synthetic trip
+    :param n_frames: Number of frames rendered per preset
+    :param presets: List of preset names to benchmark. None to run all of them
+    :return: Results dictionary
+    """
+    if presets is None:
+        presets = list(PRESETS.keys())
+    helpers.ensure_directory(work_folder)
+
+    print("Generating synthetic trip ...")
+    trip = syntheticData.generate_trip(work_folder + "trip/", n_photos, n_locations, n_days, seed=seed)
+
+    tile_server = syntheticData.StubTileServer().start()
+    try:
+        list_stages = [
+            ('extract_exif_folder', stage_extract_exif, (work_folder, trip)),
+            ('extract_from_location_history', stage_extract_history, (work_folder, trip)),
+            ('load_exif_data', stage_load_exif, (work_folder, trip)),
+            ('load_location_history_data', stage_load_history, (work_folder, trip)),
+        ]
+        for preset_name in presets:
+            list_stages.append(('preset.' + preset_name, stage_preset,
+                                (work_folder, trip, preset_name, n_frames, tile_server.get_tileserver_url())))
+
+        list_results = [run_stage(name, stage_fcn, args, tile_server) for name, stage_fcn, args in list_stages]
+    finally:
+        tile_server.stop()
+
+    results = {
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'n_photos': n_photos, 'n_locations': n_locations, 'n_days': n_days, 'n_frames': n_frames,
+                   'seed': seed},
+        'stages': list_results,
+    }
+    with open(results_path, 'w') as f_out:
+        json.dump(results, f_out, indent=2)
+    print("Benchmark results stored in", results_path)
+    return results
+
+
+def run_memory_check(work_folder, results_path, n_frames=500, presets=None, mode='rss', max_growth_mb=450.0,
+                     projected_frames=10000, memory_budget_mb=64, seed=0):
+    """
+    Renders n_frames of each preset sampling the memory after every frame and checks that it does not grow with the
+    frame count, as needed by long unattended renders
+    :param work_folder: Folder for the synthetic trip, with a photo per frame, and rendered frames
+    :param results_path: Path of the json file where the samples are stored
+    :param mode: 'rss' for the resident memory or 'tracemalloc' for the memory allocated through python. tracemalloc
+    is used where the resident memory can not be read
+    :param max_growth_mb: Growth allowed over projected_frames at the rate measured, not counting the memory held in
+    the memory budget. See get_memory_slope_kb. The default fails from 46 KB per frame, above the rate the map presets
+    show on 300 frames of the synthetic trip
+    :param projected_frames: Frames of a long render the growth is projected to
+    :param memory_budget_mb: Memory budget and mosaic cache size used by the map presets. 0 to not set them
+    :return: List of preset names whose memory grows or that failed
+    """
+    if presets is None:
+        presets = list(PRESETS.keys())
+    if mode == 'rss' and get_current_rss_kb() is None:
+        print("Resident memory can not be read on %s, tracemalloc is used" % sys.platform)
+        mode = 'tracemalloc'
+    helpers.ensure_directory(work_folder)
+
+    print("Generating synthetic trip ...")
+    trip = syntheticData.generate_trip(work_folder + "trip/", n_frames, n_frames * 20, seed=seed)
+
+    tile_server = syntheticData.StubTileServer().start()
+    try:
+        list_stages = [
+            ('extract_exif_folder', stage_extract_exif, (work_folder, trip)),
+            ('extract_from_location_history', stage_extract_history, (work_folder, trip)),
+        ]
+        for preset_name in presets:
+            list_stages.append(('memory.' + preset_name, stage_memory,
+                                (work_folder, trip, preset_name, n_frames, tile_server.get_tileserver_url(), mode,
+                                 memory_budget_mb)))
+        # Large buffers are mapped and unmapped one by one in the stage processes, so the resident memory follows
+        # the memory in use instead of what the allocator keeps around after the maps are freed
+        mmap_threshold = os.environ.get('MALLOC_MMAP_THRESHOLD_')
+        os.environ['MALLOC_MMAP_THRESHOLD_'] = str(128 * 1024)
+        try:
+            list_results = [run_stage(name, stage_fcn, args, tile_server) for name, stage_fcn, args in list_stages]
+        finally:
+            if mmap_threshold is None:
+                del os.environ['MALLOC_MMAP_THRESHOLD_']
+            else:
+                os.environ['MALLOC_MMAP_THRESHOLD_'] = mmap_threshold
+    finally:
+        tile_server.stop()
+
+    list_failed = []
+    for result in list_results[2:]:
+        b_failed = 'error' in result or result['memory_slope_kb'] * projected_frames > max_growth_mb * 1024
+        if b_failed:
+            list_failed.append(result['name'][len('memory.'):])
+        if 'memory_slope_kb' in result:
+            print("%-42s %s grows %.1f KB per frame, %.0f MB in %d frames%s" % (
+                result['name'], mode, result['memory_slope_kb'], result['memory_slope_kb'] * projected_frames / 1024.0,
+                projected_frames, "  GROWS" if b_failed else ""))
+
+    results = {
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'n_frames': n_frames, 'mode': mode, 'max_growth_mb': max_growth_mb,
+                   'projected_frames': projected_frames, 'memory_budget_mb': memory_budget_mb, 'seed': seed},
+        'stages': list_results,
+    }
+    with open(results_path, 'w') as f_out:
+        json.dump(results, f_out, indent=2)
+    print("Memory check results stored in", results_path)
+    return list_failed
+
+
+def compare_results(baseline_path, current_path, tolerance=0.10):
+    """
+    Compares two benchmark result files and prints the relative change of each stage
+    :param tolerance: Relative slowdown or memory increase allowed before flagging a regression
+    :return: List of stage names with a regression
+    """
+    with open(baseline_path) as f:
+        baseline = {stage['name']: stage for stage in json.load(f)['stages']}
+    with open(current_path) as f:
+        current = {stage['name']: stage for stage in json.load(f)['stages']}
+
+    list_regressions = []
+    for name, stage in current.items():
+        if name not in baseline or 'seconds' not in stage or 'seconds' not in baseline[name]:
+            continue
+        ratio_time = stage['seconds'] / baseline[name]['seconds'] if baseline[name]['seconds'] > 0 else 1.0
+        ratio_rss = 1.0
+        if stage['peak_rss_kb'] and baseline[name]['peak_rss_kb']:
+            ratio_rss = stage['peak_rss_kb'] / baseline[name]['peak_rss_kb']
+
+        b_regression = ratio_time > 1 + tolerance or ratio_rss > 1 + tolerance or \
+            stage['tiles_fetched'] > baseline[name]['tiles_fetched']
+        if b_regression:
+            list_regressions.append(name)
+        print("%-42s time x%.2f, rss x%.2f, tiles %d -> %d%s" % (
+            name, ratio_time, ratio_rss, baseline[name]['tiles_fetched'], stage['tiles_fetched'],
+            "  REGRESSION" if b_regression else ""))
+    return list_regressions
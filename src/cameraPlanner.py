@@ -0,0 +1,170 @@
+import src.zoomPlanner as zoomPlanner
+
+
+def bbox_union(bbox_a, bbox_b):
+    """Smallest (y_min, x_min, y_max, x_max) box containing both boxes"""
+    return (min(bbox_a[0], bbox_b[0]), min(bbox_a[1], bbox_b[1]),
+            max(bbox_a[2], bbox_b[2]), max(bbox_a[3], bbox_b[3]))
+
+
+def smooth_views(list_bbox, smoothing_frames):
+    """
+    Smooths the center and size of a sequence of views with a centered moving average. Each smoothed view is enlarged
+    to still contain the original one, so no required sample is left out of the frame
+    :param list_bbox: List of (y_min, x_min, y_max, x_max) boxes, one per frame
+    :param smoothing_frames: Width of the moving average window. 1 or less returns the input views
+    """
+    if smoothing_frames <= 1:
+        return list(list_bbox)
+
+    half_window = smoothing_frames // 2
+    list_smoothed = []
+    for i in range(len(list_bbox)):
+        list_window = list_bbox[max(0, i - half_window): i + half_window + 1]
+        center_y = sum((b[0] + b[2]) / 2.0 for b in list_window) / len(list_window)
+        center_x = sum((b[1] + b[3]) / 2.0 for b in list_window) / len(list_window)
+        half_y = sum((b[2] - b[0]) / 2.0 for b in list_window) / len(list_window)
+        half_x = sum((b[3] - b[1]) / 2.0 for b in list_window) / len(list_window)
+        bbox_smoothed = (center_y - half_y, center_x - half_x, center_y + half_y, center_x + half_x)
+        list_smoothed.append(bbox_union(bbox_smoothed, list_bbox[i]))
+    return list_smoothed
+
+
+def get_max_zoom_in_budget(bbox, maxtiles, z_max):
+    """Highest zoom level, up to z_max, where the tiles covering bbox are fewer than maxtiles"""
+    z = z_max
+    while z > 0:
+        x0, y0, x1, y1 = zoomPlanner.get_tile_box(bbox, z)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < maxtiles:
+            break
+        z -= 1
+    return z
+
+
+def simulate_per_frame_maps(list_bbox, output_px, oversampling=1.0, maxtiles=16, expect_const_area=False):
+    """
+    Replays the frame by frame decision of MapPlot.set_map: a new map is loaded when the view leaves the current map
+    or, unless expect_const_area, when the view area shrinks below 97.5% of the previous one
+    :return: List of (frame index, ZoomPlan) of each map load
+    """
+    list_loads = []
+    plan = None
+    crop_px = None
+    for i, bbox in enumerate(list_bbox):
+        b_new_map = plan is None
+        if plan is not None:
+            new_crop_px = get_crop_in_map(plan, bbox)
+            x_min_px, y_min_px, x_max_px, y_max_px = new_crop_px
+            if x_max_px >= plan.mosaic_px[0] or x_min_px <= 0 or y_min_px >= plan.mosaic_px[1] or y_max_px <= 0:
+                b_new_map = True
+            elif not expect_const_area and \
+                    abs(new_crop_px[3] - new_crop_px[1]) * abs(new_crop_px[2] - new_crop_px[0]) < \
+                    abs(crop_px[3] - crop_px[1]) * abs(crop_px[2] - crop_px[0]) * 0.975:
+                b_new_map = True
+            else:
+                crop_px = new_crop_px
+
+        if b_new_map:
+            plan = zoomPlanner.plan_zoom(bbox, output_px, oversampling, maxtiles)
+            crop_px = get_crop_in_map(plan, bbox)
+            list_loads.append((i, plan))
+    return list_loads
+
+
+def get_crop_in_map(plan, bbox):
+    """Returns the (x_min, y_min, x_max, y_max) pixels of bbox inside the mosaic of a ZoomPlan. Same axes as smopy"""
+    x_a, y_a = zoomPlanner.deg_to_tile(bbox[0], bbox[1], plan.z)
+    x_b, y_b = zoomPlanner.deg_to_tile(bbox[2], bbox[3], plan.z)
+    x0, y0 = plan.tile_box[0], plan.tile_box[1]
+    return ((x_a - x0) * zoomPlanner.TILESIZE, (y_a - y0) * zoomPlanner.TILESIZE,
+            (x_b - x0) * zoomPlanner.TILESIZE, (y_b - y0) * zoomPlanner.TILESIZE)
+
+
+class CameraPlan:
+    """Views and maps of a whole sequence. Consecutive frames share a map while it is good enough for all of them"""
+
+    def __init__(self):
+        self.list_view_bbox = []  # View of each frame
+        self.list_map_idx = []  # Index in list_maps used by each frame
+        self.list_maps = []  # (map_bbox, z, first_frame, last_frame) of each map load
+        self.n_map_loads_per_frame_logic = 0
+
+    def get_map(self, idx_frame):
+        """Returns the (map_bbox, z) used by a frame"""
+        map_bbox, z, _, _ = self.list_maps[self.list_map_idx[idx_frame]]
+        return map_bbox, z
+
+    def print_report(self):
+        """Prints how many maps the plan loads compared with the frame by frame logic"""
+        n_frames = len(self.list_view_bbox)
+        print("Camera plan: %d frames, %d map loads (frame by frame logic: %d)" % (
+            n_frames, len(self.list_maps), self.n_map_loads_per_frame_logic))
+        if self.list_maps:
+            print("  %.1f frames per map on average" % (n_frames / float(len(self.list_maps))))
+
+
+def plan_camera(list_bbox, output_px, oversampling=1.0, maxtiles=16, smoothing_frames=5, min_resolution_ratio=0.7):
+    """
+    Plans the views and map loads of a whole sequence before rendering it.
+    Views are smoothed first. Then each map is made as large as possible: frames are added to it while the tiles
+    covering all their views fit in the budget and every view keeps enough resolution. The hysteresis comes from
+    min_resolution_ratio: a map is kept until it is this coarse, instead of being reloaded on every shrink
+    :param list_bbox: Required (y_min, x_min, y_max, x_max) view of each frame
+    :param output_px: (width, height) in pixels of the output images
+    :param oversampling: Map pixels per output pixel wanted when a map is loaded
+    :param maxtiles: Tile budget of each map, as in MapPlot
+    :param smoothing_frames: Width of the moving average applied to the views. 1 to disable
+    :param min_resolution_ratio: Lowest map pixels per output pixel accepted on a view before loading a new map
+    :return: CameraPlan
+    """
+    camera_plan = CameraPlan()
+    camera_plan.list_view_bbox = smooth_views(list_bbox, smoothing_frames)
+    camera_plan.n_map_loads_per_frame_logic = len(simulate_per_frame_maps(list_bbox, output_px, oversampling, maxtiles))
+
+    # Zoom each view would get on its own, and the resolution it is allowed to drop to
+    list_z_view = []
+    list_min_ratio = []
+    for bbox in camera_plan.list_view_bbox:
+        plan = zoomPlanner.plan_zoom(bbox, output_px, oversampling, maxtiles)
+        list_z_view.append(plan.z)
+        list_min_ratio.append(min(min_resolution_ratio * oversampling, plan.resolution_ratio))
+
+    def is_map_valid(z, idx_first, idx_last):
+        """True if a map at zoom z keeps enough resolution for the views of the frames from idx_first to idx_last"""
+        for j in range(idx_first, idx_last + 1):
+            if zoomPlanner.ZoomPlan(camera_plan.list_view_bbox[j], z, output_px).resolution_ratio < list_min_ratio[j]:
+                return False
+        return True
+
+    idx_first = 0
+    n_frames = len(camera_plan.list_view_bbox)
+    while idx_first < n_frames:
+        map_bbox = camera_plan.list_view_bbox[idx_first]
+        z_needed = list_z_view[idx_first]
+        # The tiles of a growing map only increase, so the highest zoom in the budget only decreases
+        z_budget = get_max_zoom_in_budget(map_bbox, maxtiles, zoomPlanner.MAX_ZOOM)
+        z = min(z_budget, z_needed)
+        idx_last = idx_first
+
+        # Greedy look ahead: grow the map with the next view while it stays valid for every frame on it
+        while idx_last + 1 < n_frames:
+            map_bbox_next = bbox_union(map_bbox, camera_plan.list_view_bbox[idx_last + 1])
+            z_needed_next = max(z_needed, list_z_view[idx_last + 1])
+            z_budget_next = get_max_zoom_in_budget(map_bbox_next, maxtiles, z_budget)
+            z_next = min(z_budget_next, z_needed_next)
+            # The resolution of a view only grows with the zoom: the frames already on the map are checked again
+            # only if the zoom drops, which happens a few times per map at most
+            if z_next < z:
+                b_valid = is_map_valid(z_next, idx_first, idx_last + 1)
+            else:
+                b_valid = is_map_valid(z_next, idx_last + 1, idx_last + 1)
+            if not b_valid:
+                break
+            map_bbox, z_needed, z_budget, z = map_bbox_next, z_needed_next, z_budget_next, z_next
+            idx_last += 1
+
+        camera_plan.list_maps.append((map_bbox, z, idx_first, idx_last))
+        camera_plan.list_map_idx.extend([len(camera_plan.list_maps) - 1] * (idx_last - idx_first + 1))
+        idx_first = idx_last + 1
+
+    return camera_plan
@@ -0,0 +1,544 @@
+import os
+import sys
+import argparse
+import contextlib
+import importlib
+import configparser
+import src.helpers as helpers
+
+# Settings used when the config file does not set them
+DEFAULT_CONFIG = {
+    'project': {
+        'name': 'Example',
+        'pics_folder': '',
+        'timezone_hour_diff': '1',
+        'use_location_history': 'yes',
+        'location_history_path': 'location history.json',
+        'track_sources': '',
+        'track_accuracy_m': '10',
+        'track_overlap_s': '60',
+        'resample_interval_s': '0',
+        'resample_distance_m': '0',
+        'force_regenerate': 'no',
+        'autofix': 'no',
+    },
+    'render': {
+        'img_start': '0',
+        'img_start_middle': '0',
+        'img_end': '-1',
+        'n_tween': '0',
+        'look_ahead': '0',
+        'mosaic_cache_mb': '256',
+        'memory_budget_mb': '0',
+        'vector_basemap': '',
+        'vector_basemap_bbox': '',
+        'tile_pool_path': '',
+        'camera_plan': 'no',
+        'metrics': 'yes',
+    },
+    'bench': {
+        'work_folder': 'benchmark/',
+        'results_path': 'benchmark/results.json',
+        'baseline_path': '',
+        'n_photos': '50',
+        'n_locations': '5000',
+        'n_days': '2',
+        'n_frames': '10',
+        'memory_frames': '0',
+    },
+    'dashboard': {
+        'map_preset': 'region',
+        'width': '1920',
+        'height': '1080',
+        'background': '#000000',
+        'map': '0 0 1080 1080',
+        'clocks': '1140 60 720 240',
+        'timeline': '1140 420 720 135',
+        'frame_count': '1140 900 720 144',
+    },
+    'draft': {
+        'dpi': '30',
+        'step': '0',
+        'interval_s': '0',
+        'max_frames': '100',
+        'tile_folder': '',
+    },
+}
+
+# Render presets. Name: (module, function, needs location data, output subfolder)
+PRESETS = {
+    'region': ('src.mapplotAnimationPresets', 'region_all_data', True, 'region/'),
+    'centered': ('src.mapplotAnimationPresets', 'centered_on_location', True, 'centered/'),
+    'region_expanding_day': ('src.mapplotAnimationPresets', 'region_expanding_by_day', True, 'region_expanding_day/'),
+    'region_expanding_last': ('src.mapplotAnimationPresets', 'region_expanding_by_last_n_pics', True,
+                              'region_expanding_last/'),
+    'clocks': ('src.extraAnimationPresets', 'clocks', False, 'extra/clocks/'),
+    'timeline': ('src.extraAnimationPresets', 'timeline', False, 'extra/timeline/'),
+    'frame_count': ('src.extraAnimationPresets', 'frame_count', False, 'extra/frame_count/'),
+}
+EXPANDING_PRESETS = ('region_expanding_day', 'region_expanding_last')
+
+
+def load_config(config_path):
+    """Reads an ini config file over the default settings"""
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULT_CONFIG)
+    if config_path:
+        if not os.path.isfile(config_path):
+            raise FileNotFoundError("Config file not found: " + config_path)
+        config.read(config_path)
+    return config
+
+
+def get_aux_folder(config):
+    """Folder where the extracted csv files are stored"""
+    return config['project']['name'] + "/auxiliar/"
+
+
+def extract_exif(config):
+    """Extracts the exif data of the photos into the auxiliar folder"""
+    import src.extractExif as extractExif
+    aux_folder = get_aux_folder(config)
+    helpers.ensure_directory(aux_folder)
+    extractExif.extract_exif_folder(config['project']['pics_folder'], aux_folder)
+
+
+def get_track_sources(config):
+    """Track files merged into the location history, from most to least priority. The google location history is the
+    last one"""
+    list_paths = [path.strip() for path in config['project']['track_sources'].split(',') if path.strip()]
+    if config['project']['location_history_path']:
+        list_paths.append(config['project']['location_history_path'])
+    return list_paths
+
+
+def extract_history(config, dict_exif):
+    """Extracts the location history between the first and last photo into the auxiliar folder"""
+    if config['project']['track_sources'].strip():
+        import src.trackImport as trackImport
+        trackImport.extract_tracks(
+            get_track_sources(config), get_aux_folder(config), dict_exif['timestampMs'][0],
+            dict_exif['timestampMs'][-1], accuracy_m=config.getint('project', 'track_accuracy_m'),
+            overlap_s=config.getfloat('project', 'track_overlap_s'))
+        return
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    extractGoogleLocation.extract_from_location_history(
+        config['project']['location_history_path'], get_aux_folder(config),
+        dict_exif['timestampMs'][0], dict_exif['timestampMs'][-1])
+
+
+def load_exif(config):
+    """Loads the exif csv, extracting it first if needed"""
+    import src.extractExif as extractExif
+    aux_folder = get_aux_folder(config)
+    if not os.path.isfile(aux_folder + "exif.csv") or config.getboolean('project', 'force_regenerate'):
+        extract_exif(config)
+    return extractExif.load_exif_data(aux_folder, config.getfloat('project', 'timezone_hour_diff'),
+                                      autofix=config.getboolean('project', 'autofix'))
+
+
+def load_data(config):
+    """Loads the exif data and the data used to draw the trajectory, extracting them first if needed"""
+    import src.extractExif as extractExif
+    import src.extractGoogleLocationHistory as extractGoogleLocation
+    dict_exif = load_exif(config)
+    if config.getboolean('project', 'use_location_history'):
+        aux_folder = get_aux_folder(config)
+        if not os.path.isfile(aux_folder + "location_history.csv") or \
+                config.getboolean('project', 'force_regenerate'):
+            extract_history(config, dict_exif)
+        dict_loc_history = extractGoogleLocation.load_location_history_data(aux_folder)
+        interval_s = config.getfloat('project', 'resample_interval_s')
+        distance_m = config.getfloat('project', 'resample_distance_m')
+        if interval_s > 0 or distance_m > 0:
+            import src.track as track
+            n_samples = len(dict_loc_history)
+            dict_loc_history = track.resample(dict_loc_history, interval_s, distance_m,
+                                              track.get_anchor_timestamps_ms(dict_exif))
+            print("Location history resampled from %d to %d samples" % (n_samples, len(dict_loc_history)))
+    else:
+        dict_loc_history = extractExif.exif_data_to_loc_hist(dict_exif)
+    return dict_exif, dict_loc_history
+
+
+def get_preset_params(config, preset_name):
+    """Settings passed to a preset that change its images"""
+    params = {}
+    if PRESETS[preset_name][2]:
+        params['n_tween'] = config.getint('render', 'n_tween')
+        if preset_name in EXPANDING_PRESETS:
+            params['camera_plan'] = config.getboolean('render', 'camera_plan')
+    return params
+
+
+def set_map_memory(config):
+    """Shares a memory budget and a mosaic cache between the map presets if their sizes are set"""
+    import src.mapplot as mapplot
+    if config.getfloat('render', 'memory_budget_mb'):
+        import src.memoryBudget as memoryBudget
+        mapplot.MapPlot.memory_budget = memoryBudget.MemoryBudget(config.getfloat('render', 'memory_budget_mb'))
+    if config.getfloat('render', 'mosaic_cache_mb'):
+        import src.mosaicCache as mosaicCache
+        mapplot.MapPlot.mosaic_cache = mosaicCache.MosaicCache(config.getfloat('render', 'mosaic_cache_mb'),
+                                                               mapplot.MapPlot.memory_budget)
+
+
+def get_vector_basemap_bbox(config):
+    """Returns the (lat_min, lon_min, lat_max, lon_max) box the extract is cut to, or None to read all of it"""
+    text = config['render']['vector_basemap_bbox']
+    if not text:
+        return None
+    list_values = [float(v) for v in text.replace(',', ' ').split()]
+    if len(list_values) != 4 or list_values[0] >= list_values[2] or list_values[1] >= list_values[3]:
+        raise ValueError("vector_basemap_bbox must be 'lat_min lon_min lat_max lon_max', got '%s'" % text)
+    return tuple(list_values)
+
+
+def set_vector_basemap(config):
+    """Draws the maps from a local OSM extract if one is set, instead of downloading the tiles. The extract is
+    converted once into the auxiliar folder. Returns the tile source or None"""
+    if not config['render']['vector_basemap']:
+        return None
+    import src.mapplot as mapplot
+    import src.vectorBasemap as vectorBasemap
+    helpers.ensure_directory(get_aux_folder(config))
+    features = vectorBasemap.load_features(config['render']['vector_basemap'], get_aux_folder(config) + "basemap.npz",
+                                           get_vector_basemap_bbox(config))
+    mapplot.MapPlot.default_tile_source = vectorBasemap.VectorTileSource(features)
+    return mapplot.MapPlot.default_tile_source
+
+
+def get_tile_pool_path(config):
+    """File of the decoded tiles shared by the shards. Stored in the auxiliar folder by default"""
+    return config['render']['tile_pool_path'] or get_aux_folder(config) + "tiles.pool"
+
+
+def get_tile_source_name(config):
+    """Name of where the tiles come from, the tile server or the local extract, stored in the tile pool"""
+    import src.mapplot as mapplot
+    if config['render']['vector_basemap']:
+        return "vector:" + os.path.abspath(config['render']['vector_basemap'])
+    return mapplot.MapPlot.tileserver
+
+
+def set_tile_pool(config):
+    """Takes the maps from the tile pool if it exists, see command_tile_pool. Maps with tiles that are not in it are
+    taken from the previous tile source or downloaded. Returns the tile source or None"""
+    import src.mapplot as mapplot
+    import src.tilePool as tilePool
+    pool_source = tilePool.open_pool_source(get_tile_pool_path(config), get_tile_source_name(config),
+                                            mapplot.MapPlot.default_tile_source, mapplot.MapPlot.download_delay_s)
+    if pool_source is not None:
+        mapplot.MapPlot.default_tile_source = pool_source
+    return pool_source
+
+
+def print_map_memory_stats():
+    """Prints the counters of the mosaic cache and the memory budget, if they were used"""
+    import src.mapplot as mapplot
+    if mapplot.MapPlot.mosaic_cache:
+        mapplot.MapPlot.mosaic_cache.print_stats()
+    if mapplot.MapPlot.memory_budget:
+        mapplot.MapPlot.memory_budget.print_stats()
+
+
+def get_manifest_path(config, args):
+    """Job manifest of the shard commands. Stored in the auxiliar folder by default"""
+    return args.manifest if args.manifest else get_aux_folder(config) + "shards.json"
+
+
+def get_shards_folder(config, args):
+    """Folder with the output folder of each shard"""
+    return args.shards_folder if args.shards_folder else config['project']['name'] + "/shards/"
+
+
+def command_extract_exif(config, args):
+    """extract-exif: always extracts the exif data again"""
+    extract_exif(config)
+
+
+def command_extract_history(config, args):
+    """extract-history: always extracts the location history again"""
+    extract_history(config, load_exif(config))
+
+
+def command_plan(config, args):
+    """plan: prints the maps of the map presets without downloading them"""
+    import src.mapplotAnimationPresets as mapplotAnimationPresets
+    dict_exif, dict_loc_history = load_data(config)
+    for preset_name in args.presets or [p for p in PRESETS if PRESETS[p][2]]:
+        fcn_name = PRESETS[preset_name][1]
+        mapplotAnimationPresets.plan_preset_maps(
+            fcn_name, dict_exif, dict_loc_history, config.getint('render', 'img_start'),
+            config.getint('render', 'img_end'),
+            camera_plan=preset_name in EXPANDING_PRESETS and config.getboolean('render', 'camera_plan'))
+
+
+def command_render(config, args):
+    """render: renders the presets in the given order, same outputs as mainScript.py"""
+    import src.renderMetrics as renderMetrics
+    dict_exif, dict_loc_history = load_data(config)
+    project_name = config['project']['name']
+    render = config['render']
+    metrics_folder = project_name + "/metrics/"
+    if render.getboolean('metrics'):
+        helpers.ensure_directory(metrics_folder)
+
+    set_map_memory(config)
+    vector_source = set_vector_basemap(config)
+
+    list_presets = list(PRESETS) if 'all' in args.presets else args.presets
+    for preset_name in list_presets:
+        module_name, fcn_name, needs_location, subfolder = PRESETS[preset_name]
+        preset_fcn = getattr(importlib.import_module(module_name), fcn_name)
+
+        kwargs = get_preset_params(config, preset_name)
+        metrics = None
+        if render.getboolean('metrics'):
+            metrics = renderMetrics.RenderMetrics(metrics_folder + preset_name + ".jsonl", name=preset_name)
+            kwargs['metrics'] = metrics
+        # The metrics file is closed when the preset ends, also if it fails
+        with metrics or contextlib.nullcontext():
+            if needs_location:
+                kwargs['look_ahead'] = render.getint('look_ahead')
+                preset_fcn(dict_exif, dict_loc_history, render.getint('img_start'), render.getint('img_end'),
+                           render.getint('img_start_middle'), output_folder=project_name + "/" + subfolder, **kwargs)
+            else:
+                preset_fcn(dict_exif, render.getint('img_start'), render.getint('img_end'),
+                           render.getint('img_start_middle'), output_folder=project_name + "/" + subfolder, **kwargs)
+    print_map_memory_stats()
+    if vector_source:
+        vector_source.print_stats()
+    print("PLOTTING ENDED -")
+
+
+def command_draft(config, args):
+    """draft: renders a subset of the images at low dpi without downloading maps, and a contact sheet per preset"""
+    import src.draftRender as draftRender
+    dict_exif, dict_loc_history = load_data(config)
+    draft = config['draft']
+    set_map_memory(config)
+    vector_source = set_vector_basemap(config)
+
+    list_idx = draftRender.get_draft_indices(dict_exif, config.getint('render', 'img_start'),
+                                             config.getint('render', 'img_end'), draft.getint('step'),
+                                             draft.getfloat('interval_s'), draft.getint('max_frames'))
+    print("Draft of %d images" % len(list_idx))
+    # Extra presets are only drafted when asked for
+    list_presets = args.presets or [p for p in PRESETS if PRESETS[p][2]]
+    if 'all' in list_presets:
+        list_presets = list(PRESETS)
+    with draftRender.draft_settings(draft.getint('dpi'), draft['tile_folder'] or None, vector_source) as tile_source:
+        for preset_name in list_presets:
+            module_name, fcn_name, needs_location, subfolder = PRESETS[preset_name]
+            preset_fcn = getattr(importlib.import_module(module_name), fcn_name)
+            kwargs = get_preset_params(config, preset_name)
+            kwargs.pop('n_tween', None)
+            output_folder = config['project']['name'] + "/draft/" + subfolder
+            helpers.ensure_directory(output_folder)
+            sheet_path = draftRender.render_draft(preset_fcn, dict_exif, dict_loc_history if needs_location else None,
+                                                  list_idx, output_folder, **kwargs)
+            print("Contact sheet:", sheet_path)
+        tile_source.print_stats()
+
+
+def command_dashboard(config, args):
+    """dashboard: renders the map preset and the extra panels of the [dashboard] layout into a single sequence"""
+    import matplotlib
+    import src.mapplot as mapplot
+    import src.compositor as compositor
+    import src.renderMetrics as renderMetrics
+    dashboard = config['dashboard']
+    render = config['render']
+    preset_name = dashboard['map_preset']
+    try:
+        if preset_name not in PRESETS or not PRESETS[preset_name][2]:
+            raise ValueError("map_preset is not a map preset: " + preset_name)
+        dict_layout = {name: compositor.parse_region(dashboard[name])
+                       for name in ['map'] + list(compositor.PANELS) if dashboard[name]}
+        if 'map' not in dict_layout:
+            raise ValueError("the layout has no map panel")
+    except ValueError as e:
+        print("ERROR: [dashboard]", e, file=sys.stderr)
+        return 2
+
+    dict_exif, dict_loc_history = load_data(config)
+    project_name = config['project']['name']
+    set_map_memory(config)
+    vector_source = set_vector_basemap(config)
+
+    kwargs = get_preset_params(config, preset_name)
+    kwargs['look_ahead'] = render.getint('look_ahead')
+    metrics = None
+    if render.getboolean('metrics'):
+        helpers.ensure_directory(project_name + "/metrics/")
+        metrics = renderMetrics.RenderMetrics(project_name + "/metrics/dashboard.jsonl", name="dashboard")
+        kwargs['metrics'] = metrics
+    obj_compositor = compositor.DashboardCompositor(
+        dict_layout, (dashboard.getint('width'), dashboard.getint('height')), dict_exif, render.getint('img_start'),
+        render.getint('img_end'), dashboard['background'])
+
+    module_name, fcn_name, _, _ = PRESETS[preset_name]
+    preset_fcn = getattr(importlib.import_module(module_name), fcn_name)
+    mapplot.MapPlot.frame_compositor = obj_compositor
+    try:
+        # Maps are rendered at the size of their panel
+        with metrics or contextlib.nullcontext(), matplotlib.rc_context({'figure.dpi': obj_compositor.get_map_dpi()}):
+            preset_fcn(dict_exif, dict_loc_history, render.getint('img_start'), render.getint('img_end'),
+                       render.getint('img_start_middle'), output_folder=project_name + "/dashboard/", **kwargs)
+    finally:
+        mapplot.MapPlot.frame_compositor = None
+    obj_compositor.print_stats()
+    print_map_memory_stats()
+    if vector_source:
+        vector_source.print_stats()
+    print("PLOTTING ENDED -")
+
+
+def command_shard_plan(config, args):
+    """shard-plan: writes the job manifest that splits the render of the presets in shards"""
+    import src.shardRender as shardRender
+    dict_exif, dict_loc_history = load_data(config)
+    list_names = list(PRESETS) if not args.presets or 'all' in args.presets else args.presets
+    list_presets = [{'name': preset_name, 'module': PRESETS[preset_name][0], 'function': PRESETS[preset_name][1],
+                     'needs_location': PRESETS[preset_name][2], 'subfolder': PRESETS[preset_name][3],
+                     'params': get_preset_params(config, preset_name)} for preset_name in list_names]
+    shardRender.plan_shards(get_manifest_path(config, args), dict_exif, dict_loc_history,
+                            config.getint('render', 'img_start'), config.getint('render', 'img_end'), args.n_shards,
+                            list_presets)
+
+
+def command_shard_run(config, args):
+    """shard-run: renders the images of one shard of the manifest"""
+    import src.shardRender as shardRender
+    set_map_memory(config)
+    set_vector_basemap(config)
+    pool_source = set_tile_pool(config)
+    metrics_folder = None
+    if config.getboolean('render', 'metrics'):
+        metrics_folder = config['project']['name'] + "/metrics/"
+    shardRender.run_shard(get_manifest_path(config, args), args.shard,
+                          shardRender.get_shard_folder(get_shards_folder(config, args), args.shard),
+                          config.getint('render', 'look_ahead'), metrics_folder)
+    print_map_memory_stats()
+    if pool_source:
+        pool_source.print_stats()
+
+
+def command_tile_pool(config, args):
+    """tile-pool: fetches and decodes once the tiles of the map presets of the manifest into the tile pool"""
+    import src.mapplot as mapplot
+    import src.shardRender as shardRender
+    import src.tilePool as tilePool
+    set_vector_basemap(config)
+    list_plans = shardRender.get_manifest_map_plans(get_manifest_path(config, args))
+    list_ranges, n_tiles = tilePool.get_plan_tiles(list_plans)
+    pool_path = get_tile_pool_path(config)
+    helpers.ensure_directory(os.path.dirname(os.path.abspath(pool_path)))
+    pool = tilePool.TilePool.create(pool_path, n_tiles, get_tile_source_name(config))
+    n_added = tilePool.fill_pool(pool, list_ranges, mapplot.MapPlot.tileserver, mapplot.MapPlot.download_delay_s,
+                                 mapplot.MapPlot.default_tile_source)
+    pool.close()
+    print("Tile pool %s: %d tiles of %d maps" % (pool_path, n_added, len(list_ranges)))
+
+
+def command_shard_merge(config, args):
+    """shard-merge: checks the frames of all shards and merges them into the project folder"""
+    import src.shardRender as shardRender
+    shardRender.merge_shards(get_manifest_path(config, args), get_shards_folder(config, args),
+                             config['project']['name'] + "/")
+
+
+def command_bench(config, args):
+    """bench: runs the benchmark with the [bench] settings"""
+    import src.benchmark as benchmark
+    bench = config['bench']
+    benchmark.run_benchmark(bench['work_folder'], bench['results_path'], bench.getint('n_photos'),
+                            bench.getint('n_locations'), bench.getint('n_days'), bench.getint('n_frames'))
+    if bench['baseline_path']:
+        benchmark.compare_results(bench['baseline_path'], bench['results_path'])
+    if bench.getint('memory_frames'):
+        list_failed = benchmark.run_memory_check(bench['work_folder'] + "memory/", bench['work_folder'] + "memory.json",
+                                                 bench.getint('memory_frames'))
+        if list_failed:
+            print("ERROR: Memory grows with the frame count on", ", ".join(list_failed), file=sys.stderr)
+            return 1
+
+
+def get_parser():
+    """Returns the argument parser of the command line"""
+    parser = argparse.ArgumentParser(
+        prog='imgseq-geo', description="Generates image sequences of maps with the locations of a set of photos")
+    parser.add_argument('-c', '--config', default='config.ini', help="ini file with the settings (default config.ini)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('extract-exif', help="extract the exif data of the photos into the auxiliar folder")
+    subparsers.add_parser('extract-history', help="extract the location history between the first and last photo")
+    parser_plan = subparsers.add_parser('plan', help="print the maps and tiles each map preset will download")
+    # No choices here, argparse rejects an empty list against them
+    parser_plan.add_argument('presets', nargs='*', metavar='preset',
+                             help="map presets to plan: %s (default all)" % ", ".join(
+                                 p for p in PRESETS if PRESETS[p][2]))
+    parser_render = subparsers.add_parser('render', help="render presets")
+    parser_render.add_argument('presets', nargs='+', choices=list(PRESETS) + ['all'], metavar='preset',
+                               help="presets to render: %s or all" % ", ".join(PRESETS))
+    subparsers.add_parser('bench', help="run the offline benchmark")
+    subparsers.add_parser('dashboard', help="render a map preset and the extra presets into one sequence")
+    parser_draft = subparsers.add_parser('draft', help="quick low resolution preview of presets and contact sheets")
+    parser_draft.add_argument('presets', nargs='*', metavar='preset',
+                              help="presets to draft: %s or all (default the map presets)" % ", ".join(PRESETS))
+
+    parser_shard_plan = subparsers.add_parser('shard-plan', help="write a job manifest to render in shards")
+    parser_shard_plan.add_argument('n_shards', type=int, help="number of shards")
+    parser_shard_plan.add_argument('presets', nargs='*', metavar='preset',
+                                   help="presets to render: %s (default all)" % ", ".join(PRESETS))
+    parser_shard_run = subparsers.add_parser('shard-run', help="render one shard of the job manifest")
+    parser_shard_run.add_argument('shard', type=int, help="index of the shard, from 0")
+    parser_shard_merge = subparsers.add_parser('shard-merge', help="check and merge the frames of all shards")
+    parser_tile_pool = subparsers.add_parser('tile-pool', help="decode the tiles of the shards once, to share them")
+    for parser_shard in (parser_shard_plan, parser_shard_run, parser_shard_merge, parser_tile_pool):
+        parser_shard.add_argument('-m', '--manifest', help="job manifest (default <name>/auxiliar/shards.json)")
+    for parser_shard in (parser_shard_run, parser_shard_merge):
+        parser_shard.add_argument('--shards-folder', help="folder with a subfolder per shard (default <name>/shards/)")
+    return parser
+
+
+COMMANDS = {
+    'extract-exif': command_extract_exif,
+    'extract-history': command_extract_history,
+    'plan': command_plan,
+    'render': command_render,
+    'bench': command_bench,
+    'draft': command_draft,
+    'dashboard': command_dashboard,
+    'shard-plan': command_shard_plan,
+    'shard-run': command_shard_run,
+    'shard-merge': command_shard_merge,
+    'tile-pool': command_tile_pool,
+}
+
+
+def main(argv=None):
+    """Entry point of the imgseq-geo command"""
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'plan':
+        for preset_name in args.presets:
+            if preset_name not in PRESETS or not PRESETS[preset_name][2]:
+                parser.error("not a map preset: " + preset_name)
+    if args.command in ('shard-plan', 'draft'):
+        for preset_name in args.presets:
+            if preset_name not in PRESETS and preset_name != 'all':
+                parser.error("not a preset: " + preset_name)
+    # The benchmark does not need a project, its settings have defaults
+    config_path = args.config if args.command != 'bench' or os.path.isfile(args.config) else None
+    try:
+        config = load_config(config_path)
+    except FileNotFoundError as e:
+        print("ERROR:", e, file=sys.stderr)
+        return 2
+    return COMMANDS[args.command](config, args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
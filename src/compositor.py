@@ -0,0 +1,169 @@
+import numpy as np
+import matplotlib.colors
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+import src.extraAnimationPresets as extraAnimationPresets
+
+
+def get_clock_content(data_exif, idx_image, img_start, img_end, idx_animation):
+    """Local time of the image, to the minute as the clock shows it"""
+    return data_exif['timestampMs_localtime'][idx_image].replace(second=0, microsecond=0)
+
+
+def get_timeline_content(data_exif, idx_image, img_start, img_end, idx_animation):
+    """Marks of the images of the day"""
+    return tuple(extraAnimationPresets.get_timeline_day(data_exif, idx_image, img_start))
+
+
+def get_frame_count_content(data_exif, idx_image, img_start, img_end, idx_animation):
+    """Frame number, counted in images as the frame_count preset"""
+    return idx_animation, img_end - img_start
+
+
+# Panels of the extra presets. Name: (figure size, static drawing, frame content, drawing of the content)
+PANELS = {
+    'clocks': (extraAnimationPresets.CLOCK_SIZE_IN, extraAnimationPresets.draw_clock_static, get_clock_content,
+               extraAnimationPresets.draw_clock_time),
+    'timeline': (extraAnimationPresets.TIMELINE_SIZE_IN, extraAnimationPresets.draw_timeline_static,
+                 get_timeline_content, lambda ax, content: extraAnimationPresets.draw_timeline_day(ax, list(content))),
+    'frame_count': (extraAnimationPresets.FRAME_COUNT_SIZE_IN, extraAnimationPresets.draw_frame_count_static,
+                    get_frame_count_content, lambda ax, content: extraAnimationPresets.draw_frame_count(ax, *content)),
+}
+
+
+def parse_region(text):
+    """Returns the (x, y, width, height) in pixels of a panel from a 'x y width height' string"""
+    list_values = [int(v) for v in text.replace(',', ' ').split()]
+    if len(list_values) != 4 or list_values[2] <= 0 or list_values[3] <= 0:
+        raise ValueError("Panel region must be 'x y width height', got '%s'" % text)
+    return tuple(list_values)
+
+
+def fit_image(rgba, size_px):
+    """Scales an RGBA array to fit in (width, height) keeping its aspect. Not scaled if it already fits exactly"""
+    height, width = rgba.shape[:2]
+    scale = min(size_px[0] / float(width), size_px[1] / float(height))
+    if abs(scale - 1) < 1e-3 and width <= size_px[0] and height <= size_px[1]:
+        return rgba
+    new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return np.asarray(Image.fromarray(rgba).resize(new_size, Image.LANCZOS))
+
+
+class ExtraPanel:
+    """
+    Panel of an extra preset drawn in its own figure, at the dpi that fits its region. The static artists are drawn
+    once and cached as the background, each frame only draws the artists of its content over it. The pixels are
+    reused while the content does not change, e.g. the clock within the same minute or the tween frames of an image
+    """
+
+    def __init__(self, size_in, fcn_static, fcn_draw, region, facecolor):
+        """
+        :param fcn_static: Function (ax) that draws the artists shared by all frames
+        :param fcn_draw: Function (ax, content) that draws the content of a frame and returns its artists
+        """
+        self.fcn_draw = fcn_draw
+        self.region = region
+        # Not a pyplot figure, the presets close all of those after each frame
+        self.fig = Figure(figsize=size_in, dpi=min(region[2] / size_in[0], region[3] / size_in[1]),
+                          facecolor=facecolor)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(111)
+        fcn_static(self.ax)
+        self.background_ = None
+        self.content_ = None
+        self.rgba_ = None
+        self.stats_drawn = 0
+        self.stats_reused = 0
+
+    def get_image(self, content):
+        """Returns the RGBA array of the panel with a content"""
+        if self.rgba_ is not None and content == self.content_:
+            self.stats_reused += 1
+            return self.rgba_
+
+        canvas = self.fig.canvas
+        if self.background_ is None:
+            canvas.draw()
+            self.background_ = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            canvas.restore_region(self.background_)
+        list_artists = self.fcn_draw(self.ax, content)
+        for artist in sorted(list_artists, key=lambda a: a.get_zorder()):
+            self.ax.draw_artist(artist)
+        for artist in list_artists:
+            artist.remove()
+
+        self.rgba_ = fit_image(np.array(canvas.buffer_rgba()), self.region[2:])
+        self.content_ = content
+        self.stats_drawn += 1
+        return self.rgba_
+
+
+class DashboardCompositor:
+    """
+    Builds one frame per map frame with the map and the panels of the extra presets placed in a canvas as given by a
+    layout. Set it as MapPlot.frame_compositor while a map preset renders: every map frame saved is composed before
+    it is encoded, so the presets are rendered in a single pass into a single sequence
+    """
+
+    def __init__(self, dict_layout, canvas_px, data_exif, img_start, img_end=-1, background='#000000'):
+        """
+        :param dict_layout: Region (x, y, width, height) in pixels of each panel: 'map' and the names in PANELS
+        :param canvas_px: (width, height) of the frames
+        :param data_exif: Exif data of the map preset. Its images give the content of the extra panels
+        :param img_start: img_start of the map preset
+        :param img_end: img_end of the map preset
+        """
+        if img_end < 0:
+            img_end = len(data_exif['timestampMs'])
+        self.dict_layout = dict_layout
+        self.data_exif = data_exif
+        self.img_start = img_start
+        self.img_end = img_end
+
+        for name, (x, y, width, height) in dict_layout.items():
+            if x < 0 or y < 0 or x + width > canvas_px[0] or y + height > canvas_px[1]:
+                raise ValueError("Panel %s does not fit in the %dx%d canvas" % (name, canvas_px[0], canvas_px[1]))
+
+        facecolor = matplotlib.colors.to_rgba(background)
+        self.background_ = np.empty((canvas_px[1], canvas_px[0], 4), dtype=np.uint8)
+        self.background_[:] = np.round(np.array(facecolor) * 255).astype(np.uint8)
+        self.dict_panels = {}
+        for name, region in dict_layout.items():
+            if name in PANELS:
+                size_in, fcn_static, _, fcn_draw = PANELS[name]
+                self.dict_panels[name] = ExtraPanel(size_in, fcn_static, fcn_draw, region, facecolor)
+
+    def get_map_dpi(self, figsize_in=(9, 9)):
+        """dpi of the map figures that fit the map region without scaling"""
+        region = self.dict_layout['map']
+        return min(region[2] / figsize_in[0], region[3] / figsize_in[1])
+
+    def __paste(self, canvas, region, rgba):
+        """Copies an image centered in its region, scaling it if it does not fit"""
+        rgba = fit_image(rgba, region[2:])
+        height, width = rgba.shape[:2]
+        x = region[0] + (region[2] - width) // 2
+        y = region[1] + (region[3] - height) // 2
+        canvas[y:y + height, x:x + width] = rgba
+
+    def compose(self, rgba_map, idx_frame, idx_image):
+        """Returns the frame with the map and the panels
+        :param idx_frame: Frame number, as the presets name the frames
+        :param idx_image: Index of the image of the frame in data_exif. Tween frames give the image they start from
+        """
+        idx_animation = idx_image - self.img_start + 1
+
+        canvas = self.background_.copy()
+        if 'map' in self.dict_layout:
+            self.__paste(canvas, self.dict_layout['map'], rgba_map)
+        for name, panel in self.dict_panels.items():
+            content = PANELS[name][2](self.data_exif, idx_image, self.img_start, self.img_end, idx_animation)
+            self.__paste(canvas, self.dict_layout[name], panel.get_image(content))
+        return canvas
+
+    def print_stats(self):
+        """Prints how many panel images were drawn and reused in the console"""
+        for name, panel in self.dict_panels.items():
+            print("Panel %s: %d drawn, %d reused" % (name, panel.stats_drawn, panel.stats_reused))
@@ -0,0 +1,163 @@
+import os
+import math
+import contextlib
+import numpy as np
+import matplotlib
+import smopy
+from PIL import Image
+from PIL import ImageDraw
+import src.mapplot as mapplot
+
+# Draft frames are small: at 30 dpi a 9 inch map is 270 px and its zoom is planned for that size
+DRAFT_DPI = 30
+DRAFT_MAX_FRAMES = 100
+BACKGROUND_COLOR = (224, 224, 224)  # Tiles that are neither cached nor local
+
+
+class OfflineTileSource:
+    """
+    Tile source that never downloads. Mosaics are taken from the mosaic cache when it has them, otherwise tiles are
+    read from a local folder and the missing ones are left blank. Used by the drafts
+    """
+
+    def __init__(self, tile_folder=None, mosaic_cache=None, background_color=BACKGROUND_COLOR):
+        """
+        :param tile_folder: Folder with tiles as {z}/{x}/{y}.png, e.g. saved from a tile server. None to not use it
+        :param mosaic_cache: MosaicCache searched before the tiles. Mosaics are not added to it
+        """
+        self.tile_folder = tile_folder
+        self.mosaic_cache = mosaic_cache
+        self.background_color = background_color
+        self.stats_maps_from_cache = 0
+        self.stats_local_tiles = 0
+        self.stats_blank_tiles = 0
+
+    def get_tile(self, x, y, z, tilesize):
+        """Returns the PIL tile from the local folder, or None if it does not have it"""
+        if not self.tile_folder:
+            return None
+        path = os.path.join(self.tile_folder, str(z), str(x), "%d.png" % y)
+        if not os.path.isfile(path):
+            return None
+        tile = Image.open(path).convert('RGB')
+        if tile.size != (tilesize, tilesize):
+            tile = tile.resize((tilesize, tilesize))
+        return tile
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Returns the PIL mosaic of a tile range. Same arguments as smopy.fetch_map"""
+        if self.mosaic_cache is not None:
+            img = self.mosaic_cache.find(box_tile, z, tilesize)
+            if img is not None:
+                self.stats_maps_from_cache += 1
+                return img
+
+        x0, y0, x1, y1 = smopy.correct_box(box_tile, z)
+        img = Image.new('RGB', ((x1 - x0 + 1) * tilesize, (y1 - y0 + 1) * tilesize), self.background_color)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                tile = self.get_tile(x, y, z, tilesize)
+                if tile is None:
+                    self.stats_blank_tiles += 1
+                else:
+                    img.paste(tile, ((x - x0) * tilesize, (y - y0) * tilesize))
+                    self.stats_local_tiles += 1
+        return img
+
+    def print_stats(self):
+        """Prints where the maps came from in the console"""
+        print("Draft maps: %d from the mosaic cache, %d local tiles, %d blank tiles" % (
+            self.stats_maps_from_cache, self.stats_local_tiles, self.stats_blank_tiles))
+
+
+def get_draft_indices(data_exif, img_start, img_end=-1, step=0, interval_s=0, max_frames=DRAFT_MAX_FRAMES):
+    """
+    Returns the indexes of the images rendered by a draft, from img_start to img_end
+    :param step: Render every step images
+    :param interval_s: Render the first image of every interval_s seconds. Used instead of step if set
+    :param max_frames: Used if step and interval_s are 0, the step that renders at most max_frames images
+    """
+    if img_end < 0:
+        img_end = len(data_exif)
+    if interval_s > 0:
+        time_bin = data_exif.timestamp_ms[img_start:img_end] // int(interval_s * 1000)
+        if len(time_bin) == 0:
+            return np.arange(img_start, img_start)
+        return img_start + np.flatnonzero(np.diff(time_bin, prepend=time_bin[0] - 1))
+    if step <= 0:
+        step = max(1, int(math.ceil((img_end - img_start) / float(max_frames))))
+    return np.arange(img_start, img_end, step)
+
+
+@contextlib.contextmanager
+def draft_settings(dpi=DRAFT_DPI, tile_folder=None, tile_source=None):
+    """
+    While active, figures are created at dpi and maps come from an OfflineTileSource, which is returned. The mosaic
+    cache is only searched, so blank mosaics do not end in it. The previous settings are restored on exit
+    :param tile_source: Offline tile source used instead, e.g. vectorBasemap.VectorTileSource
+    """
+    if tile_source is None:
+        tile_source = OfflineTileSource(tile_folder, mapplot.MapPlot.mosaic_cache)
+    default_tile_source, mosaic_cache = mapplot.MapPlot.default_tile_source, mapplot.MapPlot.mosaic_cache
+    mapplot.MapPlot.default_tile_source = tile_source
+    mapplot.MapPlot.mosaic_cache = None
+    try:
+        with matplotlib.rc_context({'figure.dpi': dpi}):
+            yield tile_source
+    finally:
+        mapplot.MapPlot.default_tile_source = default_tile_source
+        mapplot.MapPlot.mosaic_cache = mosaic_cache
+
+
+def make_contact_sheet(list_paths, list_labels, sheet_path, thumb_width=240):
+    """
+    Saves the frames as thumbnails in a grid, each one with its label below. The number of columns keeps the sheet
+    close to square. Missing frames are left empty
+    """
+    list_thumbs = []
+    for path in list_paths:
+        thumb = None
+        if os.path.isfile(path):
+            thumb = Image.open(path).convert('RGB')
+            thumb.thumbnail((thumb_width, thumb_width * 10))
+        list_thumbs.append(thumb)
+    list_sizes = [thumb.size for thumb in list_thumbs if thumb is not None]
+    if not list_sizes:
+        return None
+
+    label_h = 14
+    cell_w = max(size[0] for size in list_sizes) + 4
+    cell_h = max(size[1] for size in list_sizes) + label_h + 4
+    n_columns = max(1, int(math.ceil(math.sqrt(len(list_thumbs) * cell_h / float(cell_w)))))
+    n_rows = int(math.ceil(len(list_thumbs) / float(n_columns)))
+
+    sheet = Image.new('RGB', (n_columns * cell_w, n_rows * cell_h), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    for i, (thumb, label) in enumerate(zip(list_thumbs, list_labels)):
+        x, y = (i % n_columns) * cell_w + 2, (i // n_columns) * cell_h + 2
+        if thumb is not None:
+            sheet.paste(thumb, (x, y))
+        draw.text((x, y + cell_h - label_h - 3), label, fill=(0, 0, 0))
+    sheet.save(sheet_path)
+    return sheet_path
+
+
+def render_draft(preset_fcn, data_exif, data_precise, list_idx, output_folder, **kwargs):
+    """
+    Renders a preset on a subset of the images and saves a contact sheet of them in output_folder. Tween frames and
+    background downloads are not used, use draft_settings for the resolution and the maps
+    :param data_precise: Precise data of the map presets. None for the presets that only use data_exif
+    :param list_idx: Indexes of the images in data_exif, e.g. from get_draft_indices
+    :param kwargs: Other arguments of the preset, e.g. camera_plan
+    :return: Path of the contact sheet
+    """
+    data_draft = data_exif.select(np.asarray(list_idx, dtype=np.int64))
+    if data_precise is not None:
+        preset_fcn(data_draft, data_precise, 0, len(data_draft), 0, output_folder=output_folder, **kwargs)
+    else:
+        preset_fcn(data_draft, 0, len(data_draft), 0, output_folder=output_folder, **kwargs)
+
+    list_paths = [output_folder + "%d.png" % (i + 1) for i in range(len(data_draft))]
+    list_filenames = data_draft.filename if data_draft.filename is not None else [""] * len(data_draft)
+    list_labels = ["%d %s" % (idx + 1, filename) for idx, filename in zip(list_idx, list_filenames)]
+    return make_contact_sheet(list_paths, list_labels, output_folder + "contact_sheet.png")
@@ -0,0 +1,159 @@
+import struct
+from fractions import Fraction
+
+# Exif tag ids read by the fast path
+TAG_DATETIME = 0x0132
+TAG_GPS_IFD = 0x8825
+TAG_GPS_LATITUDE_REF = 1
+TAG_GPS_LATITUDE = 2
+TAG_GPS_LONGITUDE_REF = 3
+TAG_GPS_LONGITUDE = 4
+# Names exifread gives to those tags
+TAG_NAMES_GPS = {TAG_GPS_LATITUDE_REF: 'GPS GPSLatitudeRef', TAG_GPS_LATITUDE: 'GPS GPSLatitude',
+                 TAG_GPS_LONGITUDE_REF: 'GPS GPSLongitudeRef', TAG_GPS_LONGITUDE: 'GPS GPSLongitude'}
+
+TYPE_ASCII = 2
+TYPE_LONG = 4
+TYPE_RATIONAL = 5
+
+JPEG_SOI = b'\xff\xd8'
+MARKER_APP1 = 0xE1
+MARKER_SOS = 0xDA
+EXIF_HEADER = b'Exif\x00\x00'
+# Exif must be in the first segments of the file. Files where it is not fall back to exifread
+MAX_PREFIX_BYTES = 128 * 1024
+
+
+class ExifTag:
+    """Value of a tag, with the same values attribute as the exifread tags"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __repr__(self):
+        return repr(self.values)
+
+
+class ExifLayoutError(Exception):
+    """The file does not have the layout the fast path reads"""
+    pass
+
+
+def read_app1_exif(f, max_bytes=MAX_PREFIX_BYTES):
+    """
+    Returns the TIFF data of the Exif APP1 segment of a jpeg file, or None if there is not one before the image data.
+    Only the segment headers and the APP1 segment are read, the other segments are skipped
+    :param f: File opened in binary mode, at its start
+    :param max_bytes: The Exif segment must end before this offset
+    """
+    if f.read(2) != JPEG_SOI:
+        raise ExifLayoutError("Not a jpeg")
+    offset = 2
+    while offset + 4 <= max_bytes:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            raise ExifLayoutError("Bad jpeg segment at %d" % offset)
+        marker = header[1]
+        if marker == 0xFF:
+            # Fill byte before the marker
+            f.seek(offset + 1)
+            offset += 1
+            continue
+        if marker == MARKER_SOS:
+            return None
+        length = struct.unpack('>H', header[2:])[0]
+        if length < 2 or offset + 2 + length > max_bytes:
+            raise ExifLayoutError("Segment at %d out of the prefix" % offset)
+        if marker == MARKER_APP1:
+            payload = f.read(length - 2)
+            if payload.startswith(EXIF_HEADER):
+                return payload[len(EXIF_HEADER):]
+        else:
+            f.seek(offset + 2 + length)
+        offset += 2 + length
+    raise ExifLayoutError("No image data in the first %d bytes" % max_bytes)
+
+
+class TiffReader:
+    """Reads IFD entries from the TIFF data of the Exif segment. Offsets are relative to the TIFF header"""
+
+    def __init__(self, data):
+        self.data = data
+        if data[:4] == b'II*\x00':
+            self.endian = '<'
+        elif data[:4] == b'MM\x00*':
+            self.endian = '>'
+        else:
+            raise ExifLayoutError("Bad TIFF header")
+
+    def unpack(self, fmt, offset):
+        """Unpacks fmt at offset, checking the bounds"""
+        size = struct.calcsize(self.endian + fmt)
+        if offset < 0 or offset + size > len(self.data):
+            raise ExifLayoutError("Offset %d out of the TIFF data" % offset)
+        return struct.unpack_from(self.endian + fmt, self.data, offset)
+
+    def get_ifd0_offset(self):
+        return self.unpack('I', 4)[0]
+
+    def read_ifd(self, offset, set_tags):
+        """Returns a dictionary tag id: (type, count, value offset) of the tags in set_tags found in the IFD"""
+        n_entries = self.unpack('H', offset)[0]
+        dict_entries = {}
+        for i in range(n_entries):
+            entry_offset = offset + 2 + i * 12
+            tag, field_type, count = self.unpack('HHI', entry_offset)
+            if tag in set_tags:
+                dict_entries[tag] = (field_type, count, entry_offset + 8)
+        return dict_entries
+
+    def get_value_offset(self, field_type, count, entry_value_offset):
+        """Values of up to 4 bytes are stored in the entry, larger ones at the offset it holds"""
+        size = {TYPE_ASCII: 1, TYPE_LONG: 4, TYPE_RATIONAL: 8}[field_type] * count
+        if size <= 4:
+            return entry_value_offset
+        return self.unpack('I', entry_value_offset)[0]
+
+    def read_value(self, entry):
+        """Value of an ASCII, LONG or RATIONAL entry. Same values exifread gives"""
+        field_type, count, entry_value_offset = entry
+        if field_type not in (TYPE_ASCII, TYPE_LONG, TYPE_RATIONAL):
+            raise ExifLayoutError("Unexpected tag type %d" % field_type)
+        offset = self.get_value_offset(field_type, count, entry_value_offset)
+        if field_type == TYPE_ASCII:
+            if offset < 0 or offset + count > len(self.data):
+                raise ExifLayoutError("Offset %d out of the TIFF data" % offset)
+            # Drop any garbage after a null, as exifread
+            return self.data[offset:offset + count].split(b'\x00', 1)[0].decode('utf-8', 'replace')
+        if field_type == TYPE_LONG:
+            return list(self.unpack('%dI' % count, offset))
+        values = self.unpack('%dI' % (2 * count), offset)
+        if 0 in values[1::2]:
+            raise ExifLayoutError("Rational with zero denominator")
+        return [Fraction(values[2 * i], values[2 * i + 1]) for i in range(count)]
+
+
+def read_exif_tags(f, max_bytes=MAX_PREFIX_BYTES):
+    """
+    Reads the DateTime of IFD0 and the GPS position from a jpeg, reading only the Exif segment.
+    Returns a dictionary with the same keys and values as exifread.process_file for those tags, or None if the file
+    does not have the expected layout, so exifread can be used instead
+    :param f: File opened in binary mode, at its start
+    """
+    try:
+        tiff_data = read_app1_exif(f, max_bytes)
+        if tiff_data is None:
+            return {}
+        reader = TiffReader(tiff_data)
+        exif_tags = {}
+        dict_ifd0 = reader.read_ifd(reader.get_ifd0_offset(), {TAG_DATETIME, TAG_GPS_IFD})
+        if TAG_DATETIME in dict_ifd0:
+            exif_tags['Image DateTime'] = ExifTag(reader.read_value(dict_ifd0[TAG_DATETIME]))
+        if TAG_GPS_IFD in dict_ifd0:
+            gps_ifd_offset = reader.read_value(dict_ifd0[TAG_GPS_IFD])[0]
+            dict_gps = reader.read_ifd(gps_ifd_offset, set(TAG_NAMES_GPS))
+            for tag, entry in dict_gps.items():
+                exif_tags[TAG_NAMES_GPS[tag]] = ExifTag(reader.read_value(entry))
+    except ExifLayoutError:
+        return None
+    return exif_tags
@@ -3,9 +3,110 @@ import math
 import matplotlib.pyplot as plt
 import src.mapplotAnimationHelpers as mapplotAnimationHelpers
 import src.helpers as helpers
+import src.renderMetrics as renderMetrics
+
+# Figure size of each extra preset. Fonts and lines are sized for them
+TIMELINE_SIZE_IN = (8, 1.5)
+CLOCK_SIZE_IN = (15, 5)
+FRAME_COUNT_SIZE_IN = (10, 2)
+
+
+def get_timeline_day(data_exif, idx_image, idx_limit):
+    """Returns the seconds since the local day start of the images of the day up to idx_image, from idx_image
+    backwards. Images before idx_limit are not included"""
+    list_secs = []
+    dt_local_day_start = data_exif['timestampMs_localtime'][idx_image].replace(hour=0, minute=0, second=0)
+    for idx_loop in range(idx_image, idx_limit - 1, -1):
+        dt_local = data_exif['timestampMs_localtime'][idx_loop]
+        if dt_local <= dt_local_day_start:
+            break
+        list_secs.append(dt_local.hour*3600 + dt_local.minute*60 + dt_local.second)
+    return list_secs
+
+
+def draw_timeline_static(ax):
+    """Draws the hour marks of the timeline, the same on every frame"""
+    list_ref_x = [0]
+    list_ref_y = [0.9]
+    for j in range(25):
+        list_ref_x.append(j*3600)
+        list_ref_y.append(0.9)
+
+    ax.scatter(list_ref_x, list_ref_y, 180, color='#0485d1', marker='|');
+    ax.scatter(list_ref_x[0], list_ref_y[0], 200, color='White', marker='|');
+    ax.scatter(list_ref_x[13], list_ref_y[13], 200, color='White', marker='|');
+    ax.scatter(list_ref_x[-1], list_ref_y[-1], 200, color='White', marker='|');
+
+    ax.text(list_ref_x[0], list_ref_y[0] - 0.6, "0", color='White', fontsize=18, horizontalalignment='center')
+    ax.text(list_ref_x[13], list_ref_y[13] - 0.6, "12", color='White', fontsize=18, horizontalalignment='center')
+    ax.text(list_ref_x[-1], list_ref_y[-1] - 0.6, "24", color='White', fontsize=18, horizontalalignment='center')
+
+    for i in range(3,24,3):
+        if i == 12:
+            continue
+        ax.text(list_ref_x[i+1], list_ref_y[i+1] - 0.6, "%d" % (i), color='#0485d1', fontsize=16, horizontalalignment='center')
+
+    ax.set_facecolor((0, 0 ,0))
+    # ax.axis("equal")
+    ax.axis([-3600, 86400.0+3600, 0, 2]);
+
+
+def draw_timeline_day(ax, list_secs):
+    """Draws the marks of the images of the day, the current one in red. Returns the artists"""
+    list_artists = [ax.scatter(list_secs, [1] * len(list_secs), 180, color='White', marker='|')]
+    # No images are left when the current one was taken at midnight
+    if list_secs:
+        list_artists.append(ax.scatter(list_secs[0], 1, 180, color='Red', marker='|'))
+    return list_artists
+
+
+def draw_clock_static(ax):
+    """Draws the clock face"""
+    th = [x * (math.pi/50) for x in range(0, 100)]
+    xunit = []
+    yunit = []
+    for i in range(len(th)):
+        xunit.append(math.cos(th[i]))
+        yunit.append(math.sin(th[i]))
+
+    ax.plot(xunit, yunit, lw=8, color='White');
+    ax.set_facecolor((0, 0 ,0))
+    ax.axis("equal")
+    ax.axis([-1.3, 5.5, -1.2, 1.2]);
+
+
+def draw_clock_time(ax, datetime_target):
+    """Draws the hands of the clock and the digital time and date. Returns the artists"""
+    agujaH_l = 0.5
+    agujaM_l = 0.85
+    hour = datetime_target.hour
+    minute = datetime_target.minute
 
+    agujaHx = [0, agujaH_l * math.cos(-(hour * math.pi / 6) + (math.pi / 2))]
+    agujaHy = [0, agujaH_l * math.sin(-(hour * math.pi / 6) + (math.pi / 2))]
+    agujaMx = [0, agujaM_l * math.cos(-(minute * math.pi / 30) + (math.pi / 2))]
+    agujaMy = [0, agujaM_l * math.sin(-(minute * math.pi / 30) + (math.pi / 2))]
 
-def timeline(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+    list_artists = ax.plot(agujaHx, agujaHy, lw=8, color='White') + ax.plot(agujaMx, agujaMy, lw=8, color='White')
+    list_artists.append(ax.text(1.3, 0.4, datetime_target.strftime("%H:%M"), color='White', fontsize=75))
+    # ax.text(1.2, -0.65, datetime_target.strftime("%d/%m"), color='White', fontsize=75)
+    list_artists.append(ax.text(3.4, 0.4, datetime_target.strftime("%d/%m"), color='White', fontsize=75))
+    return list_artists
+
+
+def draw_frame_count_static(ax):
+    """Draws the background of the frame counter"""
+    ax.set_facecolor((0, 0 ,0))
+
+
+def draw_frame_count(ax, idx_animation, n_images):
+    """Draws the frame number. Returns the artists"""
+    return [ax.text(1, 0.2, "%d/%d" % (idx_animation, n_images), color='White', fontsize=75,
+                    horizontalalignment='right')]
+
+
+def timeline(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/", metrics=None,
+             idx_stop=-1):
     """
     For each sample in data exif a plot is generated showing the local time of capture of all the images of the day up
     to the current sample timedate
@@ -15,84 +116,53 @@ def timeline(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="te
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
     """
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
 
     helpers.ensure_directory(output_folder)
     mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
 
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="timeline")
+
     time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
+    for i in range(idx_continue, idx_stop):
         time_start_it = time.perf_counter()
 
         # ---------- Set iteration values ----------
         idx_animation = i - img_start + 1
+        metrics.begin_frame(idx_animation)
+
+        with metrics.stage('alignment'):
+            list_secs = get_timeline_day(data_exif, i, img_start)
 
-        list_aux_x = []
-        list_aux_y = []
-        target_found = False
-        idx_limit = img_start
-        idx_loop = i
-        dt_local_day_start = data_exif['timestampMs_localtime'][i].replace(hour=0, minute=0, second=0)
-        while not target_found:
-            if idx_loop >= idx_limit:
-                if data_exif['timestampMs_localtime'][idx_loop] <= dt_local_day_start:
-                    target_found = True
-                else:
-                    secs_since_day_start = data_exif['timestampMs_localtime'][idx_loop].hour*3600 + \
-                                           data_exif['timestampMs_localtime'][idx_loop].minute*60 + \
-                                           data_exif['timestampMs_localtime'][idx_loop].second
-                    list_aux_x.append(secs_since_day_start)
-                    list_aux_y.append(1)
-            else:
-                # No more valid samples to analyze
-                target_found = True
-            idx_loop -= 1
-
-        list_ref_x = [0]
-        list_ref_y = [0.9]
-        for j in range(25):
-            list_ref_x.append(j*3600)
-            list_ref_y.append(0.9)
-
-        fig, ax = plt.subplots(nrows=1, ncols=1)
-        fig.set_size_inches(8, 1.5)
-
-        ax.scatter(list_ref_x, list_ref_y, 180, color='#0485d1', marker='|');
-        ax.scatter(list_ref_x[0], list_ref_y[0], 200, color='White', marker='|');
-        ax.scatter(list_ref_x[13], list_ref_y[13], 200, color='White', marker='|');
-        ax.scatter(list_ref_x[-1], list_ref_y[-1], 200, color='White', marker='|');
-        ax.scatter(list_aux_x, list_aux_y, 180, color='White', marker='|');
-        ax.scatter(list_aux_x[0], list_aux_y[0], 180, color='Red', marker='|');
-
-        ax.text(list_ref_x[0], list_ref_y[0] - 0.6, "0", color='White', fontsize=18, horizontalalignment='center')
-        ax.text(list_ref_x[13], list_ref_y[13] - 0.6, "12", color='White', fontsize=18, horizontalalignment='center')
-        ax.text(list_ref_x[-1], list_ref_y[-1] - 0.6, "24", color='White', fontsize=18, horizontalalignment='center')
-
-        for i in range(3,24,3):
-            if i == 12:
-                continue
-            ax.text(list_ref_x[i+1], list_ref_y[i+1] - 0.6, "%d" % (i), color='#0485d1', fontsize=16, horizontalalignment='center')
-
-
-
-        ax.set_facecolor((0, 0 ,0))
-        # ax.axis("equal")
-        ax.axis([-3600, 86400.0+3600, 0, 2]);
-
-        plt.savefig(output_folder + str(idx_animation) + ".png")
+        with metrics.stage('drawing'):
+            fig, ax = plt.subplots(nrows=1, ncols=1)
+            fig.set_size_inches(*TIMELINE_SIZE_IN)
+            draw_timeline_static(ax)
+            draw_timeline_day(ax, list_secs)
+
+        mapplotAnimationHelpers.save_figure(fig, output_folder + str(idx_animation) + ".png", metrics)
         # plt.show()
         fig.clf()
         plt.close('all')
 
         mapplotAnimationHelpers.print_console(
             idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][i])
+        metrics.end_frame()
+
+    metrics.print_summary()
 
 
-def clocks(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+def clocks(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/", metrics=None,
+           idx_stop=-1):
     """
     For each sample in data exif a plot is generated showing an analog and digital clock with the local time and date
     :param data_exif: Dictionary with exif data from the input images
@@ -101,66 +171,52 @@ def clocks(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
     """
     # Port from an older matlab script
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
 
     helpers.ensure_directory(output_folder)
     mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
 
-    th = [x * (math.pi/50) for x in range(0, 100)]
-    xunit = []
-    yunit = []
-    for i in range(len(th)):
-        xunit.append(math.cos(th[i]))
-        yunit.append(math.sin(th[i]))
-    agujaH_l = 0.5
-    agujaM_l = 0.85
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="clocks")
 
     time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
+    for i in range(idx_continue, idx_stop):
         time_start_it = time.perf_counter()
         # ---------- Set iteration values ----------
         idx_animation = i - img_start + 1
+        metrics.begin_frame(idx_animation)
         datetime_target = data_exif['timestampMs_localtime'][i]
 
-        hour = datetime_target.hour
-        minute = datetime_target.minute
-
-        agujaHx = [0, agujaH_l * math.cos(-(hour * math.pi / 6) + (math.pi / 2))]
-        agujaHy = [0, agujaH_l * math.sin(-(hour * math.pi / 6) + (math.pi / 2))]
-        agujaMx = [0, agujaM_l * math.cos(-(minute * math.pi / 30) + (math.pi / 2))]
-        agujaMy = [0, agujaM_l * math.sin(-(minute * math.pi / 30) + (math.pi / 2))]
-
+        with metrics.stage('drawing'):
+            fig, ax = plt.subplots(nrows=1, ncols=1)
+            # fig.set_size_inches(9, 5)
+            fig.set_size_inches(*CLOCK_SIZE_IN)
+            draw_clock_static(ax)
+            draw_clock_time(ax, datetime_target)
 
-        fig, ax = plt.subplots(nrows=1, ncols=1)
-        # fig.set_size_inches(9, 5)
-        fig.set_size_inches(15, 5)
-
-        ax.plot(xunit, yunit, lw=8, color='White');
-        ax.plot(agujaHx, agujaHy, lw=8, color='White');
-        ax.plot(agujaMx, agujaMy, lw=8, color='White');
-        ax.text(1.3, 0.4, datetime_target.strftime("%H:%M"), color='White', fontsize=75)
-        # ax.text(1.2, -0.65, datetime_target.strftime("%d/%m"), color='White', fontsize=75)
-        ax.text(3.4, 0.4, datetime_target.strftime("%d/%m"), color='White', fontsize=75)
-        ax.set_facecolor((0, 0 ,0))
-        ax.axis("equal")
-        ax.axis([-1.3, 5.5, -1.2, 1.2]);
-
-
-        plt.savefig(output_folder + str(idx_animation) + ".png")
+        mapplotAnimationHelpers.save_figure(fig, output_folder + str(idx_animation) + ".png", metrics)
         # plt.show()
         fig.clf()
         plt.close('all')
 
         mapplotAnimationHelpers.print_console(
             idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][i])
+        metrics.end_frame()
 
+    metrics.print_summary()
 
-def frame_count(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+
+def frame_count(data_exif, img_start, img_end=-1, idx_continue=0, output_folder="test_output/", metrics=None,
+                idx_stop=-1):
     """
     For each sample in data exif a plot is generated showing the frame number of the animation
     :param data_exif: Dictionary with exif data from the input images
@@ -169,36 +225,43 @@ def frame_count(data_exif, img_start, img_end=-1, idx_continue=0, output_folder=
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
     """
     # Port from an older matlab script
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
 
     helpers.ensure_directory(output_folder)
     mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
 
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="frame_count")
+
     time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
+    for i in range(idx_continue, idx_stop):
         time_start_it = time.perf_counter()
         # ---------- Set iteration values ----------
         idx_animation = i - img_start + 1
-        datetime_target = data_exif['timestampMs_localtime'][i]
-
-
-        fig, ax = plt.subplots(nrows=1, ncols=1)
-        fig.set_size_inches(10, 2)
+        metrics.begin_frame(idx_animation)
 
-        ax.text(1, 0.2, "%d/%d" % (idx_animation, img_end-img_start), color='White', fontsize=75,
-                horizontalalignment='right')
-        ax.set_facecolor((0, 0 ,0))
+        with metrics.stage('drawing'):
+            fig, ax = plt.subplots(nrows=1, ncols=1)
+            fig.set_size_inches(*FRAME_COUNT_SIZE_IN)
+            draw_frame_count_static(ax)
+            draw_frame_count(ax, idx_animation, img_end-img_start)
 
-
-        plt.savefig(output_folder + str(idx_animation) + ".png")
+        mapplotAnimationHelpers.save_figure(fig, output_folder + str(idx_animation) + ".png", metrics)
         # plt.show()
         fig.clf()
         plt.close('all')
 
         mapplotAnimationHelpers.print_console(
             idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][i])
+        metrics.end_frame()
+
+    metrics.print_summary()
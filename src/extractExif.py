@@ -1,8 +1,22 @@
 import os
 import csv
 from datetime import datetime
-from datetime import timedelta
-import exifread
+import numpy as np
+import src.track as track
+import src.exifReader as exifReader
+
+
+def get_ratio_value(ratio):
+    """Value of a rational from exifread or exifReader. exifread before 3.0 only has num and den"""
+    numerator = getattr(ratio, 'numerator', None)
+    if numerator is None:
+        return ratio.num / ratio.den
+    return numerator / ratio.denominator
+
+
+def get_dms_degrees(dms):
+    """Degrees from the degrees, minutes and seconds rationals of a GPS tag"""
+    return get_ratio_value(dms[0]) + get_ratio_value(dms[1]) / 60.0 + get_ratio_value(dms[2]) / 3600.0
 
 
 def extract_gps_exif(exif_tags):
@@ -17,11 +31,11 @@ def extract_gps_exif(exif_tags):
         gps_lon = exif_tags['GPS GPSLongitude'].values
         gps_lon_ref = exif_tags['GPS GPSLongitudeRef'].values
 
-        gps_lat_out = gps_lat[0].num + gps_lat[1].num / 60.0 + gps_lat[2].num / 3600.0
+        gps_lat_out = get_dms_degrees(gps_lat)
         if gps_lat_ref == 'S':
             gps_lat_out = -gps_lat_out
 
-        gps_lon_out = gps_lon[0].num + gps_lon[1].num / 60.0 + gps_lon[2].num / 3600.0
+        gps_lon_out = get_dms_degrees(gps_lon)
         if gps_lon_ref == 'W':
             gps_lon_out = -gps_lon_out
 
@@ -39,11 +53,23 @@ def extract_datetime_exif(exif_tags):
     return datetime_out
 
 
+def read_exif_tags(img_path):
+    """
+    Reads the exif tags of the image at img_path. Jpegs are read by exifReader, that only reads the Exif segment.
+    Other formats and layouts are read by exifread. Returns the tags and True if exifread was not needed
+    """
+    with open(img_path, 'rb') as f:
+        exif_tags = exifReader.read_exif_tags(f)
+        if exif_tags is not None:
+            return exif_tags, True
+        import exifread  # Only needed to extract, loading the csv does not need it
+        f.seek(0)
+        return exifread.process_file(f, details=False), False
+
+
 def extract_exif_data(img_path):
     """Extracts GPS and time data from the exif data of image at img_path"""
-    exif_tags = {}
-    with open(img_path, 'rb') as f:
-        exif_tags = exifread.process_file(f, details=False)
+    exif_tags, _ = read_exif_tags(img_path)
     gps_lat_out, gps_lon_out = extract_gps_exif(exif_tags)
     img_datetime = extract_datetime_exif(exif_tags)
 
@@ -52,9 +78,10 @@ def extract_exif_data(img_path):
 
 def extract_exif_folder(pics_folder, output_folder):
     """Extracts all relevant exif data from images in a folder and stores them in a csv at the output_folder"""
-    list_pics = os.listdir(pics_folder)
+    list_pics = sorted(os.listdir(pics_folder))
 
     count_no_gps = 0
+    count_exifread = 0
     list_gps_valid = []
     list_gps_lat = []
     list_gps_lon = []
@@ -66,7 +93,11 @@ def extract_exif_folder(pics_folder, output_folder):
         name_pic = list_pics[i]
         path_pic = pics_folder + '/' + name_pic
 
-        gps_lat, gps_lon, img_datetime = extract_exif_data(path_pic)
+        exif_tags, b_fast_read = read_exif_tags(path_pic)
+        if not b_fast_read:
+            count_exifread += 1
+        gps_lat, gps_lon = extract_gps_exif(exif_tags)
+        img_datetime = extract_datetime_exif(exif_tags)
 
         b_gps_valid = True
         if gps_lat > 90:
@@ -82,6 +113,7 @@ def extract_exif_folder(pics_folder, output_folder):
         list_filename.append(name_pic)
 
     print("Images with no gps data:", count_no_gps)
+    print("Images read with exifread:", count_exifread)
     # Spanish CSV format. For author debugging
     # with open(output_folder+"exif_es.csv", "w") as f_out:
     #     separator = ';'
@@ -114,18 +146,18 @@ def check_time_order(dict_exif_in, autofix):
     """Check if timestamps are ordered by looking for negative diferences between images"""
     b_error_detected = False
 
-    if len(dict_exif_in['timestampMs']) > 1:
-        for i in range(1, len(dict_exif_in['timestampMs'])):
-            date_diff = dict_exif_in['timestampMs'][i]-dict_exif_in['timestampMs'][i-1]
-            if date_diff.total_seconds() < 0:
-                if autofix:
-                    #Simple fix, set time to that of previous picture
-                    dict_exif_in['timestampMs'][i-1] = dict_exif_in['timestampMs'][i]
-                    dict_exif_in['timestampMs_localtime'][i-1] = dict_exif_in['timestampMs_localtime'][i]
-                else:
-                    print("File:", dict_exif_in['filename'][i - 1],
-                          "Exif time", dict_exif_in['timestampMs_localtime'][i-1])
-                    b_error_detected = True
+    timestamp_ms = dict_exif_in.timestamp_ms
+    idx_unordered = np.nonzero(timestamp_ms[1:] < timestamp_ms[:-1])[0] + 1
+    if len(idx_unordered) > 0:
+        if autofix:
+            #Simple fix, set time to that of previous picture
+            timestamp_ms[idx_unordered - 1] = timestamp_ms[idx_unordered]
+            dict_exif_in.is_sorted = bool(np.all(timestamp_ms[1:] >= timestamp_ms[:-1]))
+        else:
+            for i in idx_unordered:
+                print("File:", dict_exif_in['filename'][i - 1],
+                      "Exif time", dict_exif_in['timestampMs_localtime'][i-1])
+            b_error_detected = True
 
     if b_error_detected:
         print("\nERROR: Timestamps not chronologically ordered.")
@@ -137,36 +169,28 @@ def check_time_order(dict_exif_in, autofix):
 
 
 def load_exif_data(file_folder, timezone_diff_h, autofix):
-    """Load the extracted exif data from the csv stored in file_folder.
+    """Load the extracted exif data from the csv stored in file_folder. Returns a track.Track
     timezone_diff_h: Timezone correction to get a UTC timestamp (Only one timezone can be set)
     Autofix: Set to True to correct bad stored exif time. Set to False to only get the ERROR and manually fix.
     """
     with open(file_folder + "exif.csv") as csvfile:
         reader = csv.reader(csvfile)
         data = list(reader)
-    dict_exif = {'timestampMs_localtime': [], 'timezoneH': timezone_diff_h, 'timestampMs': [],
-                 'pic_idx': [], 'filename': [], 'has_gps': [], 'latitude': [], 'longitude': [], }
-    for i in range(len(data)):
-        local_datetime = datetime.strptime(data[i][0], "%Y-%m-%d %H:%M:%S")
-        dict_exif['timestampMs_localtime'].append(local_datetime)
-        dict_exif['has_gps'].append(bool(int(data[i][1])))
-        dict_exif['latitude'].append(float(data[i][2]))
-        dict_exif['longitude'].append(float(data[i][3]))
-        dict_exif['pic_idx'].append(int(data[i][4]))
-        dict_exif['filename'].append(data[i][5])
-        dict_exif['timestampMs'].append(local_datetime - timedelta(hours=timezone_diff_h))
+    local_timestamp_ms = track.parse_datetime_ms([row[0] for row in data])
+    dict_exif = track.Track(local_timestamp_ms - int(round(timezone_diff_h * 3600000)),
+                            [float(row[2]) for row in data],
+                            [float(row[3]) for row in data],
+                            has_gps=[bool(int(row[1])) for row in data],
+                            filename=[row[5] for row in data],
+                            pic_idx=[int(row[4]) for row in data],
+                            timezone_h=timezone_diff_h)
 
     check_time_order(dict_exif, autofix)
     return dict_exif
 
 
 def exif_data_to_loc_hist(dict_exif_in):
-    """Converts exif dictionary to location history dictionary"""
-    dict_exif_out = {'timestampMs': [], 'latitude': [], 'longitude': []}
-    for i in range(len(dict_exif_in['timestampMs'])):
-        if dict_exif_in['has_gps'][i]:
-            dict_exif_out['timestampMs'].append(dict_exif_in['timestampMs'][i])
-            dict_exif_out['latitude'].append(dict_exif_in['latitude'][i])
-            dict_exif_out['longitude'].append(dict_exif_in['longitude'][i])
-
-    return dict_exif_out
+    """Converts exif track to a location history track with the images that have gps data"""
+    mask = dict_exif_in.has_gps
+    return track.Track(dict_exif_in.timestamp_ms[mask], dict_exif_in.latitude[mask], dict_exif_in.longitude[mask],
+                       is_sorted=dict_exif_in.is_sorted)
@@ -1,63 +1,107 @@
 import json
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
 import csv
+import src.track as track
+
+# Characters of the json file read at once
+CHUNK_SIZE = 1 << 16
+# Accuracy in meters of the locations that do not have one
+DEFAULT_ACCURACY_M = 10
+
+
+def iter_json_array(f, key, chunk_size=CHUNK_SIZE):
+    """Yields the items of the array at key of a json object, reading the file in chunks instead of loading it.
+    Items must be objects, as the locations of the location history"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    marker = '"%s"' % key
+    while True:
+        idx = buffer.find(marker)
+        idx_start = buffer.find('[', idx + len(marker)) if idx >= 0 else -1
+        if idx_start >= 0:
+            break
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ValueError("No %s array in the json file" % key)
+        buffer += chunk
+
+    pos = idx_start + 1
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            if pos == len(buffer):
+                raise ValueError("End of the buffer")
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # The item continues in the next chunk
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError("The %s array of the json file is not complete" % key)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+
+
+def parse_location_timestamp_ms(location):
+    """UTC milliseconds of a location. Older exports have timestampMs, newer ones an ISO 8601 timestamp"""
+    if 'timestampMs' in location:
+        return int(location['timestampMs'])
+    dt = datetime.fromisoformat(location['timestamp'].replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return track.datetime_to_ms(dt)
+
+
+def iter_location_history(location_history_path, accuracy_m=DEFAULT_ACCURACY_M):
+    """Yields (timestamp ms, latitude, longitude, accuracy) of the locations of a google location history json, in
+    the order of the file. Locations without position are skipped"""
+    with open(location_history_path, "r") as file:
+        for location in iter_json_array(file, 'locations'):
+            if 'latitudeE7' not in location or 'longitudeE7' not in location:
+                continue
+            yield (parse_location_timestamp_ms(location), float(location['latitudeE7']) / 10000000.0,
+                   float(location['longitudeE7']) / 10000000.0, int(location.get('accuracy', accuracy_m)))
+
+
+def write_location(f_out, timestamp_ms, lat_deg, long_deg, accuracy):
+    """Writes a location as a row of the location history csv"""
+    f_out.write("%s,%.8f,%.8f,%d\n" % (track.ms_to_datetime(timestamp_ms).strftime("%Y-%m-%d %H:%M:%S"),
+                                       lat_deg, long_deg, accuracy))
 
 
 def extract_from_location_history(location_history_path, folder_out, from_datetime_utc, to_datetime_utc):
-    """Extract data from google location history between the input dates in UTC and stores them in a csv"""
+    """Extract data from google location history between the input dates in UTC and stores them in a csv.
+    The json is read as a stream, so its size does not matter"""
     from_datetime_utc = from_datetime_utc - timedelta(hours=1)
     to_datetime_utc = to_datetime_utc + timedelta(hours=1)
 
     print("Extracting Google Location History ...")
     print("From", from_datetime_utc, "To", to_datetime_utc, "UTC")
-    with open(location_history_path, "r") as file:
-        dict_location_history = json.load(file)
-
-    list_locations = []
-    for location in dict_location_history['locations']:
-        loc_datetime = datetime.utcfromtimestamp(int(location["timestampMs"]) / 1000)
-        if loc_datetime > from_datetime_utc:
-            loc_lat = float(location['latitudeE7']) / 10000000.0
-            loc_lon = float(location['longitudeE7']) / 10000000.0
-            loc_accuracy = int(location['accuracy'])
-            list_locations.append({"timestampMs": loc_datetime,
-                                   "latitude": loc_lat,
-                                   "longitude": loc_lon,
-                                   "accuracy": loc_accuracy})
-        elif loc_datetime > to_datetime_utc:
-            break
-
-    # Spanish CSV format. For author debugging
-    # with open(folder_out+"location_history_es.csv", "w") as f_out:
-    #     for i in range(len(list_locations)):
-    #         f_out.write(("%s;%.8f;%.8f;%d\n" % (list_locations[i]["timestampMs"].strftime("%Y-%m-%d %H:%M:%S"),
-    #                                             list_locations[i]["latitude"],
-    #                                             list_locations[i]["longitude"],
-    #                                             list_locations[i]["accuracy"])).replace('.', ','))
+    from_ms = track.datetime_to_ms(from_datetime_utc)
+    to_ms = track.datetime_to_ms(to_datetime_utc)
 
     with open(folder_out + "location_history.csv", "w") as f_out:
-        for i in range(len(list_locations)):
-            f_out.write(("%s,%.8f,%.8f,%d\n" % (list_locations[i]["timestampMs"].strftime("%Y-%m-%d %H:%M:%S"),
-                                                list_locations[i]["latitude"],
-                                                list_locations[i]["longitude"],
-                                                list_locations[i]["accuracy"])))
+        for timestamp_ms, lat_deg, long_deg, accuracy in iter_location_history(location_history_path):
+            if timestamp_ms > to_ms:
+                break
+            if timestamp_ms > from_ms:
+                write_location(f_out, timestamp_ms, lat_deg, long_deg, accuracy)
     print("Done Extracting Google Location History")
 
 
 def load_location_history_data(file_folder):
-    """Load the extracted google location history data from the csv stored in file_folder."""
+    """Load the extracted google location history data from the csv stored in file_folder. Returns a track.Track"""
     accuracy_limit = 40
     with open(file_folder + "location_history.csv") as csvfile:
         reader = csv.reader(csvfile)
-        data = list(reader)
-    dict_google = {'timestampMs': [], 'latitude': [], 'longitude': [], 'accuracy': []}
-    for i in range(len(data)):
-        accuracy = int(data[i][3])
-        if accuracy < accuracy_limit:
-            dict_google['timestampMs'].append(datetime.strptime(data[i][0], "%Y-%m-%d %H:%M:%S"))
-            dict_google['latitude'].append(float(data[i][1]))
-            dict_google['longitude'].append(float(data[i][2]))
-            # dict_google['accuracy'].append(accuracy)
-
-    return dict_google
+        data = [row for row in reader if int(row[3]) < accuracy_limit]
+
+    return track.Track(track.parse_datetime_ms([row[0] for row in data]),
+                       [float(row[1]) for row in data],
+                       [float(row[2]) for row in data])
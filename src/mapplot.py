@@ -1,24 +1,163 @@
 import time
 import math
 import smopy
+import numpy as np
 import matplotlib.pyplot as plt
+from PIL import Image
+import src.renderMetrics as renderMetrics
+import src.zoomPlanner as zoomPlanner
+import src.basemapPyramid as basemapPyramid
+import src.mapplotAnimationHelpers as mapplotAnimationHelpers
+
+
+def bbox_around_point(lat_deg, long_deg, margin_deg):
+    """Returns the (y_min, x_min, y_max, x_max) box in degrees centered on a lat,lon point with a margin in degrees"""
+    y_max_deg = lat_deg + margin_deg
+    y_min_deg = lat_deg - margin_deg
+
+    # Compensate margin in X due to latitude effect. A degree of longitude at higher latitudes covers less space
+    margin_deg_x = margin_deg/math.cos(math.radians(lat_deg))
+    x_max_deg = long_deg + margin_deg_x
+    x_min_deg = long_deg - margin_deg_x
+    return y_min_deg, x_min_deg, y_max_deg, x_max_deg
+
+
+def bbox_region_square(lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg):
+    """Returns the (y_min, x_min, y_max, x_max) box in degrees around the input box, enlarging the shortest edge to
+    square the area"""
+    y_max_deg = lat_max_deg + margin_deg
+    y_min_deg = lat_min_deg - margin_deg
+
+    x_max_deg = long_max_deg + margin_deg
+    x_min_deg = long_min_deg - margin_deg
+
+    # Increase the smaller dimension so both match
+    y_size = abs(lat_min_deg-lat_max_deg)
+    x_size = abs(long_min_deg-long_max_deg)
+    half_diff_size = abs(x_size - y_size)/2.0
+    if y_size > x_size:
+        x_min_deg -= half_diff_size
+        x_max_deg += half_diff_size
+    else:
+        y_min_deg -= half_diff_size
+        y_max_deg += half_diff_size
+
+    # Leave margin for smoopy. Limiting at 90 can result in an out of range at smoppy box
+    #Fixme: Not working well for large maps
+    if y_max_deg >= 80:
+        y_max_deg = 80
+    if y_min_deg < -80:
+        y_min_deg = -80
+
+    if x_max_deg > 180:
+        x_max_deg = 180
+    if x_min_deg < -180:
+        x_min_deg = -180
+    return y_min_deg, x_min_deg, y_max_deg, x_max_deg
+
+
+def bbox_region_precise(lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg):
+    """Returns the (y_min, x_min, y_max, x_max) box in degrees around the input box"""
+    return lat_min_deg - margin_deg, long_min_deg - margin_deg, lat_max_deg + margin_deg, long_max_deg + margin_deg
+
+
+def bbox_interpolate(bbox_from, bbox_to, fraction):
+    """Linear interpolation between two (y_min, x_min, y_max, x_max) boxes. Fraction 0 returns bbox_from"""
+    return tuple(a + (b - a) * fraction for a, b in zip(bbox_from, bbox_to))
+
+
+def bbox_include_point(bbox, lat_deg, long_deg, margin_deg):
+    """Enlarges a (y_min, x_min, y_max, x_max) box so the point and its margin fit inside"""
+    y_min_deg, x_min_deg, y_max_deg, x_max_deg = bbox
+    return (min(y_min_deg, lat_deg - margin_deg), min(x_min_deg, long_deg - margin_deg),
+            max(y_max_deg, lat_deg + margin_deg), max(x_max_deg, long_deg + margin_deg))
+
+
+class SourceMap(smopy.Map):
+    """smopy map that takes its mosaic from a tile source, e.g. renderPipeline.MapPrefetcher, instead of downloading
+    it. The source needs a get_mosaic method with the arguments of smopy.fetch_map. With no source it downloads it"""
+
+    def __init__(self, *args, **kwargs):
+        self.tile_source = kwargs.pop('tile_source')
+        super().__init__(*args, **kwargs)
+
+    def fetch(self):
+        """Gets the image from the tile source"""
+        if self.img is None:
+            if self.tile_source is None:
+                self.img = smopy.fetch_map(self.box_tile, self.z, self.tileserver, self.tilesize, self.maxtiles)
+            else:
+                self.img = self.tile_source.get_mosaic(self.box_tile, self.z, self.tileserver, self.tilesize,
+                                                       self.maxtiles)
+        self.w, self.h = self.img.size
+        return self.img
+
+
+class BlankTileSource:
+    """Tile source of empty mosaics with the size of the real ones. Used while MapPlot warms up"""
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Returns an empty image of the tile range. Same arguments as smopy.fetch_map"""
+        x0, y0, x1, y1 = smopy.correct_box(box_tile, z)
+        return Image.new('1', ((x1 - x0 + 1) * tilesize, (y1 - y0 + 1) * tilesize))
+
+
+BLANK_TILE_SOURCE = BlankTileSource()
 
 
 class MapPlot:
     """Wrapper for smoopy maps to reduce tile download and provide easier plotting functions"""
 
-    def __init__(self, maxtiles=16):
-        """Increase maxtiles to allow for higher resolution mpas. (Keep in mind OSM terms of service)"""
+    # Tile server used by all maps and wait time after each map download. Keep in mind OSM terms of service
+    tileserver = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
+    download_delay_s = 0.5
+    # mosaicCache.MosaicCache shared by all maps to reuse the mosaics of previous areas. None to always download
+    mosaic_cache = None
+    # memoryBudget.MemoryBudget of the prefetched maps and the frames waiting to be encoded. Give the same one to the
+    # mosaic cache. None to not limit them
+    memory_budget = None
+    # Tile source of the maps while no render pipeline replaces it, e.g. draftRender.OfflineTileSource. None to download
+    default_tile_source = None
+    # Object with a compose(rgba, idx_frame, idx_image) method that returns the frame saved instead of the map, e.g.
+    # compositor.DashboardCompositor. None to save the map
+    frame_compositor = None
+
+    def __init__(self, maxtiles=16, oversampling=1.0):
+        """Increase maxtiles to allow for higher resolution mpas. (Keep in mind OSM terms of service)
+        The zoom level is chosen so the crop has oversampling map pixels per output pixel, within the maxtiles budget"""
         self.obj_map_ = None
         self.obj_plot_ax_ = None
         self.b_crop_to_area = True
         self.stats_downloaded_tiles = 0
         self.stats_map_downloaded = 0
-        self.z = 16
+        self.stats_map_cache_hits = 0
+        self.b_mosaic_from_cache_ = False
+        self.b_blank_map_ = False  # Map created while warming up, its tiles are fetched when the warm up ends
+        self.stats_wasted_px_ratio_sum = 0
+        self.z = None  # Set a zoom level to skip the planner and let smopy lower it until maxtiles are enough
         self.maxtiles = maxtiles
+        self.oversampling = oversampling
+        self.zoom_plan = None
+        self.planned_map_ = None  # (map_bbox, z) given to set_map_planned
+
+        # Output image. Figure size times dpi gives the pixels where the crop is shown
+        self.figsize_in = (9, 9)
+        self.dpi = None  # None to use the matplotlib default
+        # Show the map resampled close to the output size, see basemapPyramid. False to show the full mosaic
+        self.b_resample_map = True
+        self.basemap_ = None  # BasemapPyramid of the current mosaic
+        self.basemap_shown_ = None  # Image given to imshow
+        self.view_ = None  # (bbox, size in px, image) of the last view drawn by the view source
 
         # Other configuration
         self.expect_const_area = False
+        self.metrics = renderMetrics.RenderMetrics()  # Replace to share the stage timings with the caller
+        # Object with a get_mosaic method. None to download the tiles when a map is created
+        self.tile_source = self.default_tile_source
+        self.encoder = None  # Object with a submit(filename, rgba, dpi) method. None to encode in save_plot
+        # While warming up only the map and crop area are updated, as a full run would, and nothing is downloaded,
+        # drawn or saved. Used to start from the middle of a sequence with the same maps as a run from its beginning
+        self.b_warm_up = False
 
         # Current area
         self.x_min_px = 0
@@ -26,28 +165,101 @@ class MapPlot:
         self.y_min_px = 0
         self.y_max_px = 0
 
-    def __update_map_object(self, y_min_deg, x_min_deg, y_max_deg, x_max_deg):
-        """Creates new smopy object, updates statics and selected crop area"""
-        self.obj_map_ = None
-        self.obj_map_ = smopy.Map((y_min_deg, x_min_deg, y_max_deg, x_max_deg), z=self.z, maxtiles=self.maxtiles)
+        # Drawn artists with their lat,lon data, to project them again if the map changes under them
+        self.dict_drawn_geo_ = {}
+        # Artists updated between frames. They are drawn over a cached background of the rest of the plot
+        self.list_moving_artists_ = []
+        self.background_ = None
 
-        # Update stats
-        self.stats_downloaded_tiles += \
-            self.obj_map_.w / self.obj_map_.tilesize * self.obj_map_.h / self.obj_map_.tilesize
-        self.stats_map_downloaded += 1
+    def __update_map_object(self, y_min_deg, x_min_deg, y_max_deg, x_max_deg, z=None):
+        """Creates new smopy object, updates statics and selected crop area. z overrides the zoom selection.
+        With a mosaic cache the mosaic is taken from it when possible"""
+        self.obj_map_ = None
+        self.planned_map_ = None
+        bbox = (y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        map_source = BLANK_TILE_SOURCE if self.b_warm_up else self.__get_map_source()
+        if z is not None or self.z is None:
+            if z is None:
+                # Only the tiles covering the crop at the zoom needed by the output size
+                self.zoom_plan = zoomPlanner.plan_zoom(bbox, self.get_output_px(), self.oversampling, self.maxtiles)
+            else:
+                self.zoom_plan = zoomPlanner.ZoomPlan(bbox, z, self.get_output_px())
+            self.obj_map_ = SourceMap(bbox, z=self.zoom_plan.z, maxtiles=self.maxtiles, margin=None,
+                                      tileserver=self.tileserver, tile_source=map_source)
+        else:
+            self.obj_map_ = SourceMap(bbox, z=self.z, maxtiles=self.maxtiles, tileserver=self.tileserver,
+                                      tile_source=map_source)
+            self.zoom_plan = zoomPlanner.ZoomPlan(bbox, self.obj_map_.z, self.get_output_px())
 
         # Update crop area in px
         self.x_min_px, self.y_min_px = self.obj_map_.to_pixels(y_min_deg, x_min_deg)
         self.x_max_px, self.y_max_px = self.obj_map_.to_pixels(y_max_deg, x_max_deg)
+        self.b_blank_map_ = self.b_warm_up
+        if not self.b_warm_up:
+            self.__count_map_load()
+
+    def __fetch_blank_map(self):
+        """Fetches the tiles of the map created while warming up. Its area and zoom are kept"""
+        self.obj_map_.tile_source = self.__get_map_source()
+        self.obj_map_.img = None
+        self.obj_map_.fetch()
+        self.b_blank_map_ = False
+        self.__count_map_load()
+
+    def get_view_source(self):
+        """Returns the tile source that draws the exact views at the output size, e.g. vectorBasemap.VectorTileSource,
+        or None to show the views cut from the mosaics. Only default tile sources with a get_view method are used"""
+        if self.b_resample_map and self.b_crop_to_area and hasattr(self.default_tile_source, 'get_view'):
+            return self.default_tile_source
+        return None
+
+    def __get_map_source(self):
+        """Tile source of the mosaic of a new map. Maps of the views drawn by the view source are blank, only their
+        area is used"""
+        if self.get_view_source() is not None:
+            return BLANK_TILE_SOURCE
+        if self.mosaic_cache is not None:
+            return self
+        return self.tile_source
+
+    def __count_map_load(self):
+        """Updates the stats with the map just fetched. Waits after downloads"""
+        if self.b_mosaic_from_cache_:
+            self.b_mosaic_from_cache_ = False
+            self.stats_map_cache_hits += 1
+            return
 
-        # Wait some time to not flood OSM servers
-        time.sleep(0.5)
+        # Update stats
+        self.stats_downloaded_tiles += \
+            self.obj_map_.w / self.obj_map_.tilesize * self.obj_map_.h / self.obj_map_.tilesize
+        self.stats_map_downloaded += 1
+        self.stats_wasted_px_ratio_sum += 1 - abs(self.zoom_plan.crop_px[0] * self.zoom_plan.crop_px[1]) / \
+            float(self.obj_map_.w * self.obj_map_.h)
+
+        # Wait some time to not flood OSM servers. Tile sources wait after their own downloads
+        if self.tile_source is None:
+            time.sleep(self.download_delay_s)
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Tile source of the maps while a mosaic cache is set. Mosaics not found in the cache are taken from the tile
+        source, or downloaded, and stored in it. Same arguments as smopy.fetch_map"""
+        img = self.mosaic_cache.find(box_tile, z, tilesize)
+        if img is not None:
+            self.b_mosaic_from_cache_ = True
+            return img
+        if self.tile_source is not None:
+            img = self.tile_source.get_mosaic(box_tile, z, tileserver, tilesize, maxtiles)
+        else:
+            img = smopy.fetch_map(box_tile, z, tileserver, tilesize, maxtiles)
+        self.mosaic_cache.add(box_tile, z, img)
+        return img
 
     def __is_new_area_smaller(self, x_min_px, x_max_px, y_min_px, y_max_px):
         """Compares input area with class current crop area. Returns True if new area is smaller"""
         b_return = False
         # If area is expected to be constant skip this check as numerical errors might result in additional map download
-        if not self.expect_const_area:
+        # A planned map is also kept while the view fits inside it, the camera plan already checked its resolution
+        if not self.expect_const_area and self.planned_map_ is None:
             current_area = abs(self.y_max_px - self.y_min_px) * abs(self.x_max_px - self.x_min_px)
             new_area = abs(y_max_px - y_min_px) * abs(x_max_px - x_min_px)
 
@@ -55,128 +267,292 @@ class MapPlot:
                 b_return = True
         return b_return
 
+    def __load_area(self, y_min_deg, x_min_deg, y_max_deg, x_max_deg):
+        """Updates the crop area. Downloads new tiles if necessary. Returns True if a new map object was created"""
+        b_new_map = True
+        with self.metrics.stage('map'):
+            if not self.obj_map_:
+                self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+            else:
+                # Check if the loaded tiles can be reused
+                x_min_px, y_min_px = self.obj_map_.to_pixels(y_min_deg, x_min_deg)
+                x_max_px, y_max_px = self.obj_map_.to_pixels(y_max_deg, x_max_deg)
+
+                if x_max_px >= self.obj_map_.w or x_min_px <= 0 or y_min_px >= self.obj_map_.h or y_max_px <= 0:
+                    # If crop area is outside smopy map load new tiles
+                    self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+                elif self.__is_new_area_smaller(x_min_px, x_max_px, y_min_px, y_max_px):
+                    # If crop area is smaller than the previous loaded area is best to try to download a higher res map
+                    self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+                else:
+                    # Only update crop area if map is still valid
+                    self.x_min_px = x_min_px
+                    self.y_min_px = y_min_px
+                    self.x_max_px = x_max_px
+                    self.y_max_px = y_max_px
+                    b_new_map = False
+            if self.b_blank_map_ and not self.b_warm_up:
+                self.__fetch_blank_map()
+                b_new_map = True
+        return b_new_map
+
+    def get_output_px(self):
+        """Returns the (width, height) in pixels of the saved plots"""
+        dpi = self.dpi if self.dpi else plt.rcParams['figure.dpi']
+        return self.figsize_in[0] * dpi, self.figsize_in[1] * dpi
+
     def set_map(self, y_min_deg, x_min_deg, y_max_deg, x_max_deg, figsize_in=(9, 9)):
         """Updates map object with new area and creates a new plot. Downloads new tiles if necessary"""
-        if not self.obj_map_:
-            self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        self.figsize_in = figsize_in
+        self.__load_area(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        self.__show_map(figsize_in)
+
+    def set_map_planned(self, view_bbox, map_bbox, z, figsize_in=(9, 9)):
+        """Creates a new plot of view_bbox over a map of map_bbox at zoom z, as given by cameraPlanner.
+        Tiles are only downloaded when map_bbox or z change"""
+        self.figsize_in = figsize_in
+        y_min_deg, x_min_deg, y_max_deg, x_max_deg = view_bbox
+        with self.metrics.stage('map'):
+            if not self.obj_map_ or self.planned_map_ != (map_bbox, z):
+                self.__update_map_object(*map_bbox, z=z)
+                self.planned_map_ = (map_bbox, z)
+            if self.b_blank_map_ and not self.b_warm_up:
+                self.__fetch_blank_map()
+            self.x_min_px, self.y_min_px = self.obj_map_.to_pixels(y_min_deg, x_min_deg)
+            self.x_max_px, self.y_max_px = self.obj_map_.to_pixels(y_max_deg, x_max_deg)
+        self.__show_map(figsize_in)
+
+    def __show_map(self, figsize_in):
+        """Creates a new plot with the current map and crop area"""
+        self.dict_drawn_geo_ = {}
+        self.list_moving_artists_ = []
+        self.background_ = None
+        if self.b_warm_up:
+            self.obj_plot_ax_ = None
+            return
+
+        with self.metrics.stage('map'):
+            self.basemap_shown_ = self.__get_basemap()
+        # Same figure as smopy show_mpl. The basemap covers the mosaic pixels whatever its resolution
+        with self.metrics.stage('drawing'):
+            plt.figure(figsize=figsize_in, dpi=self.dpi)
+            self.obj_plot_ax_ = plt.subplot(111)
+            plt.xticks([])
+            plt.yticks([])
+            plt.grid(False)
+            plt.xlim(0, self.obj_map_.w)
+            plt.ylim(self.obj_map_.h, 0)
+            plt.axis('off')
+            plt.tight_layout()
+            self.obj_plot_ax_.imshow(self.basemap_shown_, extent=self.__get_map_extent())
+            if self.b_crop_to_area:
+                self.obj_plot_ax_.axis([self.x_min_px, self.x_max_px, self.y_min_px, self.y_max_px])
+
+    def __get_map_extent(self):
+        """Extent of the map image in map pixels, as imshow gives to the full mosaic. Views drawn by the view source
+        cover the crop area"""
+        if self.get_view_source() is not None:
+            return self.x_min_px, self.x_max_px, self.y_min_px, self.y_max_px
+        return -0.5, self.obj_map_.w - 0.5, self.obj_map_.h - 0.5, -0.5
+
+    def __get_view(self):
+        """Returns the view source image of the crop area at the size it takes in the output"""
+        view_px = (abs(self.x_max_px - self.x_min_px), abs(self.y_max_px - self.y_min_px))
+        ratio = basemapPyramid.get_map_px_per_output_px(view_px, self.get_output_px())
+        size_px = (max(1, int(round(view_px[0] / ratio))), max(1, int(round(view_px[1] / ratio))))
+        lat_max_deg, long_min_deg = smopy.num2deg(self.obj_map_.xmin + self.x_min_px / self.obj_map_.tilesize,
+                                                  self.obj_map_.ymin + self.y_max_px / self.obj_map_.tilesize,
+                                                  self.obj_map_.z)
+        lat_min_deg, long_max_deg = smopy.num2deg(self.obj_map_.xmin + self.x_max_px / self.obj_map_.tilesize,
+                                                  self.obj_map_.ymin + self.y_min_px / self.obj_map_.tilesize,
+                                                  self.obj_map_.z)
+        bbox = (float(lat_min_deg), float(long_min_deg), float(lat_max_deg), float(long_max_deg))
+        if self.view_ is None or self.view_[:2] != (bbox, size_px):
+            self.view_ = (bbox, size_px, np.asarray(self.get_view_source().get_view(bbox, size_px).convert('RGBA')))
+        return self.view_[2]
+
+    def __get_basemap(self):
+        """Returns the image of the map for the current view. The pyramid is built again when the mosaic changes"""
+        if self.get_view_source() is not None:
+            return self.__get_view()
+        if not self.b_resample_map:
+            return self.obj_map_.img
+        if self.b_crop_to_area:
+            view_px = (abs(self.x_max_px - self.x_min_px), abs(self.y_max_px - self.y_min_px))
         else:
-            # Check if the loaded tiles can be reused
-            x_min_px, y_min_px = self.obj_map_.to_pixels(y_min_deg, x_min_deg)
-            x_max_px, y_max_px = self.obj_map_.to_pixels(y_max_deg, x_max_deg)
+            view_px = (self.obj_map_.w, self.obj_map_.h)
+        if self.basemap_ is None or self.basemap_.img is not self.obj_map_.img:
+            self.basemap_ = basemapPyramid.BasemapPyramid(self.obj_map_.img, view_px, self.get_output_px())
+        return self.basemap_.get_image(view_px, self.get_output_px())
+
+    def update_view(self, y_min_deg, x_min_deg, y_max_deg, x_max_deg):
+        """Moves the crop area of the current plot without creating a new one. If new tiles are needed the map image
+        is replaced and the drawn lists and markers are projected again on it"""
+        if self.b_warm_up:
+            self.__load_area(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+            return
+
+        crop_prev = (self.x_min_px, self.x_max_px, self.y_min_px, self.y_max_px)
+        b_new_map = self.__load_area(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        if b_new_map or crop_prev != (self.x_min_px, self.x_max_px, self.y_min_px, self.y_max_px):
+            # A new view over the same map can need another level of the basemap
+            with self.metrics.stage('map'):
+                basemap = self.__get_basemap()
+            if basemap is not self.basemap_shown_:
+                with self.metrics.stage('drawing'):
+                    obj_image = self.obj_plot_ax_.images[0]
+                    obj_image.set_data(basemap)
+                    obj_image.set_extent(self.__get_map_extent())
+                self.basemap_shown_ = basemap
+            self.background_ = None
+        if b_new_map:
+            for artist, (lat_deg, long_deg) in self.dict_drawn_geo_.items():
+                self.__set_artist_data(artist, lat_deg, long_deg)
 
-            if x_max_px >= self.obj_map_.w or x_min_px <= 0 or y_min_px >= self.obj_map_.h or y_max_px <= 0:
-                # If crop area is outside smopy map load new tiles
-                self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
-            elif self.__is_new_area_smaller(x_min_px, x_max_px, y_min_px, y_max_px):
-                # If crop area is smaller than the previous loaded area is best to try to download a higher res map
-                self.__update_map_object(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
-            else:
-                # Only update crop area if map is still valid
-                self.x_min_px = x_min_px
-                self.y_min_px = y_min_px
-                self.x_max_px = x_max_px
-                self.y_max_px = y_max_px
-
-        # Set matplotlib with smopy map object
-        self.obj_plot_ax_ = self.obj_map_.show_mpl(figsize=figsize_in)
         if self.b_crop_to_area:
             self.obj_plot_ax_.axis([self.x_min_px, self.x_max_px, self.y_min_px, self.y_max_px])
 
 
+    def get_stats(self):
+        """Returns the map counters as a dictionary"""
+        wasted_px_ratio = 0
+        if self.stats_map_downloaded:
+            wasted_px_ratio = self.stats_wasted_px_ratio_sum / self.stats_map_downloaded
+        n_map_loads = self.stats_map_downloaded + self.stats_map_cache_hits
+        return {'tiles_downloaded': self.stats_downloaded_tiles, 'maps_downloaded': self.stats_map_downloaded,
+                'maps_from_cache': self.stats_map_cache_hits,
+                'cache_hit_rate': self.stats_map_cache_hits / float(n_map_loads) if n_map_loads else 0,
+                'wasted_px_ratio': wasted_px_ratio, 'zoom': self.zoom_plan.z if self.zoom_plan else None}
+
     def print_stats(self):
         """Prints the stats in the console"""
-        print("Downloaded %d tiles in %d maps" % (self.stats_downloaded_tiles, self.stats_map_downloaded))
+        dict_stats = self.get_stats()
+        print("Downloaded %d tiles in %d maps. Zoom %s, %.1f%% of downloaded pixels outside the crop" % (
+            dict_stats['tiles_downloaded'], dict_stats['maps_downloaded'], dict_stats['zoom'],
+            dict_stats['wasted_px_ratio'] * 100))
+        if self.mosaic_cache is not None:
+            print("%d maps taken from the mosaic cache, %.1f%% hit rate" % (
+                dict_stats['maps_from_cache'], dict_stats['cache_hit_rate'] * 100))
 
     def set_map_around_point(self, lat_deg, long_deg, margin_deg):
         """Sets map centered on a lat,lon point with a bounding box of a specified margin in degrees"""
-        y_max_deg = lat_deg + margin_deg
-        y_min_deg = lat_deg - margin_deg
-
-        # Compensate margin in X due to latitude effect. A degree of longitude at higher latitudes covers less space
-        margin_deg_x = margin_deg/math.cos(math.radians(lat_deg))
-        x_max_deg = long_deg + margin_deg_x
-        x_min_deg = long_deg - margin_deg_x
-
-        self.set_map(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        self.set_map(*bbox_around_point(lat_deg, long_deg, margin_deg))
 
 
     def set_map_region_square(self, lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg):
         """Sets map around the box specified. This functions enlarges the shortest edge to square the area"""
-        y_max_deg = lat_max_deg + margin_deg
-        y_min_deg = lat_min_deg - margin_deg
-
-        x_max_deg = long_max_deg + margin_deg
-        x_min_deg = long_min_deg - margin_deg
-
-        # Increase the smaller dimension so both match
-        y_size = abs(lat_min_deg-lat_max_deg)
-        x_size = abs(long_min_deg-long_max_deg)
-        half_diff_size = abs(x_size - y_size)/2.0
-        if y_size > x_size:
-            x_min_deg -= half_diff_size
-            x_max_deg += half_diff_size
-        else:
-            y_min_deg -= half_diff_size
-            y_max_deg += half_diff_size
-
-        # Leave margin for smoopy. Limiting at 90 can result in an out of range at smoppy box
-        #Fixme: Not working well for large maps
-        if y_max_deg >= 80:
-            y_max_deg = 80
-        if y_min_deg < -80:
-            y_min_deg = -80
-
-        if x_max_deg > 180:
-            x_max_deg = 180
-        if x_min_deg < -180:
-            x_min_deg = -180
-
-        self.set_map(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        self.set_map(*bbox_region_square(lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg))
 
     def set_map_region_precise(self, lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg):
         """Sets map around the box specified"""
-        y_max_deg = lat_max_deg + margin_deg
-        y_min_deg = lat_min_deg - margin_deg
-
-        x_max_deg = long_max_deg + margin_deg
-        x_min_deg = long_min_deg - margin_deg
-
-        self.set_map(y_min_deg, x_min_deg, y_max_deg, x_max_deg)
+        self.set_map(*bbox_region_precise(lat_min_deg, long_min_deg, lat_max_deg, long_max_deg, margin_deg))
 
     def show_plot(self):
         """Shows matplotlib plot"""
         plt.show()
 
-    def save_plot(self, filename):
-        """Saves matplotlib plot. Filename is full path"""
-        plt.savefig(filename)
+    def save_plot(self, filename, idx_frame=None, idx_image=None):
+        """Saves matplotlib plot. Filename is full path.
+        If there are moving artists only they are drawn over the cached background when the view did not change
+        :param idx_frame: Frame number of the plot, for the frame_compositor
+        :param idx_image: Index in the exif data of the image the frame shows, for the frame_compositor
+        """
+        if self.b_warm_up:
+            return
+        if not self.list_moving_artists_:
+            mapplotAnimationHelpers.save_figure(self.obj_plot_ax_.figure, filename, self.metrics, self.encoder,
+                                                self.frame_compositor, idx_frame, idx_image)
+            return
+
+        canvas = self.obj_plot_ax_.figure.canvas
+        with self.metrics.stage('raster'):
+            if self.background_ is None:
+                # Animated artists are skipped by draw, leaving the background ready to be cached
+                canvas.draw()
+                self.background_ = canvas.copy_from_bbox(self.obj_plot_ax_.figure.bbox)
+            else:
+                canvas.restore_region(self.background_)
+            # Same order as a full draw: by zorder and then by creation
+            for artist in sorted(self.list_moving_artists_, key=lambda a: a.get_zorder()):
+                self.obj_plot_ax_.draw_artist(artist)
+        mapplotAnimationHelpers.encode_figure(self.obj_plot_ax_.figure, filename, self.metrics, self.encoder,
+                                              self.frame_compositor, idx_frame, idx_image)
 
     def clear(self):
         """Cleans plot and closes are opens figures. Prevents mem leaks"""
         plt.clf()
         plt.close('all')
+        self.dict_drawn_geo_ = {}
+        self.list_moving_artists_ = []
+        self.background_ = None
 
     def reset(self):
         """Delete the smoopy object to force a tile redownload"""
         self.obj_map_ = None
+        self.planned_map_ = None
+        self.b_blank_map_ = False
+        self.basemap_ = None
+        self.view_ = None
+
+    def __set_artist_data(self, artist, lat_deg, long_deg):
+        """Projects lat,lon data and updates a line or a scatter marker with it"""
+        if self.b_warm_up:
+            return
+        with self.metrics.stage('projection'):
+            x_px, y_px = self.obj_map_.to_pixels(np.asarray(lat_deg, dtype=float), np.asarray(long_deg, dtype=float))
+        with self.metrics.stage('drawing'):
+            if hasattr(artist, 'set_offsets'):
+                artist.set_offsets(np.column_stack((np.atleast_1d(x_px), np.atleast_1d(y_px))))
+            else:
+                artist.set_data(x_px, y_px)
+        self.dict_drawn_geo_[artist] = (lat_deg, long_deg)
+
+    def set_moving_artists(self, list_artists):
+        """Sets the artists that will be updated between frames. The rest of the plot is cached as a background
+        and only these artists are drawn again on each save_plot while the view does not change"""
+        if self.b_warm_up:
+            return
+        for artist in self.list_moving_artists_:
+            artist.set_animated(False)
+        for artist in list_artists:
+            artist.set_animated(True)
+        self.list_moving_artists_ = list(list_artists)
+        self.background_ = None
+
+    def update_single_marker(self, artist, lat_deg, long_deg):
+        """Moves a marker returned by draw_single_marker to a new lat,lon point"""
+        self.__set_artist_data(artist, lat_deg, long_deg)
+
+    def update_list(self, artist, lat_deg, long_deg):
+        """Replaces the points of a line returned by draw_list"""
+        self.__set_artist_data(artist, lat_deg, long_deg)
 
     def draw_single_marker(self, lat_deg, long_deg, s_in=40, c_in='r', marker_in='o', zorder_in=100, edgecolors_in='k',
                            linewidth_in=1):
-        """Draws a scatter marker at the specified lat,lon point"""
-        x_px, y_px = self.obj_map_.to_pixels(lat_deg, long_deg)
-        self.obj_plot_ax_.scatter(x_px, y_px, s=s_in, c=c_in,
-                                  marker=marker_in, zorder=zorder_in, edgecolors=edgecolors_in, linewidths=linewidth_in)
+        """Draws a scatter marker at the specified lat,lon point. Returns the artist, None while warming up"""
+        if self.b_warm_up:
+            return None
+        with self.metrics.stage('projection'):
+            x_px, y_px = self.obj_map_.to_pixels(lat_deg, long_deg)
+        with self.metrics.stage('drawing'):
+            artist = self.obj_plot_ax_.scatter(x_px, y_px, s=s_in, c=c_in, marker=marker_in, zorder=zorder_in,
+                                               edgecolors=edgecolors_in, linewidths=linewidth_in)
+        self.dict_drawn_geo_[artist] = (lat_deg, long_deg)
+        return artist
 
     def draw_list(self, lat_deg, long_deg, lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2):
-        """Draw a list of lat,lon points using plot"""
+        """Draw a list of lat,lon points using plot. Returns the matplotlib line, None while warming up"""
         if len(lat_deg) != len(long_deg):
             raise Exception("List dimension mismatch")
+        if self.b_warm_up:
+            return None
+
+        with self.metrics.stage('projection'):
+            x_px, y_px = self.obj_map_.to_pixels(np.asarray(lat_deg, dtype=float), np.asarray(long_deg, dtype=float))
 
-        list_x_px = []
-        list_y_px = []
-        for i in range(len(lat_deg)):
-            x, y = self.obj_map_.to_pixels(lat_deg[i], long_deg[i])
-            list_x_px.append(x)
-            list_y_px.append(y)
+        with self.metrics.stage('drawing'):
+            artist, = self.obj_plot_ax_.plot(x_px, y_px, lineop_in, color=c_in, ms=ms_in, mew=mew_in,
+                                             lw=lw_in)
+        self.dict_drawn_geo_[artist] = (lat_deg, long_deg)
+        return artist
 
-        self.obj_plot_ax_.plot(list_x_px, list_y_px, lineop_in, color=c_in, ms=ms_in, mew=mew_in, lw=lw_in)
@@ -1,4 +1,6 @@
 import time
+import numpy as np
+import matplotlib.image
 
 
 def print_console(idx_animation, img_start, img_end, time_start, time_start_it, filename):
@@ -12,9 +14,48 @@ def print_console(idx_animation, img_start, img_end, time_start, time_start_it,
           % (idx_animation, total_images, filename, elapsed_time, elapsed_time_it, estimated_mins))
 
 
-def sync_helper_file(img_start, img_end, filename, folder):
-    """Generates a file that match image ID with filename to assist in syncing both"""
+def sync_helper_file(img_start, img_end, filename, folder, n_tween=0):
+    """Generates a file that match image ID with filename to assist in syncing both.
+    With n_tween interpolated frames between images, those frames are listed after the image they start from"""
     with open(folder + "syncfile.txt", 'w') as f:
         total_images = img_end - img_start
+        total_frames = max(total_images - 1, 0) * (n_tween + 1) + min(total_images, 1)
         for i in range(total_images):
-            f.write("%d/%d, %s\n" % (i+1, total_images, filename[i+img_start]))
+            idx_frame = i * (n_tween + 1) + 1
+            f.write("%d/%d, %s\n" % (idx_frame, total_frames, filename[i+img_start]))
+            if i < total_images - 1:
+                for k in range(1, n_tween + 1):
+                    f.write("%d/%d, %s tween %d/%d\n" % (idx_frame + k, total_frames, filename[i+img_start], k, n_tween))
+
+
+def save_figure(fig, filename, metrics, encoder=None, compositor=None, idx_frame=None, idx_image=None):
+    """Saves a matplotlib figure as png. Rasterizing and encoding are timed as separate stages in metrics"""
+    with metrics.stage('raster'):
+        fig.canvas.draw()
+    encode_figure(fig, filename, metrics, encoder, compositor, idx_frame, idx_image)
+
+
+def encode_figure(fig, filename, metrics, encoder=None, compositor=None, idx_frame=None, idx_image=None):
+    """Saves as png a figure that has already been drawn on its canvas.
+    With an encoder, e.g. renderPipeline.FrameEncoder, a copy of the pixels is queued to be encoded in background.
+    With a compositor, e.g. compositor.DashboardCompositor, the frame it composes from the pixels, the frame number
+    idx_frame and the image idx_image is saved instead"""
+    if compositor is not None and hasattr(fig.canvas, 'buffer_rgba'):
+        with metrics.stage('compose'):
+            rgba = compositor.compose(np.asarray(fig.canvas.buffer_rgba()), idx_frame, idx_image)
+        with metrics.stage('encode'):
+            if encoder is not None:
+                encoder.submit(filename, rgba, fig.dpi)
+            else:
+                matplotlib.image.imsave(filename, rgba, format='png', dpi=fig.dpi)
+        return
+
+    with metrics.stage('encode'):
+        if encoder is not None and hasattr(fig.canvas, 'buffer_rgba'):
+            # The canvas is reused by the next frame
+            encoder.submit(filename, np.array(fig.canvas.buffer_rgba()), fig.dpi)
+        elif hasattr(fig.canvas, 'buffer_rgba'):
+            # Same steps as savefig for Agg canvases, without drawing the figure again
+            matplotlib.image.imsave(filename, np.asarray(fig.canvas.buffer_rgba()), format='png', dpi=fig.dpi)
+        else:
+            fig.savefig(filename)
@@ -1,16 +1,43 @@
 import time
+import contextlib
 from datetime import timedelta
+import numpy as np
 import src.mapplot as mapplot
 import src.mapplotAnimationHelpers as mapplotAnimationHelpers
 import src.helpers as helpers
+import src.renderMetrics as renderMetrics
+import src.cameraPlanner as cameraPlanner
+import src.zoomPlanner as zoomPlanner
+import src.renderPipeline as renderPipeline
+import src.track as track
+
+
+# MapPlot settings of each map preset
+PRESET_MAP_SETTINGS = {
+    'centered_on_location': {'maxtiles': 17, 'expect_const_area': True},  # Constant area reduces the map fetchs
+    'region_all_data': {'maxtiles': 32, 'expect_const_area': False},
+    'region_expanding_by_day': {'maxtiles': 16, 'expect_const_area': False},
+    'region_expanding_by_last_n_pics': {'maxtiles': 16, 'expect_const_area': False},
+}
+
+
+def get_preset_map(preset_name):
+    """Returns a new MapPlot with the settings of a map preset"""
+    settings = PRESET_MAP_SETTINGS[preset_name]
+    custom_obj_map = mapplot.MapPlot(maxtiles=settings['maxtiles'])
+    custom_obj_map.expect_const_area = settings['expect_const_area']
+    return custom_obj_map
 
 
 def get_index_close_to_timestamp(data_in, datetime_target):
     """Returns the index of the closest timestamp
-    :param data_in: Dictionary with exif/precise data
+    :param data_in: Track or dictionary with exif/precise data
     :param datetime_target: Target datetime object in UTC
     :return: Index of data_in list
     """
+    if isinstance(data_in, track.Track):
+        return get_index_close_to_timestamp_track(data_in, datetime_target)
+
     # Iterate through all data and check when the target is reached, then compare which sample is closest
     index_closest = 0
     for index_closest in range(1, len(data_in['timestampMs'])):
@@ -24,10 +51,33 @@ def get_index_close_to_timestamp(data_in, datetime_target):
     return index_closest
 
 
+def get_index_close_to_timestamp_track(data_in, datetime_target):
+    """Same as get_index_close_to_timestamp on the timestamp array of a Track"""
+    timestamp_ms = data_in.timestamp_ms
+    if len(timestamp_ms) < 2:
+        return 0
+    # Targets can have microseconds, e.g. on tween frames. Samples reach the target at its ms rounded up
+    target_us = (datetime_target - track.EPOCH) // timedelta(microseconds=1)
+    target_ms_ceil = -(-target_us // 1000)
+
+    # First sample from index 1 reaching the target, or the last one if none does
+    if data_in.is_sorted:
+        index_closest = max(1, int(np.searchsorted(timestamp_ms, target_ms_ceil, side='left')))
+    else:
+        list_reached = np.flatnonzero(timestamp_ms[1:] >= target_ms_ceil)
+        index_closest = int(list_reached[0]) + 1 if len(list_reached) else len(timestamp_ms)
+    if index_closest >= len(timestamp_ms):
+        return len(timestamp_ms) - 1
+
+    if target_us - int(timestamp_ms[index_closest - 1]) * 1000 < int(timestamp_ms[index_closest]) * 1000 - target_us:
+        index_closest -= 1
+    return index_closest
+
+
 def get_index_previous_timestamp(data_in, datetime_target, idx_start, idx_limit=0):
     """
     Returns index of the image with a timestamp previous of the input target
-    :param data_in: Dictionary with exif/precise data
+    :param data_in: Track or dictionary with exif/precise data
     :param datetime_target: Target datetime object in UTC
     :param idx_start: Sample from where the search is initiated. It goes backwards in the list
     :param idx_limit: Last valid sample in the list. To limit the search to part of the data
@@ -38,6 +88,15 @@ def get_index_previous_timestamp(data_in, datetime_target, idx_start, idx_limit=
 
     if idx_start <= idx_limit:
         idx_return = idx_limit
+    elif isinstance(data_in, track.Track):
+        # Last sample after idx_limit and up to idx_start that is not later than the target
+        target_ms = track.datetime_to_ms(datetime_target)
+        if data_in.is_sorted:
+            idx_return = min(idx_start, int(np.searchsorted(data_in.timestamp_ms, target_ms, side='right')) - 1)
+        else:
+            list_valid = np.flatnonzero(data_in.timestamp_ms[idx_limit + 1:idx_start + 1] <= target_ms)
+            idx_return = idx_limit + 1 + int(list_valid[-1]) if len(list_valid) else idx_limit
+        idx_return = max(idx_return, idx_limit)
     else:
         idx_return = idx_start + 1 #Loop starts by substracting
 
@@ -53,7 +112,234 @@ def get_index_previous_timestamp(data_in, datetime_target, idx_start, idx_limit=
     return idx_return
 
 
-def centered_on_location(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+def interpolate_position(data_in, idx_before, datetime_target):
+    """
+    Returns the lat,lon position at datetime_target interpolating linearly between two consecutive samples
+    :param data_in: Dictionary with precise data
+    :param idx_before: Index of the last sample with a timestamp previous or equal to datetime_target
+    :param datetime_target: Target datetime object in UTC
+    """
+    idx_after = min(idx_before + 1, len(data_in['timestampMs']) - 1)
+    span = data_in['timestampMs'][idx_after] - data_in['timestampMs'][idx_before]
+    fraction = 0.0
+    if span.total_seconds() > 0:
+        fraction = min(max((datetime_target - data_in['timestampMs'][idx_before]) / span, 0.0), 1.0)
+
+    lat_deg = data_in['latitude'][idx_before] + \
+        (data_in['latitude'][idx_after] - data_in['latitude'][idx_before]) * fraction
+    long_deg = data_in['longitude'][idx_before] + \
+        (data_in['longitude'][idx_after] - data_in['longitude'][idx_before]) * fraction
+    return lat_deg, long_deg
+
+
+def render_tween_frames(custom_obj_map, metrics, data_precise, idx_precise_day_start, idx_precise_from,
+                        idx_precise_to, n_tween, line_day, marker_precise, get_tween_bbox, idx_frame, idx_image,
+                        output_folder):
+    """
+    Renders the frames between two images reusing the plot of the first one. Only the trajectory of the day and the
+    marker are updated, the map is only reloaded if the view gets out of it.
+    Samples are taken by time, so the marker moves at the speed it was recorded. The day line is not split if the
+    local day changes between both images, the next image starts the new day as usual
+    :param custom_obj_map: MapPlot with the plot of the first image and its moving artists set
+    :param idx_precise_day_start: Index where the day line of the first image starts
+    :param idx_precise_from: Precise index aligned with the first image
+    :param idx_precise_to: Precise index aligned with the next image
+    :param n_tween: Number of frames between both images
+    :param line_day: Artist of the day trajectory to be extended
+    :param marker_precise: Artist of the position marker to be moved
+    :param get_tween_bbox: Function (lat_deg, long_deg, fraction) that returns the view (y_min, x_min, y_max, x_max)
+    :param idx_frame: Frame number of the first image. Tween frames are numbered after it
+    :param idx_image: Index of the first image in data_exif
+    :param output_folder: Folder where images will be stored
+    """
+    datetime_from = data_precise['timestampMs'][idx_precise_from]
+    datetime_to = data_precise['timestampMs'][idx_precise_to]
+
+    for k in range(1, n_tween + 1):
+        fraction = k / (n_tween + 1)
+        metrics.begin_frame(idx_frame + k)
+
+        with metrics.stage('alignment'):
+            datetime_tween = datetime_from + (datetime_to - datetime_from) * fraction
+            idx_precise_tween = get_index_previous_timestamp(
+                data_precise, datetime_tween, idx_precise_to, idx_precise_from)
+            lat_deg, long_deg = interpolate_position(data_precise, idx_precise_tween, datetime_tween)
+
+        custom_obj_map.update_view(*get_tween_bbox(lat_deg, long_deg, fraction))
+        custom_obj_map.update_list(
+            line_day,
+            list(data_precise['latitude'][idx_precise_day_start:idx_precise_tween + 1]) + [lat_deg],
+            list(data_precise['longitude'][idx_precise_day_start:idx_precise_tween + 1]) + [long_deg])
+        custom_obj_map.update_single_marker(marker_precise, lat_deg, long_deg)
+
+        custom_obj_map.save_plot(output_folder + str(idx_frame + k) + ".png", idx_frame + k, idx_image)
+        metrics.end_frame(custom_obj_map.get_stats())
+
+
+def get_view_centered_on_location(data_exif, data_precise, idx_image, margin=0.01):
+    """View of an image in centered_on_location: centered on its closest precise sample"""
+    idx_precise_image = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][idx_image])
+    return mapplot.bbox_around_point(
+        data_precise['latitude'][idx_precise_image], data_precise['longitude'][idx_precise_image], margin)
+
+
+def get_view_region_all_data(data_exif, data_precise, img_start, img_end, margin=0.1):
+    """View of all images in region_all_data: the precise samples from img_start to img_end"""
+    idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
+    idx_precise_last = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_end-1])
+
+    latitude = data_precise.latitude[idx_precise_first: idx_precise_last]
+    longitude = data_precise.longitude[idx_precise_first: idx_precise_last]
+    return mapplot.bbox_region_precise(latitude.min(), longitude.min(), latitude.max(), longitude.max(), margin)
+
+
+def get_view_expanding_by_day(data_exif, data_precise, idx_image, idx_precise_first, margin=0.01):
+    """
+    View of an image in region_expanding_by_day: all the precise samples of its local day up to the image
+    :param idx_precise_first: Precise index of the first image of the sequence. Days do not start before it
+    """
+    dt_image_day_start_in_utc = (data_exif['timestampMs_localtime'][idx_image].replace(
+        hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
+    idx_current = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][idx_image])
+    idx_day_start = get_index_previous_timestamp(
+        data_precise, dt_image_day_start_in_utc, idx_current, idx_precise_first)
+
+    if idx_day_start == idx_current:
+        return mapplot.bbox_around_point(
+            data_precise['latitude'][idx_current],
+            data_precise['longitude'][idx_current],
+            margin)
+    else:
+        latitude = data_precise.latitude[idx_day_start: idx_current]
+        longitude = data_precise.longitude[idx_day_start: idx_current]
+        return mapplot.bbox_region_precise(latitude.min(), longitude.min(), latitude.max(), longitude.max(), margin)
+
+
+def get_view_expanding_by_last_n_pics(data_exif, data_precise, idx_image, img_start, idx_precise_first, n_pics,
+                                      margin=0.005):
+    """
+    View of an image in region_expanding_by_last_n_pics: the precise samples of the last n_pics images up to it
+    :param img_start: First image of the sequence
+    :param idx_precise_first: Precise index of img_start
+    """
+    idx_current = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][idx_image])
+    if idx_image - img_start + 1 == 1:
+        region_lat_min = data_precise['latitude'][idx_precise_first] - margin
+        region_lon_min = data_precise['longitude'][idx_precise_first] - margin
+        region_lat_max = data_precise['latitude'][idx_precise_first] + margin
+        region_lon_max = data_precise['longitude'][idx_precise_first] + margin
+    else:
+        if idx_image - img_start + 1 <= n_pics:
+            idx_prev = idx_precise_first
+        else:
+            idx_prev = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][idx_image-n_pics])
+        latitude = data_precise.latitude[idx_prev: idx_current + 1]
+        longitude = data_precise.longitude[idx_prev: idx_current + 1]
+        region_lat_min, region_lat_max = latitude.min(), latitude.max()
+        region_lon_min, region_lon_max = longitude.min(), longitude.max()
+    return mapplot.bbox_region_square(region_lat_min, region_lon_min, region_lat_max, region_lon_max, margin)
+
+
+def get_camera_plan(custom_obj_map, get_image_view_bbox, img_start, img_end):
+    """
+    Plans the views and map loads of all images before rendering them and prints the map loads needed
+    :param custom_obj_map: MapPlot that will render the images. Its output size and tile budget are used
+    :param get_image_view_bbox: Function (idx_image) that returns the view (y_min, x_min, y_max, x_max) of an image
+    :return: CameraPlan. Frame 0 is img_start
+    """
+    obj_camera_plan = cameraPlanner.plan_camera(
+        [get_image_view_bbox(i) for i in range(img_start, img_end)], custom_obj_map.get_output_px(),
+        custom_obj_map.oversampling, custom_obj_map.maxtiles)
+    obj_camera_plan.print_report()
+    return obj_camera_plan
+
+
+def get_preset_views(preset_name, data_exif, data_precise, img_start, img_end, n_pics=7):
+    """Returns the view (y_min, x_min, y_max, x_max) of each image from img_start to img_end in a map preset"""
+    idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
+    list_view_bbox = []
+    for i in range(img_start, img_end):
+        if preset_name == 'centered_on_location':
+            list_view_bbox.append(get_view_centered_on_location(data_exif, data_precise, i))
+        elif preset_name == 'region_all_data':
+            list_view_bbox.append(get_view_region_all_data(data_exif, data_precise, img_start, img_end))
+        elif preset_name == 'region_expanding_by_day':
+            list_view_bbox.append(get_view_expanding_by_day(data_exif, data_precise, i, idx_precise_first))
+        elif preset_name == 'region_expanding_by_last_n_pics':
+            list_view_bbox.append(get_view_expanding_by_last_n_pics(
+                data_exif, data_precise, i, img_start, idx_precise_first, n_pics))
+        else:
+            raise Exception("Unknown map preset " + preset_name)
+    return list_view_bbox
+
+
+def get_preset_map_plans(preset_name, data_exif, data_precise, img_start, img_end, camera_plan=False):
+    """
+    Returns the ZoomPlan of each map a preset will load, in load order. Interpolated frames are not included
+    :param camera_plan: Plan the expanding presets with cameraPlanner, as their camera_plan parameter
+    """
+    custom_obj_map = get_preset_map(preset_name)
+    output_px = custom_obj_map.get_output_px()
+    list_view_bbox = get_preset_views(preset_name, data_exif, data_precise, img_start, img_end)
+
+    if camera_plan and preset_name in ('region_expanding_by_day', 'region_expanding_by_last_n_pics'):
+        obj_camera_plan = cameraPlanner.plan_camera(list_view_bbox, output_px, custom_obj_map.oversampling,
+                                                    custom_obj_map.maxtiles)
+        obj_camera_plan.print_report()
+        list_plans = [zoomPlanner.ZoomPlan(map_bbox, z, output_px) for map_bbox, z, _, _ in obj_camera_plan.list_maps]
+    else:
+        list_plans = [plan for _, plan in cameraPlanner.simulate_per_frame_maps(
+            list_view_bbox, output_px, custom_obj_map.oversampling, custom_obj_map.maxtiles,
+            custom_obj_map.expect_const_area)]
+    return list_plans
+
+
+def plan_preset_maps(preset_name, data_exif, data_precise, img_start, img_end=-1, camera_plan=False):
+    """
+    Predicts the maps a preset will download without rendering it. Interpolated frames are not included
+    :param camera_plan: Plan the expanding presets with cameraPlanner, as their camera_plan parameter
+    :return: Dictionary with the number of images, map loads and tiles
+    """
+    if img_end < 0:
+        img_end = len(data_exif['timestampMs'])
+    list_plans = get_preset_map_plans(preset_name, data_exif, data_precise, img_start, img_end, camera_plan)
+    dict_plan = {'images': img_end - img_start, 'map_loads': len(list_plans),
+                 'tiles': sum(plan.n_tiles for plan in list_plans)}
+    print("%s: %d images, %d map loads, %d tiles" % (
+        preset_name, dict_plan['images'], dict_plan['map_loads'], dict_plan['tiles']))
+    return dict_plan
+
+
+def get_render_pipeline(custom_obj_map, list_view_bbox, idx_first, look_ahead, obj_camera_plan=None, idx_plan=0):
+    """
+    Returns a RenderPipeline that downloads ahead the maps the images will load and encodes them in background.
+    Returns a null context if look_ahead is 0. Frames of the pipeline are image indexes from data_exif
+    :param custom_obj_map: MapPlot that will render the images
+    :param list_view_bbox: View (y_min, x_min, y_max, x_max) of each image from idx_first. Map loads are predicted by
+    replaying the MapPlot logic on them
+    :param idx_first: Index of the first view in list_view_bbox
+    :param look_ahead: Number of images whose maps can be downloaded ahead
+    :param obj_camera_plan: CameraPlan with the maps to be loaded. list_view_bbox is not used if given
+    :param idx_plan: Index of the first frame of the camera plan
+    """
+    if look_ahead <= 0:
+        return contextlib.nullcontext()
+
+    list_map_requests = []
+    if obj_camera_plan:
+        for map_bbox, z, idx_map_first, _ in obj_camera_plan.list_maps:
+            list_map_requests.append((idx_plan + idx_map_first, map_bbox, z))
+    elif custom_obj_map.z is None:
+        # Maps with a fixed zoom are downloaded when needed, smopy may change their zoom and area
+        for idx_load, plan in cameraPlanner.simulate_per_frame_maps(
+                list_view_bbox, custom_obj_map.get_output_px(), custom_obj_map.oversampling, custom_obj_map.maxtiles,
+                custom_obj_map.expect_const_area):
+            list_map_requests.append((idx_first + idx_load, plan.bbox, plan.z))
+    return renderPipeline.RenderPipeline(custom_obj_map, list_map_requests, look_ahead)
+
+
+def centered_on_location(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/",
+                         n_tween=0, metrics=None, look_ahead=0, idx_stop=-1, warm_up=False):
     """
     For each sample in data exif an image is generated centering the map view in the closest precise sample (by time)
     :param data_exif: Dictionary with exif data from the input images
@@ -63,77 +349,119 @@ def centered_on_location(data_exif, data_precise, img_start, img_end=-1, idx_con
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param n_tween: Number of interpolated frames rendered between consecutive images. The marker moves along the
+    precise samples between both images reusing the map and the drawn artists. Set to 0 to disable
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param look_ahead: Number of images whose maps are downloaded in background while the current one is drawn.
+    Frames are also encoded in background. Set to 0 to run every step in series
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
+    :param warm_up: Go through the images from img_start to idx_continue only updating the map, as a run from img_start
+    would. The images are then the same as in that run, tween frames and camera plan included
     """
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
+    idx_first = img_start if warm_up and idx_continue < idx_stop else idx_continue
 
     helpers.ensure_directory(output_folder)
-    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
+    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder, n_tween)
 
-    # custom_obj_map = mapplot.MapPlot()
-    custom_obj_map = mapplot.MapPlot(maxtiles=17)
-    custom_obj_map.expect_const_area = True  # To reduce the number of map fetchs
+    custom_obj_map = get_preset_map('centered_on_location')
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="centered_on_location")
+    custom_obj_map.metrics = metrics
 
     idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
+    margin = 0.01
 
     # ---------- Process loop ----------
-    time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
-        time_start_it = time.perf_counter()
-        # ---------- Set iteration values ----------
-        idx_animation = i - img_start + 1
-
-        datetime_target = data_exif['timestampMs'][i]
-        dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
-            hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
-
-        idx_exif = i
-
-        idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
-        idx_precise_day_start = get_index_previous_timestamp(data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
-
-        # ---------- Generate map and draw on it ----------
-        margin = 0.01
-        custom_obj_map.set_map_around_point(
-            data_precise['latitude'][idx_precise],
-            data_precise['longitude'][idx_precise],
-            margin)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
-            data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
-            lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
-            data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
-            lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_single_marker(
-            data_precise['latitude'][idx_precise],
-            data_precise['longitude'][idx_precise],
-            s_in=90, c_in='r', marker_in='o', zorder_in=100, edgecolors_in='k')  # moss green (#658b38)
-
-        if data_exif['has_gps'][idx_exif]:
-            custom_obj_map.draw_single_marker(
-                data_exif['latitude'][idx_exif],
-                data_exif['longitude'][idx_exif],
-                s_in=120, c_in='#03719c', marker_in='o', zorder_in=110, edgecolors_in='k')
+    list_view_bbox = [get_view_centered_on_location(data_exif, data_precise, i, margin)
+                      for i in range(idx_continue, idx_stop)]
+    with get_render_pipeline(custom_obj_map, list_view_bbox, idx_continue, look_ahead) as obj_pipeline:
+        time_start = time.perf_counter()
+        for i in range(idx_first, idx_stop):
+            # Images before idx_continue only update the map
+            custom_obj_map.b_warm_up = metrics.paused = i < idx_continue
+            time_start_it = time.perf_counter()
+            # ---------- Set iteration values ----------
+            idx_animation = i - img_start + 1
+            idx_frame = (idx_animation - 1) * (n_tween + 1) + 1
+
+            metrics.begin_frame(idx_frame)
+            if obj_pipeline:
+                obj_pipeline.begin_frame(i)
+
+            with metrics.stage('alignment'):
+                datetime_target = data_exif['timestampMs'][i]
+                dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
+                    hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
+
+                idx_exif = i
+
+                idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
+                idx_precise_day_start = get_index_previous_timestamp(
+                    data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
+
+            # ---------- Generate map and draw on it ----------
+            custom_obj_map.set_map_around_point(
+                data_precise['latitude'][idx_precise],
+                data_precise['longitude'][idx_precise],
+                margin)
 
-        # ---------- Export map and clear iteration variables ----------
-        custom_obj_map.save_plot(output_folder + str(idx_animation) + ".png")
-        custom_obj_map.clear()
+            def get_tween_bbox(lat_deg, long_deg, fraction):
+                """Tween frames keep the view centered on the moving marker"""
+                return mapplot.bbox_around_point(lat_deg, long_deg, margin)
 
-        # ---------- Console output ----------
-        mapplotAnimationHelpers.print_console(
-            idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
-        custom_obj_map.print_stats()
-        print("---- · ----")
+            custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
+                data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
+                lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
 
+            line_day = custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
+                data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
+                lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
 
-def region_all_data(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+            marker_precise = custom_obj_map.draw_single_marker(
+                data_precise['latitude'][idx_precise],
+                data_precise['longitude'][idx_precise],
+                s_in=90, c_in='r', marker_in='o', zorder_in=100, edgecolors_in='k')  # moss green (#658b38)
+
+            list_exif_markers = []
+            if data_exif['has_gps'][idx_exif]:
+                list_exif_markers.append(custom_obj_map.draw_single_marker(
+                    data_exif['latitude'][idx_exif],
+                    data_exif['longitude'][idx_exif],
+                    s_in=120, c_in='#03719c', marker_in='o', zorder_in=110, edgecolors_in='k'))
+
+            # ---------- Export map and clear iteration variables ----------
+            custom_obj_map.save_plot(output_folder + str(idx_frame) + ".png", idx_frame, i)
+            metrics.end_frame(custom_obj_map.get_stats())
+
+            if n_tween > 0 and i + 1 < img_end:
+                idx_precise_next = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i + 1])
+                custom_obj_map.set_moving_artists([line_day, marker_precise] + list_exif_markers)
+                render_tween_frames(custom_obj_map, metrics, data_precise, idx_precise_day_start, idx_precise,
+                                    idx_precise_next, n_tween, line_day, marker_precise, get_tween_bbox, idx_frame,
+                                    i, output_folder)
+            custom_obj_map.clear()
+
+            # ---------- Console output ----------
+            mapplotAnimationHelpers.print_console(
+                idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
+            custom_obj_map.print_stats()
+            print("---- · ----")
+
+    if obj_pipeline:
+        obj_pipeline.print_stats()
+    metrics.print_summary()
+
+
+def region_all_data(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/",
+                    n_tween=0, metrics=None, look_ahead=0, idx_stop=-1, warm_up=False):
     """
     For each sample in data exif an image is generated centering the map region the whole images take
     :param data_exif: Dictionary with exif data from the input images
@@ -143,78 +471,116 @@ def region_all_data(data_exif, data_precise, img_start, img_end=-1, idx_continue
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param n_tween: Number of interpolated frames rendered between consecutive images. The marker moves along the
+    precise samples between both images reusing the map and the drawn artists. Set to 0 to disable
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param look_ahead: Number of images whose maps are downloaded in background while the current one is drawn.
+    Frames are also encoded in background. Set to 0 to run every step in series
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
+    :param warm_up: Go through the images from img_start to idx_continue only updating the map, as a run from img_start
+    would. The images are then the same as in that run, tween frames and camera plan included
     """
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
+    idx_first = img_start if warm_up and idx_continue < idx_stop else idx_continue
 
     helpers.ensure_directory(output_folder)
-    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
+    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder, n_tween)
 
     idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
-    idx_precise_last = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_end-1])
-
-    region_lat_min = min(data_precise['latitude'][idx_precise_first: idx_precise_last])
-    region_lon_min = min(data_precise['longitude'][idx_precise_first: idx_precise_last])
-    region_lat_max = max(data_precise['latitude'][idx_precise_first: idx_precise_last])
-    region_lon_max = max(data_precise['longitude'][idx_precise_first: idx_precise_last])
+    bbox_region = get_view_region_all_data(data_exif, data_precise, img_start, img_end)
 
-    custom_obj_map = mapplot.MapPlot(maxtiles=32)
+    custom_obj_map = get_preset_map('region_all_data')
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="region_all_data")
+    custom_obj_map.metrics = metrics
 
     # ---------- Process loop ----------
-    time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
-        time_start_it = time.perf_counter()
-        # ---------- Set iteration values ----------
-        idx_animation = i - img_start + 1
-
-        datetime_target = data_exif['timestampMs'][i]
-        dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
-            hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
-
-        idx_exif = i
-
-        idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
-        idx_precise_day_start = get_index_previous_timestamp(data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
-
-        # ---------- Generate map and draw on it ----------
-        margin = 0.1
-        custom_obj_map.set_map_region_precise(region_lat_min,region_lon_min, region_lat_max, region_lon_max, margin)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
-            data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
-            lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
-            data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
-            lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_single_marker(
-            data_precise['latitude'][idx_precise],
-            data_precise['longitude'][idx_precise],
-            s_in=150, c_in='r', marker_in='o', zorder_in=110, edgecolors_in='k', linewidth_in=2)
-
-        if data_exif['has_gps'][idx_exif]:
-            custom_obj_map.draw_single_marker(
-                data_exif['latitude'][idx_exif],
-                data_exif['longitude'][idx_exif],
-                s_in=50, c_in='#03719c', marker_in='o', zorder_in=100, edgecolors_in='k')
-
-        # ---------- Export map and clear iteration variables ----------
-        custom_obj_map.save_plot(output_folder + str(idx_animation) + ".png")
-        custom_obj_map.clear()
-
-        # ---------- Console output ----------
-        mapplotAnimationHelpers.print_console(
-            idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
-        custom_obj_map.print_stats()
-        print("---- · ----")
-
-
-def region_expanding_by_day(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/"):
+    with get_render_pipeline(custom_obj_map, [bbox_region] * (idx_stop - idx_continue), idx_continue,
+                             look_ahead) as obj_pipeline:
+        time_start = time.perf_counter()
+        for i in range(idx_first, idx_stop):
+            # Images before idx_continue only update the map
+            custom_obj_map.b_warm_up = metrics.paused = i < idx_continue
+            time_start_it = time.perf_counter()
+            # ---------- Set iteration values ----------
+            idx_animation = i - img_start + 1
+            idx_frame = (idx_animation - 1) * (n_tween + 1) + 1
+
+            metrics.begin_frame(idx_frame)
+            if obj_pipeline:
+                obj_pipeline.begin_frame(i)
+
+            with metrics.stage('alignment'):
+                datetime_target = data_exif['timestampMs'][i]
+                dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
+                    hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
+
+                idx_exif = i
+
+                idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
+                idx_precise_day_start = get_index_previous_timestamp(
+                    data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
+
+            # ---------- Generate map and draw on it ----------
+            custom_obj_map.set_map(*bbox_region)
+
+            def get_tween_bbox(lat_deg, long_deg, fraction):
+                """The region is constant, tween frames only move the artists"""
+                return bbox_region
+
+            custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
+                data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
+                lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
+
+            line_day = custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
+                data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
+                lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
+
+            marker_precise = custom_obj_map.draw_single_marker(
+                data_precise['latitude'][idx_precise],
+                data_precise['longitude'][idx_precise],
+                s_in=150, c_in='r', marker_in='o', zorder_in=110, edgecolors_in='k', linewidth_in=2)
+
+            list_exif_markers = []
+            if data_exif['has_gps'][idx_exif]:
+                list_exif_markers.append(custom_obj_map.draw_single_marker(
+                    data_exif['latitude'][idx_exif],
+                    data_exif['longitude'][idx_exif],
+                    s_in=50, c_in='#03719c', marker_in='o', zorder_in=100, edgecolors_in='k'))
+
+            # ---------- Export map and clear iteration variables ----------
+            custom_obj_map.save_plot(output_folder + str(idx_frame) + ".png", idx_frame, i)
+            metrics.end_frame(custom_obj_map.get_stats())
+
+            if n_tween > 0 and i + 1 < img_end:
+                idx_precise_next = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i + 1])
+                custom_obj_map.set_moving_artists([line_day, marker_precise] + list_exif_markers)
+                render_tween_frames(custom_obj_map, metrics, data_precise, idx_precise_day_start, idx_precise,
+                                    idx_precise_next, n_tween, line_day, marker_precise, get_tween_bbox, idx_frame,
+                                    i, output_folder)
+            custom_obj_map.clear()
+
+            # ---------- Console output ----------
+            mapplotAnimationHelpers.print_console(
+                idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
+            custom_obj_map.print_stats()
+            print("---- · ----")
+
+    if obj_pipeline:
+        obj_pipeline.print_stats()
+    metrics.print_summary()
+
+
+def region_expanding_by_day(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, output_folder="test_output/",
+                            n_tween=0, metrics=None, camera_plan=False, look_ahead=0,
+                            idx_stop=-1, warm_up=False):
     """
     For each sample in data exif an image is generated showing all samples of the day in the map. The region expands to
     fit all samples of that day.
@@ -225,84 +591,139 @@ def region_expanding_by_day(data_exif, data_precise, img_start, img_end=-1, idx_
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param n_tween: Number of interpolated frames rendered between consecutive images. The marker moves along the
+    precise samples between both images reusing the map and the drawn artists. Set to 0 to disable
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param camera_plan: Plan the views of all images before rendering. Views are smoothed and each map is reused for
+    as many images as possible instead of being reloaded when the area shrinks
+    :param look_ahead: Number of images whose maps are downloaded in background while the current one is drawn.
+    Frames are also encoded in background. Set to 0 to run every step in series
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
+    :param warm_up: Go through the images from img_start to idx_continue only updating the map, as a run from img_start
+    would. The images are then the same as in that run, tween frames and camera plan included
     """
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
+    idx_first = img_start if warm_up and idx_continue < idx_stop else idx_continue
 
     helpers.ensure_directory(output_folder)
-    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
+    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder, n_tween)
 
-    custom_obj_map = mapplot.MapPlot()
+    custom_obj_map = get_preset_map('region_expanding_by_day')
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="region_expanding_by_day")
+    custom_obj_map.metrics = metrics
 
     idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
+    margin = 0.01
 
-    # ---------- Process loop ----------
-    time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
-        time_start_it = time.perf_counter()
-        # ---------- Set iteration values ----------
-        idx_animation = i - img_start + 1
-
-        datetime_target = data_exif['timestampMs'][i]
-        dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
-            hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
-
-        idx_exif = i
-
-        idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
-        idx_precise_day_start = get_index_previous_timestamp(data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
+    def get_image_view_bbox(idx_image):
+        """Area of all the precise samples of the day up to the image"""
+        return get_view_expanding_by_day(data_exif, data_precise, idx_image, idx_precise_first, margin)
 
-        # ---------- Generate map and draw on it ----------
-        margin = 0.01
+    obj_camera_plan = None
+    if camera_plan:
+        obj_camera_plan = get_camera_plan(custom_obj_map, get_image_view_bbox, img_start, img_end)
 
-        if idx_precise_day_start == idx_precise:
-            custom_obj_map.set_map_around_point(
+    # ---------- Process loop ----------
+    with get_render_pipeline(custom_obj_map, [get_image_view_bbox(i) for i in range(idx_continue, idx_stop)],
+                             idx_continue, look_ahead, obj_camera_plan, img_start) as obj_pipeline:
+        time_start = time.perf_counter()
+        for i in range(idx_first, idx_stop):
+            # Images before idx_continue only update the map
+            custom_obj_map.b_warm_up = metrics.paused = i < idx_continue
+            time_start_it = time.perf_counter()
+            # ---------- Set iteration values ----------
+            idx_animation = i - img_start + 1
+            idx_frame = (idx_animation - 1) * (n_tween + 1) + 1
+
+            metrics.begin_frame(idx_frame)
+            if obj_pipeline:
+                obj_pipeline.begin_frame(i)
+
+            with metrics.stage('alignment'):
+                datetime_target = data_exif['timestampMs'][i]
+                dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
+                    hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
+
+                idx_exif = i
+
+                idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
+                idx_precise_day_start = get_index_previous_timestamp(
+                    data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
+
+            # ---------- Generate map and draw on it ----------
+            if obj_camera_plan:
+                bbox_view = obj_camera_plan.list_view_bbox[i - img_start]
+                custom_obj_map.set_map_planned(bbox_view, *obj_camera_plan.get_map(i - img_start))
+            else:
+                bbox_view = get_image_view_bbox(i)
+                custom_obj_map.set_map(*bbox_view)
+
+            bbox_next = bbox_view
+            if n_tween > 0 and i + 1 < img_end:
+                if obj_camera_plan:
+                    bbox_next = obj_camera_plan.list_view_bbox[i + 1 - img_start]
+                else:
+                    bbox_next = get_image_view_bbox(i + 1)
+
+            def get_tween_bbox(lat_deg, long_deg, fraction):
+                """The view moves towards the one of the next image, always containing the moving marker"""
+                return mapplot.bbox_include_point(
+                    mapplot.bbox_interpolate(bbox_view, bbox_next, fraction), lat_deg, long_deg, margin)
+
+            custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
+                data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
+                lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
+
+            line_day = custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
+                data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
+                lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
+
+            marker_precise = custom_obj_map.draw_single_marker(
                 data_precise['latitude'][idx_precise],
                 data_precise['longitude'][idx_precise],
-                margin)
-        else:
-            region_lat_min = min(data_precise['latitude'][idx_precise_day_start: idx_precise])
-            region_lon_min = min(data_precise['longitude'][idx_precise_day_start: idx_precise])
-            region_lat_max = max(data_precise['latitude'][idx_precise_day_start: idx_precise])
-            region_lon_max = max(data_precise['longitude'][idx_precise_day_start: idx_precise])
-
-            custom_obj_map.set_map_region_precise(region_lat_min,region_lon_min, region_lat_max, region_lon_max, margin)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
-            data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
-            lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
-            data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
-            lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_single_marker(
-            data_precise['latitude'][idx_precise],
-            data_precise['longitude'][idx_precise],
-            s_in=90, c_in='r', marker_in='o', zorder_in=100, edgecolors_in='k')  # moss green (#658b38)
-
-        if data_exif['has_gps'][idx_exif]:
-            custom_obj_map.draw_single_marker(
-                data_exif['latitude'][idx_exif],
-                data_exif['longitude'][idx_exif],
-                s_in=120, c_in='#03719c', marker_in='o', zorder_in=110, edgecolors_in='k')
-
-        # ---------- Export map and clear iteration variables ----------
-        custom_obj_map.save_plot(output_folder + str(idx_animation) + ".png")
-        custom_obj_map.clear()
-
-        # ---------- Console output ----------
-        mapplotAnimationHelpers.print_console(
-            idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
-        custom_obj_map.print_stats()
-        print("---- · ----")
-
-
-def region_expanding_by_last_n_pics(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, n_pics=7, output_folder="test_output/"):
+                s_in=90, c_in='r', marker_in='o', zorder_in=100, edgecolors_in='k')  # moss green (#658b38)
+
+            list_exif_markers = []
+            if data_exif['has_gps'][idx_exif]:
+                list_exif_markers.append(custom_obj_map.draw_single_marker(
+                    data_exif['latitude'][idx_exif],
+                    data_exif['longitude'][idx_exif],
+                    s_in=120, c_in='#03719c', marker_in='o', zorder_in=110, edgecolors_in='k'))
+
+            # ---------- Export map and clear iteration variables ----------
+            custom_obj_map.save_plot(output_folder + str(idx_frame) + ".png", idx_frame, i)
+            metrics.end_frame(custom_obj_map.get_stats())
+
+            if n_tween > 0 and i + 1 < img_end:
+                idx_precise_next = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i + 1])
+                custom_obj_map.set_moving_artists([line_day, marker_precise] + list_exif_markers)
+                render_tween_frames(custom_obj_map, metrics, data_precise, idx_precise_day_start, idx_precise,
+                                    idx_precise_next, n_tween, line_day, marker_precise, get_tween_bbox, idx_frame,
+                                    i, output_folder)
+            custom_obj_map.clear()
+
+            # ---------- Console output ----------
+            mapplotAnimationHelpers.print_console(
+                idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
+            custom_obj_map.print_stats()
+            print("---- · ----")
+
+    if obj_pipeline:
+        obj_pipeline.print_stats()
+    metrics.print_summary()
+
+
+def region_expanding_by_last_n_pics(data_exif, data_precise, img_start, img_end=-1, idx_continue=0, n_pics=7, output_folder="test_output/",
+                                    n_tween=0, metrics=None, camera_plan=False, look_ahead=0,
+                                    idx_stop=-1, warm_up=False):
     """
     For each sample in data exif an image is generated showing the last N samples in the map. The region expands to
     fit all N samples.
@@ -313,94 +734,141 @@ def region_expanding_by_last_n_pics(data_exif, data_precise, img_start, img_end=
     :param idx_continue: Index to continue exporting data. The fcn will start at this idx, use in case an Exception
     raises to start from the last run iteration and not have to export already processed images
     :param output_folder: Folder where images will be stored
+    :param n_tween: Number of interpolated frames rendered between consecutive images. The marker moves along the
+    precise samples between both images reusing the map and the drawn artists. Set to 0 to disable
+    :param metrics: RenderMetrics that records the per stage timings. A new one is created if None
+    :param camera_plan: Plan the views of all images before rendering. Views are smoothed and each map is reused for
+    as many images as possible instead of being reloaded when the area shrinks
+    :param look_ahead: Number of images whose maps are downloaded in background while the current one is drawn.
+    Frames are also encoded in background. Set to 0 to run every step in series
+    :param idx_stop: Index where the fcn stops, not included. Same reference as idx_continue. Set to negative to
+    process up to img_end. Used to render a part of the images, e.g. a shard
+    :param warm_up: Go through the images from img_start to idx_continue only updating the map, as a run from img_start
+    would. The images are then the same as in that run, tween frames and camera plan included
     """
     # ---------- Sanitize inputs and initialize variables ----------
     if img_end < 0:
         img_end = len(data_exif['timestampMs'])
     idx_continue = idx_continue + img_start
+    idx_stop = img_end if idx_stop < 0 else min(idx_stop + img_start, img_end)
+    idx_first = img_start if warm_up and idx_continue < idx_stop else idx_continue
 
     if n_pics < 2:
         n_pics = 2
 
     helpers.ensure_directory(output_folder)
-    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder)
+    mapplotAnimationHelpers.sync_helper_file(img_start, img_end, data_exif['filename'], output_folder, n_tween)
 
-    custom_obj_map = mapplot.MapPlot()
+    custom_obj_map = get_preset_map('region_expanding_by_last_n_pics')
+    if metrics is None:
+        metrics = renderMetrics.RenderMetrics(name="region_expanding_by_last_n_pics")
+    custom_obj_map.metrics = metrics
 
     idx_precise_first = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][img_start])
+    margin = 0.005
+
+    def get_image_view_bbox(idx_image):
+        """Area of the precise samples of the last n_pics images up to the image"""
+        return get_view_expanding_by_last_n_pics(data_exif, data_precise, idx_image, img_start, idx_precise_first,
+                                                 n_pics, margin)
+
+    obj_camera_plan = None
+    if camera_plan:
+        obj_camera_plan = get_camera_plan(custom_obj_map, get_image_view_bbox, img_start, img_end)
 
     # ---------- Process loop ----------
-    time_start = time.perf_counter()
-    for i in range(idx_continue, img_end):
-        time_start_it = time.perf_counter()
-        # ---------- Set iteration values ----------
-        idx_animation = i - img_start + 1
-
-        datetime_target = data_exif['timestampMs'][i]
-        dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
-            hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
-
-        idx_exif = i
-
-        idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
-        idx_precise_day_start = get_index_previous_timestamp(data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
-
-        # ---------- Generate map and draw on it ----------
-        margin = 0.005
-
-        idx_prev = idx_precise_first
-        if idx_animation == 1:
-            region_lat_min = data_precise['latitude'][idx_precise_first] - margin
-            region_lon_min = data_precise['longitude'][idx_precise_first] - margin
-            region_lat_max = data_precise['latitude'][idx_precise_first] + margin
-            region_lon_max = data_precise['longitude'][idx_precise_first] + margin
-        elif idx_animation <= n_pics:
-            region_lat_min = min(data_precise['latitude'][idx_precise_first: idx_precise + 1])
-            region_lon_min = min(data_precise['longitude'][idx_precise_first: idx_precise + 1])
-            region_lat_max = max(data_precise['latitude'][idx_precise_first: idx_precise + 1])
-            region_lon_max = max(data_precise['longitude'][idx_precise_first: idx_precise + 1])
-        else:
-            idx_prev = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i-n_pics])
-            region_lat_min = min(data_precise['latitude'][idx_prev: idx_precise + 1])
-            region_lon_min = min(data_precise['longitude'][idx_prev: idx_precise + 1])
-            region_lat_max = max(data_precise['latitude'][idx_prev: idx_precise + 1])
-            region_lon_max = max(data_precise['longitude'][idx_prev: idx_precise + 1])
-
-
-        # Map will automatically download if the new region is smaller
-        custom_obj_map.set_map_region_square(region_lat_min, region_lon_min, region_lat_max, region_lon_max, margin)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
-            data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
-            lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_list(
-            data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
-            data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
-            lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
-
-        custom_obj_map.draw_single_marker(
-            data_precise['latitude'][idx_precise],
-            data_precise['longitude'][idx_precise],
-            s_in=100, c_in='r', marker_in='o', zorder_in=110, edgecolors_in='k')  # moss green (#658b38)
-
-        # Print degrading circles fixme
-        mark_s_max = 180
-        for j in range(n_pics):
-            mark_s_max = mark_s_max/1.5
-            if data_exif['has_gps'][idx_exif-j]:
-                custom_obj_map.draw_single_marker(
-                    data_exif['latitude'][idx_exif-j],
-                    data_exif['longitude'][idx_exif-j],
-                    s_in=mark_s_max, c_in='#03719c', marker_in='o', zorder_in=100, edgecolors_in='k')
-
-        # ---------- Export map and clear iteration variables ----------
-        custom_obj_map.save_plot(output_folder + str(idx_animation) + ".png")
-        custom_obj_map.clear()
-
-        # ---------- Console output ----------
-        mapplotAnimationHelpers.print_console(
-            idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
-        custom_obj_map.print_stats()
-        print("---- · ----")
+    with get_render_pipeline(custom_obj_map, [get_image_view_bbox(i) for i in range(idx_continue, idx_stop)],
+                             idx_continue, look_ahead, obj_camera_plan, img_start) as obj_pipeline:
+        time_start = time.perf_counter()
+        for i in range(idx_first, idx_stop):
+            # Images before idx_continue only update the map
+            custom_obj_map.b_warm_up = metrics.paused = i < idx_continue
+            time_start_it = time.perf_counter()
+            # ---------- Set iteration values ----------
+            idx_animation = i - img_start + 1
+            idx_frame = (idx_animation - 1) * (n_tween + 1) + 1
+
+            metrics.begin_frame(idx_frame)
+            if obj_pipeline:
+                obj_pipeline.begin_frame(i)
+
+            with metrics.stage('alignment'):
+                datetime_target = data_exif['timestampMs'][i]
+                dt_local_day_start_in_utc = (data_exif['timestampMs_localtime'][i].replace(
+                    hour=0, minute=0, second=0)) - timedelta(hours=data_exif['timezoneH'])
+
+                idx_exif = i
+
+                idx_precise = get_index_close_to_timestamp(data_precise, datetime_target)
+                idx_precise_day_start = get_index_previous_timestamp(
+                    data_precise, dt_local_day_start_in_utc, idx_precise, idx_precise_first)
+
+            # ---------- Generate map and draw on it ----------
+            if obj_camera_plan:
+                bbox_view = obj_camera_plan.list_view_bbox[i - img_start]
+                custom_obj_map.set_map_planned(bbox_view, *obj_camera_plan.get_map(i - img_start))
+            else:
+                # Map will automatically download if the new region is smaller
+                bbox_view = get_image_view_bbox(i)
+                custom_obj_map.set_map(*bbox_view)
+
+            bbox_next = bbox_view
+            if n_tween > 0 and i + 1 < img_end:
+                if obj_camera_plan:
+                    bbox_next = obj_camera_plan.list_view_bbox[i + 1 - img_start]
+                else:
+                    bbox_next = get_image_view_bbox(i + 1)
+
+            def get_tween_bbox(lat_deg, long_deg, fraction):
+                """The view moves towards the one of the next image, always containing the moving marker"""
+                return mapplot.bbox_include_point(
+                    mapplot.bbox_interpolate(bbox_view, bbox_next, fraction), lat_deg, long_deg, margin)
+
+            custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_first:idx_precise_day_start + 1],
+                data_precise['longitude'][idx_precise_first:idx_precise_day_start + 1],
+                lineop_in='-', c_in='#9a0200', ms_in=10, mew_in=1, lw_in=2)
+
+            line_day = custom_obj_map.draw_list(
+                data_precise['latitude'][idx_precise_day_start:idx_precise + 1],
+                data_precise['longitude'][idx_precise_day_start:idx_precise + 1],
+                lineop_in='-', c_in='r', ms_in=10, mew_in=1, lw_in=2)
+
+            marker_precise = custom_obj_map.draw_single_marker(
+                data_precise['latitude'][idx_precise],
+                data_precise['longitude'][idx_precise],
+                s_in=100, c_in='r', marker_in='o', zorder_in=110, edgecolors_in='k')  # moss green (#658b38)
+
+            # Print degrading circles fixme
+            mark_s_max = 180
+            list_exif_markers = []
+            # Images before img_start are not part of the sequence
+            for j in range(min(n_pics, idx_exif - img_start + 1)):
+                mark_s_max = mark_s_max/1.5
+                if data_exif['has_gps'][idx_exif-j]:
+                    list_exif_markers.append(custom_obj_map.draw_single_marker(
+                        data_exif['latitude'][idx_exif-j],
+                        data_exif['longitude'][idx_exif-j],
+                        s_in=mark_s_max, c_in='#03719c', marker_in='o', zorder_in=100, edgecolors_in='k'))
+
+            # ---------- Export map and clear iteration variables ----------
+            custom_obj_map.save_plot(output_folder + str(idx_frame) + ".png", idx_frame, i)
+            metrics.end_frame(custom_obj_map.get_stats())
+
+            if n_tween > 0 and i + 1 < img_end:
+                idx_precise_next = get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i + 1])
+                custom_obj_map.set_moving_artists([line_day, marker_precise] + list_exif_markers)
+                render_tween_frames(custom_obj_map, metrics, data_precise, idx_precise_day_start, idx_precise,
+                                    idx_precise_next, n_tween, line_day, marker_precise, get_tween_bbox, idx_frame,
+                                    i, output_folder)
+            custom_obj_map.clear()
+
+            # ---------- Console output ----------
+            mapplotAnimationHelpers.print_console(
+                idx_animation, img_start, img_end, time_start, time_start_it, data_exif['filename'][idx_exif])
+            custom_obj_map.print_stats()
+            print("---- · ----")
+
+    if obj_pipeline:
+        obj_pipeline.print_stats()
+    metrics.print_summary()
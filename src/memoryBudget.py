@@ -0,0 +1,84 @@
+import threading
+
+
+class MemoryBudget:
+    """
+    Memory shared by the mosaic cache, the prefetched maps and the frames waiting to be encoded. Each of them reserves
+    the bytes of an item before keeping it and releases them when the item is dropped. When a reservation does not fit,
+    the registered caches evict their least recently used items. The map and the figure being drawn are not counted
+    """
+
+    def __init__(self, max_mb=512):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.dict_owner_bytes = {}  # Owner name: bytes reserved
+        self.stats_refused = 0
+        self.stats_waits = 0
+        self.stats_over_budget = 0
+        self.list_evictors_ = []
+        self.condition_ = threading.Condition()
+
+    def add_evictor(self, fcn_evict):
+        """Registers a cache. fcn_evict(n_bytes) drops items, releasing them from the budget, until n_bytes are freed
+        or the cache is empty. Returns the bytes freed. It is called without the budget lock held"""
+        self.list_evictors_.append(fcn_evict)
+
+    def __add(self, owner, n_bytes):
+        self.used_bytes += n_bytes
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        self.dict_owner_bytes[owner] = self.dict_owner_bytes.get(owner, 0) + n_bytes
+
+    def reserve(self, owner, n_bytes, wait=False):
+        """
+        Reserves n_bytes for owner, evicting from the caches if they do not fit. Returns False if they still do not fit.
+        With wait it blocks instead until the owner releases some of its bytes. If the owner holds none nothing would
+        wake it up, so the bytes are reserved over the budget
+        """
+        while True:
+            with self.condition_:
+                if self.used_bytes + n_bytes <= self.max_bytes:
+                    self.__add(owner, n_bytes)
+                    return True
+                missing_bytes = self.used_bytes + n_bytes - self.max_bytes
+
+            # Caches release the bytes with their own locks held, so they are called without the budget lock
+            for fcn_evict in self.list_evictors_:
+                missing_bytes -= fcn_evict(missing_bytes)
+                if missing_bytes <= 0:
+                    break
+
+            with self.condition_:
+                if self.used_bytes + n_bytes <= self.max_bytes:
+                    self.__add(owner, n_bytes)
+                    return True
+                if not wait:
+                    self.stats_refused += 1
+                    return False
+                if not self.dict_owner_bytes.get(owner):
+                    self.stats_over_budget += 1
+                    self.__add(owner, n_bytes)
+                    return True
+                self.stats_waits += 1
+                self.condition_.wait()
+
+    def release(self, owner, n_bytes):
+        """Releases bytes reserved by owner"""
+        with self.condition_:
+            self.used_bytes -= n_bytes
+            self.dict_owner_bytes[owner] -= n_bytes
+            self.condition_.notify_all()
+
+    def get_stats(self):
+        """Returns the budget counters as a dictionary"""
+        with self.condition_:
+            return {'max_mb': self.max_bytes / 1024.0 / 1024.0, 'used_mb': self.used_bytes / 1024.0 / 1024.0,
+                    'peak_mb': self.peak_bytes / 1024.0 / 1024.0, 'refused': self.stats_refused,
+                    'waits': self.stats_waits, 'over_budget': self.stats_over_budget}
+
+    def print_stats(self):
+        """Prints the budget counters in the console"""
+        dict_stats = self.get_stats()
+        print("Memory budget: peak %.1f of %.1f MB, %d reservations refused, %d waits, %d over budget" % (
+            dict_stats['peak_mb'], dict_stats['max_mb'], dict_stats['refused'], dict_stats['waits'],
+            dict_stats['over_budget']))
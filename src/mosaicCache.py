@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+import src.renderPipeline as renderPipeline
+
+
+def get_image_size_bytes(img):
+    """Memory taken by a PIL image"""
+    return img.width * img.height * len(img.getbands())
+
+
+class MosaicCache:
+    """
+    Least recently used cache of assembled map mosaics, bounded by memory. Mosaics are keyed by zoom and tile range.
+    Shared by all the MapPlot objects through MapPlot.mosaic_cache, so a preset that returns to an area, or the next
+    preset over the same area, reuses the mosaic instead of downloading it again
+    """
+
+    def __init__(self, max_mb=256, memory_budget=None):
+        """
+        :param max_mb: Memory budget of the mosaics. The least recently used ones are dropped when exceeded
+        :param memory_budget: memoryBudget.MemoryBudget shared with other users. Mosaics are also dropped to fit in it
+        """
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.memory_budget = memory_budget
+        self.dict_mosaics_ = OrderedDict()  # Key: PIL image, from least to most recently used
+        self.size_bytes = 0
+        self.stats_hits = 0
+        self.stats_misses = 0
+        self.stats_evicted = 0
+        self.lock_ = threading.Lock()  # The map prefetcher checks the cache from its own thread
+        if memory_budget is not None:
+            memory_budget.add_evictor(self.evict)
+
+    def __len__(self):
+        return len(self.dict_mosaics_)
+
+    def find(self, box_tile, z, tilesize=256):
+        """
+        Returns the mosaic of a tile range cut from a cached mosaic at the same zoom that fully contains it, or None.
+        The result is the same image a new download of the range would give, so the map and its crop area do not
+        depend on what is cached. The smallest containing mosaic is preferred
+        """
+        _, x0, y0, x1, y1 = renderPipeline.get_mosaic_key(box_tile, z)
+        with self.lock_:
+            best_key = self.__find_key(z, x0, y0, x1, y1)
+            if best_key is None:
+                self.stats_misses += 1
+                return None
+            self.stats_hits += 1
+            self.dict_mosaics_.move_to_end(best_key)
+            img = self.dict_mosaics_[best_key]
+        if best_key == (z, x0, y0, x1, y1):
+            return img
+        left_px = (x0 - best_key[1]) * tilesize
+        top_px = (y0 - best_key[2]) * tilesize
+        return img.crop((left_px, top_px, left_px + (x1 - x0 + 1) * tilesize, top_px + (y1 - y0 + 1) * tilesize))
+
+    def __find_key(self, z, x0, y0, x1, y1):
+        """Key of the smallest cached mosaic at zoom z that contains the tile range, or None"""
+        best_key = None
+        for key, img in self.dict_mosaics_.items():
+            if key[0] != z or not (key[1] <= x0 and key[2] <= y0 and x1 <= key[3] and y1 <= key[4]):
+                continue
+            if best_key is None or img.width * img.height < self.dict_mosaics_[best_key].width * \
+                    self.dict_mosaics_[best_key].height:
+                best_key = key
+        return best_key
+
+    def contains(self, box_tile, z):
+        """True if find would return the mosaic of the tile range. Counters and order are not changed"""
+        with self.lock_:
+            return self.__find_key(*renderPipeline.get_mosaic_key(box_tile, z)) is not None
+
+    def __drop(self, key):
+        """Removes a mosaic and releases its memory. Called with the lock held"""
+        size_bytes = get_image_size_bytes(self.dict_mosaics_.pop(key))
+        self.size_bytes -= size_bytes
+        if self.memory_budget is not None:
+            self.memory_budget.release('mosaic_cache', size_bytes)
+        return size_bytes
+
+    def add(self, box_tile, z, img):
+        """Stores the mosaic of a tile range. Mosaics larger than the whole budget, or that do not fit in the shared
+        memory budget, are not stored"""
+        key = renderPipeline.get_mosaic_key(box_tile, z)
+        size_bytes = get_image_size_bytes(img)
+        with self.lock_:
+            if key in self.dict_mosaics_:
+                self.__drop(key)
+        if size_bytes > self.max_bytes:
+            return
+        # Outside the lock, the shared budget can call evict to make room
+        if self.memory_budget is not None and not self.memory_budget.reserve('mosaic_cache', size_bytes):
+            return
+        with self.lock_:
+            self.dict_mosaics_[key] = img
+            self.size_bytes += size_bytes
+            while self.size_bytes > self.max_bytes:
+                self.__drop(next(iter(self.dict_mosaics_)))
+                self.stats_evicted += 1
+
+    def evict(self, n_bytes):
+        """Drops the least recently used mosaics until n_bytes are freed. Returns the bytes freed"""
+        freed_bytes = 0
+        with self.lock_:
+            while freed_bytes < n_bytes and self.dict_mosaics_:
+                freed_bytes += self.__drop(next(iter(self.dict_mosaics_)))
+                self.stats_evicted += 1
+        return freed_bytes
+
+    def clear(self):
+        """Drops all the mosaics. Counters are kept"""
+        with self.lock_:
+            while self.dict_mosaics_:
+                self.__drop(next(iter(self.dict_mosaics_)))
+
+    def get_hit_rate(self):
+        """Ratio of lookups served from the cache"""
+        n_lookups = self.stats_hits + self.stats_misses
+        return self.stats_hits / float(n_lookups) if n_lookups else 0.0
+
+    def print_stats(self):
+        """Prints the cache counters in the console"""
+        print("Mosaic cache: %.1f%% hit rate (%d hits, %d misses), %d mosaics in %.1f MB, %d evicted" % (
+            self.get_hit_rate() * 100, self.stats_hits, self.stats_misses, len(self.dict_mosaics_),
+            self.size_bytes / 1024.0 / 1024.0, self.stats_evicted))
@@ -0,0 +1,109 @@
+import json
+import time
+from contextlib import contextmanager
+
+# Stages recorded on each frame. Any other name can be used, these are the ones the presets report
+STAGES = ('alignment', 'map', 'projection', 'drawing', 'raster', 'compose', 'encode')
+
+
+def percentile(list_values, pct):
+    """Nearest rank percentile of a list of values. Returns 0 for empty lists"""
+    if not list_values:
+        return 0.0
+    list_sorted = sorted(list_values)
+    idx = int(round(pct / 100.0 * (len(list_sorted) - 1)))
+    return list_sorted[idx]
+
+
+class RenderMetrics:
+    """Records per frame timings of each render stage and the map counters.
+    Each finished frame is appended as a json line to jsonl_path and/or passed to callback(record)"""
+
+    def __init__(self, jsonl_path=None, callback=None, name=""):
+        self.name = name
+        self.callback = callback
+        self.f_jsonl_ = open(jsonl_path, 'a') if jsonl_path else None
+
+        self.frame_ = None
+        self.frame_stages_ = {}
+        self.time_start_frame_ = 0
+        self.dict_stage_times = {}  # Stage name: list of seconds per frame
+        self.list_frame_times = []
+        self.last_counters = {}
+        self.paused = False  # Frames ended while paused are discarded, e.g. the warm up frames of MapPlot
+
+    def begin_frame(self, idx_animation):
+        """Starts recording a new frame"""
+        self.frame_ = idx_animation
+        self.frame_stages_ = {}
+        self.time_start_frame_ = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage_name):
+        """Context manager that adds the elapsed time to stage_name in the current frame"""
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.frame_stages_[stage_name] = self.frame_stages_.get(stage_name, 0.0) + \
+                                             time.perf_counter() - time_start
+
+    def end_frame(self, counters=None):
+        """Closes the current frame, stores it and sends the record to the outputs. Returns the record"""
+        if self.paused:
+            self.frame_stages_ = {}
+            return None
+        time_total = time.perf_counter() - self.time_start_frame_
+        record = {'preset': self.name, 'frame': self.frame_, 'total_s': time_total, 'stages': self.frame_stages_,
+                  'counters': counters or {}}
+
+        for stage_name, seconds in self.frame_stages_.items():
+            self.dict_stage_times.setdefault(stage_name, []).append(seconds)
+        self.list_frame_times.append(time_total)
+        self.last_counters = record['counters']
+
+        if self.f_jsonl_:
+            self.f_jsonl_.write(json.dumps(record) + '\n')
+            self.f_jsonl_.flush()
+        if self.callback:
+            self.callback(record)
+
+        self.frame_stages_ = {}
+        return record
+
+    def summary(self):
+        """Returns a dictionary with p50, p95 and total seconds of every stage, plus the frame totals"""
+        dict_summary = {}
+        list_names = [s for s in STAGES if s in self.dict_stage_times] + \
+                     [s for s in self.dict_stage_times if s not in STAGES]
+        for stage_name in list_names + ['frame']:
+            list_times = self.list_frame_times if stage_name == 'frame' else self.dict_stage_times[stage_name]
+            dict_summary[stage_name] = {'p50': percentile(list_times, 50), 'p95': percentile(list_times, 95),
+                                        'total': sum(list_times)}
+        return dict_summary
+
+    def print_summary(self):
+        """Prints the per stage summary in the console"""
+        dict_summary = self.summary()
+        time_total = dict_summary['frame']['total']
+        print("Stage timings %s(%d frames)" % (self.name + " " if self.name else "", len(self.list_frame_times)))
+        print("  %-12s %9s %9s %9s %6s" % ("stage", "p50 s", "p95 s", "total s", "share"))
+        for stage_name, values in dict_summary.items():
+            share = values['total'] / time_total * 100 if time_total > 0 else 0
+            print("  %-12s %9.4f %9.4f %9.2f %5.1f%%" % (stage_name, values['p50'], values['p95'],
+                                                        values['total'], share))
+        if self.last_counters:
+            print("  " + ", ".join("%s %s" % (k, v) for k, v in self.last_counters.items()))
+
+    def close(self):
+        """Closes the json lines file"""
+        if self.f_jsonl_:
+            self.f_jsonl_.close()
+            self.f_jsonl_ = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
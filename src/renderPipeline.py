@@ -0,0 +1,252 @@
+import queue
+import threading
+import matplotlib.image
+import smopy
+
+
+def get_mosaic_key(box_tile, z):
+    """Key of a mosaic: zoom and tile range as smopy fetches it"""
+    return (z,) + tuple(smopy.correct_box(box_tile, z))
+
+
+class MapPrefetcher:
+    """
+    Downloads in a background thread the map mosaics that the next frames will load. MapPlot takes them through
+    get_mosaic. Mosaics are fetched in frame order and no further than look_ahead frames from the current one.
+    Maps that were not predicted, or whose download failed, are downloaded in the calling thread as usual
+    """
+
+    def __init__(self, list_map_requests, tileserver, maxtiles, download_delay_s, look_ahead=2, tilesize=256,
+                 mosaic_cache=None, memory_budget=None, tile_source=None):
+        """
+        :param list_map_requests: List of (idx_frame, bbox, z) of the maps to be loaded, ordered by idx_frame
+        :param download_delay_s: Wait after each mosaic download. Keep in mind OSM terms of service
+        :param look_ahead: Maximum number of frames between the current frame and the prefetched maps
+        :param mosaic_cache: MosaicCache of the maps. Mosaics it already has are not prefetched
+        :param memory_budget: memoryBudget.MemoryBudget for the prefetched mosaics. Maps that do not fit are not
+        prefetched
+        :param tile_source: Object with a get_mosaic method the mosaics are taken from instead of downloading them, e.g.
+        vectorBasemap.VectorTileSource. There is no wait after them
+        """
+        self.mosaic_cache = mosaic_cache
+        self.tile_source = tile_source
+        self.memory_budget = memory_budget
+        self.tileserver = tileserver
+        self.maxtiles = maxtiles
+        self.tilesize = tilesize
+        self.download_delay_s = download_delay_s
+        self.look_ahead = look_ahead
+        self.stats_prefetched = 0
+        self.stats_missed = 0
+        self.stats_skipped = 0  # Not prefetched for lack of memory
+
+        self.list_requests_ = [(idx_frame, get_mosaic_key(smopy.get_tile_box(bbox, z), z))
+                               for idx_frame, bbox, z in list_map_requests]
+        # Last frame that uses each mosaic, to drop it afterwards
+        self.dict_last_use_ = {}
+        for idx_frame, key in self.list_requests_:
+            self.dict_last_use_[key] = max(idx_frame, self.dict_last_use_.get(key, idx_frame))
+
+        self.condition_ = threading.Condition()
+        self.current_frame_ = 0
+        self.dict_ready_ = {}  # Key: PIL image
+        self.dict_reserved_ = {}  # Key: bytes reserved in the memory budget
+        self.set_taken_ = set()  # Keys downloaded by the main thread, not to be fetched again
+        self.key_in_flight_ = None
+        self.stop_event_ = threading.Event()
+        self.thread_ = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        """Starts the download thread"""
+        self.thread_.start()
+        return self
+
+    def __run(self):
+        """Download thread. Errors are not raised here, the main thread downloads the map again when needed"""
+        for idx_frame, key in self.list_requests_:
+            with self.condition_:
+                self.condition_.wait_for(
+                    lambda: self.stop_event_.is_set() or idx_frame <= self.current_frame_ + self.look_ahead)
+                if self.stop_event_.is_set():
+                    return
+                if idx_frame < self.current_frame_ or key in self.dict_ready_ or key in self.set_taken_:
+                    continue
+                if self.mosaic_cache is not None and self.mosaic_cache.contains(key[1:], key[0]):
+                    continue
+                self.key_in_flight_ = key
+
+            # The main thread downloads the maps that do not fit when it needs them
+            size_bytes = (key[3] - key[1] + 1) * (key[4] - key[2] + 1) * self.tilesize ** 2 * 3
+            if self.memory_budget is not None and not self.memory_budget.reserve('prefetch', size_bytes):
+                with self.condition_:
+                    self.stats_skipped += 1
+                    self.key_in_flight_ = None
+                    self.condition_.notify_all()
+                continue
+
+            img = None
+            try:
+                img = self.__fetch(key[1:], key[0], self.tileserver, self.tilesize, self.maxtiles)
+            except Exception:
+                pass
+
+            with self.condition_:
+                if img is not None:
+                    self.dict_ready_[key] = img
+                    self.dict_reserved_[key] = size_bytes
+                elif self.memory_budget is not None:
+                    self.memory_budget.release('prefetch', size_bytes)
+                self.key_in_flight_ = None
+                self.condition_.notify_all()
+            if img is not None and self.tile_source is None and self.stop_event_.wait(self.download_delay_s):
+                return
+
+    def __fetch(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Takes a mosaic from the tile source, or downloads it"""
+        if self.tile_source is not None:
+            return self.tile_source.get_mosaic(box_tile, z, tileserver, tilesize, maxtiles)
+        return smopy.fetch_map(box_tile, z, tileserver, tilesize, maxtiles)
+
+    def advance(self, idx_frame):
+        """Sets the frame being rendered. Allows the prefetch of the next frames and drops the mosaics already used"""
+        with self.condition_:
+            self.current_frame_ = idx_frame
+            for key in [k for k in self.dict_ready_ if self.dict_last_use_.get(k, -1) < idx_frame]:
+                self.__drop(key)
+            self.condition_.notify_all()
+
+    def __drop(self, key):
+        """Removes a prefetched mosaic and releases its memory. Called with the condition held"""
+        del self.dict_ready_[key]
+        size_bytes = self.dict_reserved_.pop(key, 0)
+        if self.memory_budget is not None and size_bytes:
+            self.memory_budget.release('prefetch', size_bytes)
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Returns the PIL mosaic of a tile range. Same arguments as smopy.fetch_map"""
+        key = get_mosaic_key(box_tile, z)
+        with self.condition_:
+            self.condition_.wait_for(lambda: self.key_in_flight_ != key)
+            img = self.dict_ready_.get(key)
+            if img is None:
+                self.set_taken_.add(key)
+        if img is not None:
+            self.stats_prefetched += 1
+            return img
+
+        self.stats_missed += 1
+        img = self.__fetch(box_tile, z, tileserver, tilesize, maxtiles)
+        if self.tile_source is None:
+            self.stop_event_.wait(self.download_delay_s)
+        return img
+
+    def stop(self):
+        """Stops the download thread. A download in progress is finished before"""
+        self.stop_event_.set()
+        with self.condition_:
+            self.condition_.notify_all()
+        if self.thread_.is_alive():
+            self.thread_.join()
+        with self.condition_:
+            for key in list(self.dict_ready_):
+                self.__drop(key)
+
+
+class FrameEncoder:
+    """Encodes rendered frames as png in a background thread. Frames are written in the order they are submitted.
+    The queue is bounded, submit blocks while max_pending frames are waiting"""
+
+    def __init__(self, max_pending=2, memory_budget=None):
+        """:param memory_budget: memoryBudget.MemoryBudget for the queued frames. submit waits while they do not fit"""
+        self.memory_budget = memory_budget
+        self.queue_ = queue.Queue(maxsize=max_pending)
+        self.error_ = None
+        self.thread_ = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        """Starts the encoding thread"""
+        self.thread_.start()
+        return self
+
+    def __run(self):
+        while True:
+            item = self.queue_.get()
+            if item is None:
+                return
+            filename, rgba, dpi = item
+            if self.error_ is None:
+                try:
+                    matplotlib.image.imsave(filename, rgba, format='png', dpi=dpi)
+                except Exception as e:
+                    self.error_ = e
+            if self.memory_budget is not None:
+                self.memory_budget.release('encoder', rgba.nbytes)
+
+    def submit(self, filename, rgba, dpi):
+        """Queues a frame. rgba must not be modified afterwards. Raises the error of a previous frame, if any"""
+        if self.error_ is not None:
+            raise self.error_
+        if self.memory_budget is not None:
+            self.memory_budget.reserve('encoder', rgba.nbytes, wait=True)
+        self.queue_.put((filename, rgba, dpi))
+
+    def close(self, cancel=False):
+        """Waits until all queued frames are written. With cancel the frames not started yet are dropped"""
+        if cancel:
+            try:
+                while True:
+                    item = self.queue_.get_nowait()
+                    if item is not None and self.memory_budget is not None:
+                        self.memory_budget.release('encoder', item[1].nbytes)
+            except queue.Empty:
+                pass
+        if self.thread_.is_alive():
+            self.queue_.put(None)
+            self.thread_.join()
+        if self.error_ is not None and not cancel:
+            raise self.error_
+
+
+class RenderPipeline:
+    """
+    Overlaps the stages of a preset loop: while frame i is drawn, the maps of the next frames are downloaded and the
+    previous frames are encoded. Use as a context manager around the loop and call begin_frame on each frame.
+    On an exception inside the block the threads are stopped and the frames not encoded yet are dropped
+    """
+
+    def __init__(self, obj_map, list_map_requests, look_ahead=2, max_pending_frames=2):
+        """
+        :param obj_map: MapPlot used by the preset. Its tile source and encoder are set while the pipeline runs
+        :param list_map_requests: List of (idx_frame, bbox, z) of the maps the frames will load, ordered by idx_frame
+        :param look_ahead: Number of frames whose maps can be downloaded ahead
+        :param max_pending_frames: Rendered frames waiting to be encoded before the loop is blocked
+        """
+        self.obj_map = obj_map
+        if obj_map.get_view_source() is not None:
+            # The maps are blank, their views are drawn when shown
+            list_map_requests = []
+        self.prefetcher = MapPrefetcher(list_map_requests, obj_map.tileserver, obj_map.maxtiles,
+                                        obj_map.download_delay_s, look_ahead, mosaic_cache=obj_map.mosaic_cache,
+                                        memory_budget=obj_map.memory_budget, tile_source=obj_map.default_tile_source)
+        self.encoder = FrameEncoder(max_pending_frames, obj_map.memory_budget)
+
+    def __enter__(self):
+        self.obj_map.tile_source = self.prefetcher.start()
+        self.obj_map.encoder = self.encoder.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.obj_map.tile_source = self.obj_map.default_tile_source
+        self.obj_map.encoder = None
+        self.prefetcher.stop()
+        self.encoder.close(cancel=exc_type is not None)
+        return False
+
+    def begin_frame(self, idx_frame):
+        """Sets the frame being rendered. idx_frame uses the same numbering as list_map_requests"""
+        self.prefetcher.advance(idx_frame)
+
+    def print_stats(self):
+        """Prints how many maps were ready when needed"""
+        print("Pipeline: %d maps prefetched, %d downloaded when needed, %d not prefetched for lack of memory" % (
+            self.prefetcher.stats_prefetched, self.prefetcher.stats_missed, self.prefetcher.stats_skipped))
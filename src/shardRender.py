@@ -0,0 +1,211 @@
+import os
+import json
+import shutil
+import contextlib
+import importlib
+import src.helpers as helpers
+import src.track as track
+import src.mapplotAnimationHelpers as mapplotAnimationHelpers
+import src.mapplotAnimationPresets as mapplotAnimationPresets
+
+MANIFEST_VERSION = 1
+
+
+def track_to_json(obj_track):
+    """Returns the columns of a Track as a dictionary that can be stored as json. Floats keep their exact value"""
+    return {'timestamp_ms': obj_track.timestamp_ms.tolist(),
+            'latitude': obj_track.latitude.tolist(),
+            'longitude': obj_track.longitude.tolist(),
+            'has_gps': obj_track.has_gps.tolist(),
+            'filename': None if obj_track.filename is None else obj_track.filename.tolist(),
+            'pic_idx': None if obj_track.pic_idx is None else obj_track.pic_idx.tolist(),
+            'timezone_h': obj_track.timezone_h,
+            'is_sorted': obj_track.is_sorted}
+
+
+def track_from_json(dict_track):
+    """Creates a Track from the dictionary given by track_to_json"""
+    return track.Track(dict_track['timestamp_ms'], dict_track['latitude'], dict_track['longitude'],
+                       dict_track['has_gps'], dict_track['filename'], dict_track['pic_idx'], dict_track['timezone_h'],
+                       dict_track['is_sorted'])
+
+
+def get_data_slices(data_exif, data_precise, img_start, img_end):
+    """
+    Returns the exif and precise samples used by the images from img_start to img_end, as Tracks starting at index 0.
+    Precise samples go from the first one aligned with an image to the one after the last aligned, which is the last
+    sample the alignment and the interpolation can reach. Unsorted precise data is kept whole
+    :param data_precise: Precise Track, or None for presets that only use the exif data
+    """
+    exif_slice = data_exif.view(img_start, img_end)
+    if data_precise is None or not data_precise.is_sorted:
+        return exif_slice, data_precise
+
+    list_idx_precise = [mapplotAnimationPresets.get_index_close_to_timestamp(data_precise, data_exif['timestampMs'][i])
+                        for i in range(img_start, img_end)]
+    return exif_slice, data_precise.view(min(list_idx_precise), max(list_idx_precise) + 2)
+
+
+def get_frame_range(idx_start, idx_stop, n_images, n_tween=0):
+    """
+    Returns the first and last frame, both included, of the images from idx_start to idx_stop. The frames of an image
+    are the image itself and the tween frames that follow it. Same numbering as the presets
+    """
+    frame_first = idx_start * (n_tween + 1) + 1
+    frame_last = (idx_stop - 1) * (n_tween + 1) + 1
+    if idx_stop < n_images:
+        frame_last += n_tween
+    return frame_first, frame_last
+
+
+def plan_shards(manifest_path, data_exif, data_precise, img_start, img_end, n_shards, list_presets):
+    """
+    Writes a job manifest that splits the rendering of some presets in independent shards. Each shard renders a
+    contiguous range of images of every preset. The manifest holds the data slices of the sequence, so a shard only
+    needs the manifest to run
+    :param data_precise: Track with the data used to draw the trayectory. None if no map preset is rendered
+    :param img_start: First image of the sequence. Index from data_exif
+    :param img_end: Last image of the sequence, not included. Set to negative to use all data in data_exif
+    :param n_shards: Number of shards. Lowered to the number of images if there are less
+    :param list_presets: List of dictionaries with the name of the preset, its module and function, the subfolder
+    of its images, whether it needs the precise data and the params passed to it
+    :return: Manifest dictionary
+    """
+    if img_end < 0:
+        img_end = len(data_exif['timestampMs'])
+    n_images = img_end - img_start
+    if n_images <= 0:
+        raise Exception("No images to render between %d and %d" % (img_start, img_end))
+    n_shards = max(1, min(n_shards, n_images))
+
+    b_needs_location = any(preset['needs_location'] for preset in list_presets)
+    exif_slice, precise_slice = get_data_slices(data_exif, data_precise if b_needs_location else None,
+                                                img_start, img_end)
+
+    list_shards = []
+    for k in range(n_shards):
+        idx_start = k * n_images // n_shards
+        idx_stop = (k + 1) * n_images // n_shards
+        dict_frames = {preset['name']: get_frame_range(idx_start, idx_stop, n_images,
+                                                       preset['params'].get('n_tween', 0))
+                       for preset in list_presets}
+        list_shards.append({'shard': k, 'idx_start': idx_start, 'idx_stop': idx_stop, 'frames': dict_frames})
+
+    manifest = {'version': MANIFEST_VERSION, 'img_start': img_start, 'img_end': img_end, 'n_images': n_images,
+                'presets': list_presets, 'shards': list_shards, 'exif': track_to_json(exif_slice),
+                'precise': None if precise_slice is None else track_to_json(precise_slice)}
+    with open(manifest_path, 'w') as f_out:
+        json.dump(manifest, f_out)
+    print("Manifest with %d images in %d shards: %s" % (n_images, n_shards, manifest_path))
+    return manifest
+
+
+def get_shard_folder(shards_folder, idx_shard):
+    """Output folder of a shard inside the folder with all the shards"""
+    return shards_folder + "%d/" % idx_shard
+
+
+def load_manifest(manifest_path):
+    """Loads a job manifest written by plan_shards"""
+    with open(manifest_path) as f_in:
+        manifest = json.load(f_in)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise Exception("Unsupported manifest version %s in %s" % (manifest.get('version'), manifest_path))
+    return manifest
+
+
+def get_manifest_map_plans(manifest_path):
+    """Returns the ZoomPlans of the maps that the map presets of a manifest load over the whole sequence"""
+    manifest = load_manifest(manifest_path)
+    data_exif = track_from_json(manifest['exif'])
+    data_precise = track_from_json(manifest['precise']) if manifest['precise'] else None
+    list_plans = []
+    for preset in manifest['presets']:
+        if preset['needs_location']:
+            list_plans += mapplotAnimationPresets.get_preset_map_plans(
+                preset['function'], data_exif, data_precise, 0, manifest['n_images'],
+                preset['params'].get('camera_plan', False))
+    return list_plans
+
+
+def run_shard(manifest_path, idx_shard, output_folder, look_ahead=0, metrics_folder=None):
+    """
+    Renders the images of a shard for every preset in the manifest. The images are the same a single run of the whole
+    sequence gives: map presets first go through the previous images only updating the map (see warm_up)
+    :param output_folder: Folder where the preset subfolders are created. Can be the final folder if it is shared
+    :param look_ahead: Passed to the map presets. Does not change the images
+    :param metrics_folder: Folder where the per frame stage timings are stored as json lines. None to not store them
+    """
+    import src.renderMetrics as renderMetrics
+    manifest = load_manifest(manifest_path)
+    if not 0 <= idx_shard < len(manifest['shards']):
+        raise Exception("Shard %d not in manifest, it has %d shards" % (idx_shard, len(manifest['shards'])))
+    shard = manifest['shards'][idx_shard]
+    data_exif = track_from_json(manifest['exif'])
+    data_precise = track_from_json(manifest['precise']) if manifest['precise'] else None
+    n_images = manifest['n_images']
+
+    for preset in manifest['presets']:
+        preset_fcn = getattr(importlib.import_module(preset['module']), preset['function'])
+        kwargs = dict(preset['params'])
+        metrics = None
+        if metrics_folder:
+            helpers.ensure_directory(metrics_folder)
+            metrics = renderMetrics.RenderMetrics(
+                metrics_folder + "%s_shard%d.jsonl" % (preset['name'], idx_shard), name=preset['name'])
+            kwargs['metrics'] = metrics
+        with metrics or contextlib.nullcontext():
+            if preset['needs_location']:
+                preset_fcn(data_exif, data_precise, 0, n_images, idx_continue=shard['idx_start'],
+                           output_folder=output_folder + preset['subfolder'], idx_stop=shard['idx_stop'],
+                           look_ahead=look_ahead, warm_up=True, **kwargs)
+            else:
+                preset_fcn(data_exif, 0, n_images, idx_continue=shard['idx_start'],
+                           output_folder=output_folder + preset['subfolder'], idx_stop=shard['idx_stop'], **kwargs)
+    print("SHARD %d ENDED - images %d to %d" % (idx_shard, shard['idx_start'], shard['idx_stop'] - 1))
+
+
+def merge_shards(manifest_path, shards_folder, output_folder):
+    """
+    Checks that every frame of every preset is present, copies them from the shard folders into output_folder and
+    rebuilds the syncfile of each preset. Nothing is copied if a frame is missing
+    :param shards_folder: Folder with the output folder of each shard, as given by get_shard_folder
+    :return: Number of frames merged
+    """
+    manifest = load_manifest(manifest_path)
+    list_shard_folders = [get_shard_folder(shards_folder, shard['shard']) for shard in manifest['shards']]
+    n_images = manifest['n_images']
+
+    list_copies = []
+    list_missing = []
+    for preset in manifest['presets']:
+        n_tween = preset['params'].get('n_tween', 0)
+        list_frames = []
+        for shard, shard_folder in zip(manifest['shards'], list_shard_folders):
+            frame_first, frame_last = shard['frames'][preset['name']]
+            for idx_frame in range(frame_first, frame_last + 1):
+                list_frames.append(idx_frame)
+                path_in = shard_folder + preset['subfolder'] + str(idx_frame) + ".png"
+                if os.path.isfile(path_in):
+                    list_copies.append((path_in, output_folder + preset['subfolder'] + str(idx_frame) + ".png"))
+                else:
+                    list_missing.append(path_in)
+        # Shards must cover every frame once, as the syncfile lists them
+        if list_frames != list(range(1, get_frame_range(0, n_images, n_images, n_tween)[1] + 1)):
+            raise Exception("Shards of %s do not cover its frames in order" % preset['name'])
+
+    if list_missing:
+        raise Exception("%d frames missing. First ones: %s" % (len(list_missing), ", ".join(list_missing[:5])))
+
+    for preset in manifest['presets']:
+        helpers.ensure_directory(output_folder + preset['subfolder'])
+    for path_in, path_out in list_copies:
+        if os.path.abspath(path_in) != os.path.abspath(path_out):
+            shutil.copyfile(path_in, path_out)
+    for preset in manifest['presets']:
+        mapplotAnimationHelpers.sync_helper_file(0, n_images, manifest['exif']['filename'],
+                                                 output_folder + preset['subfolder'],
+                                                 preset['params'].get('n_tween', 0))
+    print("Merged %d frames of %d presets from %d shards" % (
+        len(list_copies), len(manifest['presets']), len(list_shard_folders)))
+    return len(list_copies)
@@ -0,0 +1,194 @@
+import io
+import json
+import math
+import random
+import threading
+from datetime import datetime
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from PIL import Image
+from PIL import ImageDraw
+from PIL.TiffImagePlugin import IFDRational
+import src.helpers as helpers
+
+# Exif tag ids used by the generator
+TAG_DATETIME = 0x0132
+TAG_GPS_IFD = 0x8825
+TAG_GPS_LATITUDE_REF = 1
+TAG_GPS_LATITUDE = 2
+TAG_GPS_LONGITUDE_REF = 3
+TAG_GPS_LONGITUDE = 4
+
+
+def deg_to_exif_dms(value_deg):
+    """Converts a positive angle in degrees to an exif (deg, min, sec) tuple of rationals.
+    Whole seconds are used as extract_gps_exif only reads the numerators"""
+    total_sec = int(round(abs(value_deg) * 3600))
+    return (IFDRational(total_sec // 3600, 1),
+            IFDRational((total_sec // 60) % 60, 1),
+            IFDRational(total_sec % 60, 1))
+
+
+def write_jpeg_with_exif(img_path, local_datetime, lat_deg=None, lon_deg=None, size_px=(64, 48), seed=0):
+    """Writes a small jpeg with exif DateTime and, if lat_deg is not None, the GPS block"""
+    rnd = random.Random(seed)
+    img = Image.new('RGB', size_px, (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+
+    exif = Image.Exif()
+    exif[TAG_DATETIME] = local_datetime.strftime("%Y:%m:%d %H:%M:%S")
+    if lat_deg is not None:
+        gps_ifd = exif.get_ifd(TAG_GPS_IFD)
+        gps_ifd[TAG_GPS_LATITUDE_REF] = 'N' if lat_deg >= 0 else 'S'
+        gps_ifd[TAG_GPS_LATITUDE] = deg_to_exif_dms(lat_deg)
+        gps_ifd[TAG_GPS_LONGITUDE_REF] = 'E' if lon_deg >= 0 else 'W'
+        gps_ifd[TAG_GPS_LONGITUDE] = deg_to_exif_dms(lon_deg)
+    img.save(img_path, format='JPEG', exif=exif, quality=75)
+
+
+def generate_track(n_locations, start_utc, n_days, lat_start=40.4168, lon_start=-3.7038, seed=0):
+    """
+    Generates a deterministic walk sampled at a constant rate. Each day starts at the end point of the previous day
+    :param n_locations: Number of samples of the whole track
+    :param start_utc: Datetime of the first sample in UTC
+    :param n_days: Number of days covered by the track
+    :return: List of (datetime_utc, lat_deg, lon_deg, accuracy) tuples ordered by time
+    """
+    rnd = random.Random(seed)
+    step = timedelta(days=n_days) / max(n_locations, 1)
+    step_s = step.total_seconds()
+
+    list_track = []
+    lat = lat_start
+    lon = lon_start
+    heading = rnd.uniform(0, 2 * math.pi)
+    for i in range(n_locations):
+        # Walking speed with smooth changes of direction
+        heading += rnd.gauss(0, 0.3)
+        dist_m = 1.4 * min(step_s, 600)
+        lat += dist_m * math.cos(heading) / 111320.0
+        lon += dist_m * math.sin(heading) / (111320.0 * math.cos(math.radians(lat)))
+
+        # Some samples are inaccurate to exercise the accuracy filter
+        accuracy = rnd.choice([5, 10, 15, 20, 30]) if rnd.random() > 0.1 else 200
+        list_track.append((start_utc + step * i, lat, lon, accuracy))
+    return list_track
+
+
+def write_location_history_json(json_path, list_track):
+    """Writes a track in the Google Takeout location history format"""
+    list_locations = []
+    for loc_datetime, lat, lon, accuracy in list_track:
+        list_locations.append({
+            "timestampMs": str(int((loc_datetime - datetime(1970, 1, 1)).total_seconds() * 1000)),
+            "latitudeE7": int(round(lat * 10000000)),
+            "longitudeE7": int(round(lon * 10000000)),
+            "accuracy": accuracy})
+
+    with open(json_path, "w") as f_out:
+        json.dump({"locations": list_locations}, f_out)
+
+
+def generate_trip(output_folder, n_photos=50, n_locations=5000, n_days=2, timezone_hour_diff=1,
+                  start_utc=datetime(2020, 5, 1, 7, 0, 0), no_gps_ratio=0.1, seed=0):
+    """
+    Generates a synthetic trip: a folder of chronologically named jpegs with exif and a location history json.
+    Photos are taken along the same track used for the location history.
+    :param output_folder: Folder where "photos/" and "location_history.json" will be written
+    :param n_photos: Number of photos. They are spread along the whole trip
+    :param n_locations: Number of location history samples
+    :param n_days: Number of days covered by the trip
+    :param timezone_hour_diff: Local time minus UTC. Used to write the exif local DateTime
+    :param no_gps_ratio: Ratio of photos written without GPS tags
+    :return: Dictionary with the generated paths and sizes
+    """
+    pics_folder = output_folder + "photos/"
+    helpers.ensure_directory(pics_folder)
+    rnd = random.Random(seed)
+
+    list_track = generate_track(n_locations, start_utc, n_days, seed=seed)
+    location_history_path = output_folder + "location_history.json"
+    write_location_history_json(location_history_path, list_track)
+
+    # Photos are taken at evenly spread track samples, skipping the first and last to keep them inside the history
+    for i in range(n_photos):
+        idx_track = 1 + (i * (n_locations - 2)) // max(n_photos, 1)
+        loc_datetime, lat, lon, _ = list_track[idx_track]
+        local_datetime = loc_datetime + timedelta(hours=timezone_hour_diff)
+        if rnd.random() < no_gps_ratio:
+            lat = None
+            lon = None
+        write_jpeg_with_exif(pics_folder + "IMG_%05d.jpg" % i, local_datetime, lat, lon, seed=seed + i)
+
+    return {'pics_folder': pics_folder, 'location_history_path': location_history_path,
+            'n_photos': n_photos, 'n_locations': n_locations, 'timezone_hour_diff': timezone_hour_diff}
+
+
+def render_stub_tile(z, x, y, tilesize=256):
+    """Renders a deterministic png tile. Color depends on the tile coordinates and a grid helps to see the scale"""
+    color = ((x * 37 + z * 11) % 200 + 40, (y * 53 + z * 17) % 200 + 40, (x * 13 + y * 7) % 200 + 40)
+    img = Image.new('RGB', (tilesize, tilesize), color)
+    draw = ImageDraw.Draw(img)
+    for i in range(0, tilesize, 32):
+        draw.line([(i, 0), (i, tilesize)], fill=(255, 255, 255))
+        draw.line([(0, i), (tilesize, i)], fill=(255, 255, 255))
+    draw.text((8, 8), "%d/%d/%d" % (z, x, y), fill=(0, 0, 0))
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='png')
+    return buffer.getvalue()
+
+
+class StubTileServer:
+    """Local http server serving deterministic tiles at /{z}/{x}/{y}.png. Counts served tiles"""
+
+    def __init__(self, port=0):
+        """Set port to 0 to let the OS pick a free one"""
+        self.tiles_served = 0
+        self.lock_ = threading.Lock()
+        self.cache_ = {}
+        self.thread_ = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    z, x, y = [int(v) for v in self.path.strip('/').replace('.png', '').split('/')]
+                except ValueError:
+                    self.send_error(404)
+                    return
+                png = stub.get_tile(z, x, y)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(png)))
+                self.end_headers()
+                self.wfile.write(png)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server_ = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+
+    def get_tile(self, z, x, y):
+        """Returns png bytes of the tile and updates the counter"""
+        with self.lock_:
+            self.tiles_served += 1
+            if (z, x, y) not in self.cache_:
+                self.cache_[(z, x, y)] = render_stub_tile(z, x, y)
+            return self.cache_[(z, x, y)]
+
+    def get_tileserver_url(self):
+        """Returns the url template to be used as smopy tileserver"""
+        return "http://127.0.0.1:%d/{z}/{x}/{y}.png" % self.server_.server_address[1]
+
+    def start(self):
+        """Serves tiles in a daemon thread"""
+        self.thread_ = threading.Thread(target=self.server_.serve_forever, daemon=True)
+        self.thread_.start()
+        return self
+
+    def stop(self):
+        """Stops the server and frees the port"""
+        self.server_.shutdown()
+        self.server_.server_close()
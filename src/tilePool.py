@@ -0,0 +1,215 @@
+import os
+import mmap
+import time
+import struct
+import numpy as np
+import smopy
+from PIL import Image
+import src.renderPipeline as renderPipeline
+
+POOL_MAGIC = b'TILEPOOL'
+POOL_VERSION = 1
+# Magic, version, tile size, number of slots, slots used, name of the source of the tiles
+HEADER_FORMAT = '<8sIIII256s'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+OFFSET_N_USED = 20  # Offset of the slots used in the header, updated after each tile
+INDEX_ENTRY_SIZE = 12  # z, x, y as int32
+PAGE_SIZE = 4096
+
+
+class TilePool:
+    """
+    Decoded map tiles stored as RGB pixels in a memory mapped file, keyed by z/x/y. The owner process fetches and
+    decodes each tile once and adds it, the render processes map the same file read only: their tiles are views of the
+    shared pages, so a tile is neither decoded nor kept in memory once per process.
+    Tiles are written before their index entry and the count of slots used last, so readers never see partial tiles
+    """
+
+    def __init__(self, path, writable=False):
+        """Opens an existing pool. Only the owner opens it writable"""
+        self.path = path
+        self.writable = writable
+        with open(path, 'r+b' if writable else 'rb') as f:
+            self.mmap_ = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, version, self.tilesize, self.n_slots, _, source_name = struct.unpack_from(HEADER_FORMAT, self.mmap_)
+        if magic != POOL_MAGIC or version != POOL_VERSION:
+            raise ValueError("%s is not a tile pool of version %d" % (path, POOL_VERSION))
+        self.source_name = source_name.rstrip(b'\0').decode('utf-8')
+        self.tile_bytes = self.tilesize * self.tilesize * 3
+        self.offset_data = get_data_offset(self.n_slots)
+        self.dict_slots_ = {}  # (z, x, y): slot
+        self.__refresh()
+
+    @classmethod
+    def create(cls, path, n_slots, source_name, tilesize=256):
+        """Creates an empty pool file with room for n_slots tiles and opens it writable
+        :param source_name: Tile server or local source of the tiles. Readers check it before using the pool
+        """
+        with open(path, 'wb') as f:
+            f.truncate(get_data_offset(n_slots) + n_slots * tilesize * tilesize * 3)
+            f.write(struct.pack(HEADER_FORMAT, POOL_MAGIC, POOL_VERSION, tilesize, n_slots, 0,
+                                source_name.encode('utf-8')[:256]))
+        return cls(path, writable=True)
+
+    def __len__(self):
+        return len(self.dict_slots_)
+
+    def __get_n_used(self):
+        return struct.unpack_from('<I', self.mmap_, OFFSET_N_USED)[0]
+
+    def __refresh(self):
+        """Adds the index entries written since the last refresh, e.g. by the owner while it fills the pool"""
+        n_used = self.__get_n_used()
+        n_known = len(self.dict_slots_)
+        if n_used == n_known:
+            return
+        list_zxy = np.frombuffer(self.mmap_, dtype='<i4', count=3 * (n_used - n_known),
+                                 offset=HEADER_SIZE + n_known * INDEX_ENTRY_SIZE).reshape(-1, 3).tolist()
+        for slot, zxy in enumerate(list_zxy, n_known):
+            self.dict_slots_[tuple(zxy)] = slot
+
+    def contains(self, x, y, z):
+        """True if the pool has the tile"""
+        return (z, x, y) in self.dict_slots_
+
+    def get_tile(self, x, y, z):
+        """Returns the tile as a read only (tilesize, tilesize, 3) array over the shared pages, or None"""
+        slot = self.dict_slots_.get((z, x, y))
+        if slot is None and not self.writable:
+            self.__refresh()
+            slot = self.dict_slots_.get((z, x, y))
+        if slot is None:
+            return None
+        return np.frombuffer(self.mmap_, dtype=np.uint8, count=self.tile_bytes,
+                             offset=self.offset_data + slot * self.tile_bytes).reshape(self.tilesize, self.tilesize, 3)
+
+    def add_tile(self, x, y, z, img):
+        """Stores a decoded PIL tile. Only the owner adds tiles. Returns False if the pool is full"""
+        if self.contains(x, y, z):
+            return True
+        slot = len(self.dict_slots_)
+        if slot >= self.n_slots:
+            return False
+        img = img.convert('RGB')
+        if img.size != (self.tilesize, self.tilesize):
+            img = img.resize((self.tilesize, self.tilesize))
+        offset = self.offset_data + slot * self.tile_bytes
+        self.mmap_[offset:offset + self.tile_bytes] = img.tobytes()
+        struct.pack_into('<iii', self.mmap_, HEADER_SIZE + slot * INDEX_ENTRY_SIZE, z, x, y)
+        struct.pack_into('<I', self.mmap_, OFFSET_N_USED, slot + 1)
+        self.dict_slots_[(z, x, y)] = slot
+        return True
+
+    def close(self):
+        """Writes the pool to disk and unmaps it. Tiles returned by get_tile must not be used afterwards"""
+        if self.writable:
+            self.mmap_.flush()
+        self.dict_slots_ = {}
+        self.mmap_.close()
+
+
+def get_data_offset(n_slots):
+    """Offset of the first tile in the pool file, after the header and the index, aligned to a page"""
+    size = HEADER_SIZE + n_slots * INDEX_ENTRY_SIZE
+    return (size + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+
+def get_plan_tiles(list_plans):
+    """Returns the (z, x0, y0, x1, y1) tile ranges of ZoomPlans, as smopy fetches them, and the count of unique
+    tiles"""
+    list_ranges = []
+    set_tiles = set()
+    for plan in list_plans:
+        key = renderPipeline.get_mosaic_key(smopy.get_tile_box(plan.bbox, plan.z), plan.z)
+        list_ranges.append(key)
+        z, x0, y0, x1, y1 = key
+        set_tiles.update((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return list_ranges, len(set_tiles)
+
+
+def fill_pool(pool, list_ranges, tileserver, download_delay_s, tile_source=None, maxtiles=256):
+    """
+    Owner side: fetches and decodes the tiles of the ranges that the pool does not have yet. Downloads wait
+    download_delay_s after each range, as MapPlot waits after each map
+    :param list_ranges: (z, x0, y0, x1, y1) tile ranges, e.g. from get_plan_tiles
+    :param tile_source: Object with a get_mosaic method the tiles are cut from instead of downloading them, e.g.
+    vectorBasemap.VectorTileSource
+    :return: Number of tiles added
+    """
+    n_added = 0
+    for z, x0, y0, x1, y1 in list_ranges:
+        list_missing = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if not pool.contains(x, y, z)]
+        if not list_missing:
+            continue
+        if tile_source is not None:
+            # The mosaic of the range of the missing tiles, cut back into tiles
+            box_x0, box_y0 = min(x for x, _ in list_missing), min(y for _, y in list_missing)
+            box_x1, box_y1 = max(x for x, _ in list_missing), max(y for _, y in list_missing)
+            img = tile_source.get_mosaic((box_x0, box_y0, box_x1, box_y1), z, tileserver, pool.tilesize, maxtiles)
+            for x, y in list_missing:
+                left_px, top_px = (x - box_x0) * pool.tilesize, (y - box_y0) * pool.tilesize
+                n_added += pool.add_tile(x, y, z, img.crop((left_px, top_px, left_px + pool.tilesize,
+                                                            top_px + pool.tilesize)))
+        else:
+            for x, y in list_missing:
+                n_added += pool.add_tile(x, y, z, smopy.fetch_tile(x, y, z, tileserver))
+            time.sleep(download_delay_s)
+        if len(pool) >= pool.n_slots:
+            break
+    return n_added
+
+
+class TilePoolSource:
+    """
+    Tile source of the render processes: mosaics are assembled from the tiles of a TilePool, without decoding them.
+    Mosaics with tiles the pool does not have are taken from the fallback source, or downloaded
+    """
+
+    def __init__(self, pool, fallback_source=None, download_delay_s=0.5):
+        """
+        :param fallback_source: Object with a get_mosaic method used for the mosaics not in the pool. None to download
+        :param download_delay_s: Wait after each download. Keep in mind OSM terms of service
+        """
+        self.pool = pool
+        self.fallback_source = fallback_source
+        self.download_delay_s = download_delay_s
+        self.stats_maps_from_pool = 0
+        self.stats_maps_fallback = 0
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Returns the PIL mosaic of a tile range. Same arguments as smopy.fetch_map"""
+        x0, y0, x1, y1 = smopy.correct_box(box_tile, z)
+        if tilesize == self.pool.tilesize:
+            dict_tiles = {(x, y): self.pool.get_tile(x, y, z) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)}
+            if all(tile is not None for tile in dict_tiles.values()):
+                # The only copy of the tiles, from the shared pages into the mosaic
+                mosaic = np.empty(((y1 - y0 + 1) * tilesize, (x1 - x0 + 1) * tilesize, 3), dtype=np.uint8)
+                for (x, y), tile in dict_tiles.items():
+                    left_px, top_px = (x - x0) * tilesize, (y - y0) * tilesize
+                    mosaic[top_px:top_px + tilesize, left_px:left_px + tilesize] = tile
+                self.stats_maps_from_pool += 1
+                return Image.fromarray(mosaic)
+
+        self.stats_maps_fallback += 1
+        if self.fallback_source is not None:
+            return self.fallback_source.get_mosaic(box_tile, z, tileserver, tilesize, maxtiles)
+        img = smopy.fetch_map(box_tile, z, tileserver, tilesize, maxtiles)
+        time.sleep(self.download_delay_s)
+        return img
+
+    def print_stats(self):
+        """Prints where the maps came from in the console"""
+        print("Tile pool %s: %d tiles, %d maps from the pool, %d maps fetched outside it" % (
+            self.pool.path, len(self.pool), self.stats_maps_from_pool, self.stats_maps_fallback))
+
+
+def open_pool_source(path, source_name, fallback_source=None, download_delay_s=0.5):
+    """Returns a TilePoolSource over the pool file, or None if there is none or its tiles are of another source"""
+    if not os.path.isfile(path):
+        return None
+    pool = TilePool(path)
+    if pool.source_name != source_name:
+        print("Tile pool %s has tiles of %s, not used" % (path, pool.source_name))
+        pool.close()
+        return None
+    return TilePoolSource(pool, fallback_source, download_delay_s)
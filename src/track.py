@@ -0,0 +1,147 @@
+from datetime import datetime
+from datetime import timedelta
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+DAY_MS = 86400000
+EARTH_RADIUS_M = 6371000.0
+
+
+def datetime_to_ms(datetime_in):
+    """Converts a naive datetime to milliseconds since epoch"""
+    return (datetime_in - EPOCH) // timedelta(milliseconds=1)
+
+
+def ms_to_datetime(value_ms):
+    """Converts milliseconds since epoch to a naive datetime"""
+    return EPOCH + timedelta(milliseconds=int(value_ms))
+
+
+def parse_datetime_ms(list_str):
+    """Converts a list of "%Y-%m-%d %H:%M:%S" strings to an int64 array of milliseconds since epoch"""
+    return np.array(list_str, dtype='datetime64[ms]').astype(np.int64)
+
+
+def get_anchor_timestamps_ms(data_exif):
+    """
+    Sorted UTC milliseconds the presets align the location history to: the photos and the start of their local days,
+    as the region_expanding_by_day preset computes it
+    """
+    offset_ms = int(round(data_exif.timezone_h * 3600000))
+    localtime_ms = data_exif.timestamp_ms + offset_ms
+    # Local midnight keeping the milliseconds, as datetime.replace(hour=0, minute=0, second=0)
+    day_start_ms = localtime_ms - localtime_ms % DAY_MS + localtime_ms % 1000 - offset_ms
+    return np.unique(np.concatenate((data_exif.timestamp_ms, day_start_ms)))
+
+
+def resample(track_in, interval_s=0, distance_m=0, anchors_ms=None):
+    """
+    Returns a Track with fewer samples: the first sample of each interval_s and of each distance_m travelled along
+    the track are kept, so there is at least one every interval_s or distance_m. 0 to not use a grid.
+    The first and last samples and the two around each anchor timestamp are always kept, so the closest sample to an
+    anchor and the last one before it are the same as in track_in. Unsorted tracks are returned as they are
+    :param anchors_ms: Sorted UTC milliseconds to preserve, e.g. from get_anchor_timestamps_ms
+    """
+    n_samples = len(track_in)
+    if n_samples < 3 or not track_in.is_sorted or (interval_s <= 0 and distance_m <= 0):
+        return track_in
+
+    mask = np.zeros(n_samples, dtype=bool)
+    mask[[0, -1]] = True
+    if interval_s > 0:
+        time_bin = track_in.timestamp_ms // int(interval_s * 1000)
+        mask[1:] |= time_bin[1:] != time_bin[:-1]
+    if distance_m > 0:
+        # Equirectangular distance between consecutive samples, enough for the short steps of a track
+        lat_rad = np.radians(track_in.latitude)
+        step_x = np.radians(np.diff(track_in.longitude)) * np.cos((lat_rad[1:] + lat_rad[:-1]) / 2)
+        step_y = np.diff(lat_rad)
+        distance_bin = np.concatenate(([0], np.cumsum(np.hypot(step_x, step_y)) * EARTH_RADIUS_M)) // distance_m
+        mask[1:] |= distance_bin[1:] != distance_bin[:-1]
+    if anchors_ms is not None and len(anchors_ms):
+        # Samples around each anchor: the searches take the first one not earlier or the last one not later
+        idx_left = np.searchsorted(track_in.timestamp_ms, anchors_ms, side='left')
+        idx_right = np.searchsorted(track_in.timestamp_ms, anchors_ms, side='right')
+        idx_keep = np.concatenate((idx_left - 1, idx_left, idx_right - 1, idx_right))
+        mask[idx_keep[(idx_keep >= 0) & (idx_keep < n_samples)]] = True
+    return track_in.select(mask)
+
+
+class DatetimeColumn:
+    """Read only column of datetimes over an int64 array of milliseconds. Keeps the old list of datetimes interface"""
+
+    __slots__ = ('values_ms', 'offset_ms')
+
+    def __init__(self, values_ms, offset_ms=0):
+        self.values_ms = values_ms
+        self.offset_ms = offset_ms
+
+    def __len__(self):
+        return len(self.values_ms)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return DatetimeColumn(self.values_ms[idx], self.offset_ms)
+        return ms_to_datetime(self.values_ms[idx] + self.offset_ms)
+
+    def __iter__(self):
+        for value_ms in self.values_ms:
+            yield ms_to_datetime(value_ms + self.offset_ms)
+
+
+class Track:
+    """
+    Time ordered samples stored in numpy arrays. Used for both the exif data and the location history.
+    Timestamps are UTC milliseconds since epoch. filename and pic_idx are None on location history tracks.
+    track['timestampMs'], track['latitude'], ... return the same columns as the old dictionaries, datetimes included
+    """
+
+    __slots__ = ('timestamp_ms', 'latitude', 'longitude', 'has_gps', 'filename', 'pic_idx', 'timezone_h', 'is_sorted')
+
+    def __init__(self, timestamp_ms, latitude, longitude, has_gps=None, filename=None, pic_idx=None, timezone_h=0,
+                 is_sorted=None):
+        self.timestamp_ms = np.asarray(timestamp_ms, dtype=np.int64)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        if has_gps is None:
+            has_gps = np.ones(len(self.timestamp_ms), dtype=bool)
+        self.has_gps = np.asarray(has_gps, dtype=bool)
+        self.filename = None if filename is None else np.asarray(filename, dtype=object)
+        self.pic_idx = None if pic_idx is None else np.asarray(pic_idx, dtype=np.int64)
+        self.timezone_h = timezone_h
+        if is_sorted is None:
+            is_sorted = bool(np.all(self.timestamp_ms[1:] >= self.timestamp_ms[:-1]))
+        self.is_sorted = is_sorted  # Timestamps in ascending order, searches can use binary search
+
+    def __len__(self):
+        return len(self.timestamp_ms)
+
+    def __getitem__(self, key):
+        """Compatibility accessor with the keys of the old dictionaries"""
+        if key == 'timestampMs':
+            return DatetimeColumn(self.timestamp_ms)
+        elif key == 'timestampMs_localtime':
+            return DatetimeColumn(self.timestamp_ms, int(round(self.timezone_h * 3600000)))
+        elif key == 'timezoneH':
+            return self.timezone_h
+        elif key in ('latitude', 'longitude', 'has_gps', 'filename', 'pic_idx'):
+            column = getattr(self, key)
+            if column is None:
+                raise KeyError(key)
+            return column
+        raise KeyError(key)
+
+    def view(self, idx_start, idx_end):
+        """Returns a Track with the samples from idx_start to idx_end, not included. Arrays are shared, not copied"""
+        return Track(self.timestamp_ms[idx_start:idx_end], self.latitude[idx_start:idx_end],
+                     self.longitude[idx_start:idx_end], self.has_gps[idx_start:idx_end],
+                     None if self.filename is None else self.filename[idx_start:idx_end],
+                     None if self.pic_idx is None else self.pic_idx[idx_start:idx_end],
+                     self.timezone_h, self.is_sorted)
+
+    def select(self, mask):
+        """Returns a Track with the samples where mask is True. Arrays are copied"""
+        return Track(self.timestamp_ms[mask], self.latitude[mask], self.longitude[mask], self.has_gps[mask],
+                     None if self.filename is None else self.filename[mask],
+                     None if self.pic_idx is None else self.pic_idx[mask],
+                     self.timezone_h, self.is_sorted)
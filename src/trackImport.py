@@ -0,0 +1,324 @@
+import os
+import csv
+import heapq
+import itertools
+import struct
+import collections
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import src.track as track
+import src.extractGoogleLocationHistory as extractGoogleLocation
+
+# Accuracy in meters of the samples of sources that do not record one, e.g. GPX and FIT from sports apps
+DEFAULT_ACCURACY_M = 10
+# A sample is dropped if a source with more priority has one closer than this
+DEFAULT_OVERLAP_S = 60
+
+FIT_EPOCH_S = 631065600  # 1989-12-31 00:00:00 UTC, origin of the FIT timestamps
+FIT_MSG_RECORD = 20
+FIT_FIELD_TIMESTAMP = 253
+FIT_FIELD_LAT = 0
+FIT_FIELD_LON = 1
+FIT_SEMICIRCLES_TO_DEG = 180.0 / 2 ** 31
+FIT_INVALID_SINT32 = 0x7FFFFFFF
+
+# Names of the columns of a csv track, lowercase. The first one found in the header is used
+CSV_TIME_COLUMNS = ('time', 'timestamp', 'datetime', 'date_time', 'timestampms')
+CSV_LAT_COLUMNS = ('lat', 'latitude')
+CSV_LON_COLUMNS = ('lon', 'lng', 'long', 'longitude')
+CSV_ACCURACY_COLUMNS = ('accuracy', 'accuracy_m', 'hacc')
+
+
+def parse_time_ms(text):
+    """
+    UTC milliseconds of a time of a track: ISO 8601, with or without offset, or seconds or milliseconds since epoch.
+    Times without offset are taken as UTC
+    """
+    text = text.strip()
+    try:
+        value = float(text)
+    except ValueError:
+        pass
+    else:
+        # Seconds since epoch are below 1e11 until the year 5138
+        return int(value) if abs(value) >= 1e11 else int(round(value * 1000))
+
+    dt = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return track.datetime_to_ms(dt)
+
+
+def get_local_name(tag):
+    """Tag of an xml element without its namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_gpx(path, accuracy_m=DEFAULT_ACCURACY_M):
+    """
+    Yields (timestamp ms, latitude, longitude, accuracy) of the track points of a GPX file in the order of the file.
+    Points are removed from the tree once read, so the memory does not grow with the file. Points without time are
+    skipped
+    """
+    list_stack = []
+    for event, elem in ElementTree.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            list_stack.append(elem)
+            continue
+        list_stack.pop()
+        if get_local_name(elem.tag) != 'trkpt':
+            continue
+
+        time_text = None
+        for child in elem:
+            if get_local_name(child.tag) == 'time':
+                time_text = child.text
+                break
+        if time_text:
+            yield parse_time_ms(time_text), float(elem.get('lat')), float(elem.get('lon')), accuracy_m
+        if list_stack:
+            list_stack[-1].remove(elem)
+
+
+def read_exact(f, n_bytes):
+    """Reads n_bytes from a binary file, raising if it ends before"""
+    data = f.read(n_bytes)
+    if len(data) != n_bytes:
+        raise ValueError("Truncated file %s" % f.name)
+    return data
+
+
+def iter_fit(path, accuracy_m=DEFAULT_ACCURACY_M):
+    """
+    Yields (timestamp ms, latitude, longitude, accuracy) of the record messages of a FIT file in the order of the
+    file. Messages are read one at a time. Only the timestamp and position fields are decoded, records without
+    position are skipped. Developer fields and compressed timestamp headers are supported
+    """
+    with open(path, 'rb') as f:
+        header_size = read_exact(f, 1)[0]
+        header = read_exact(f, header_size - 1)
+        if header_size < 12 or header[7:11] != b'.FIT':
+            raise ValueError("%s is not a FIT file" % path)
+        data_size = struct.unpack('<I', header[3:7])[0]
+
+        dict_definitions = {}  # Local message type: (global message number, endianness, fields, size)
+        last_timestamp_s = 0
+        n_read = 0
+        while n_read < data_size:
+            record_header = read_exact(f, 1)[0]
+            n_read += 1
+            timestamp_s = None
+            if record_header & 0x80:
+                # Compressed timestamp header: 5 bit offset from the last timestamp
+                local_type = (record_header >> 5) & 0x03
+                offset = record_header & 0x1F
+                timestamp_s = last_timestamp_s + ((offset - last_timestamp_s) & 0x1F)
+                last_timestamp_s = timestamp_s
+            elif record_header & 0x40:
+                # Definition message
+                fixed = read_exact(f, 5)
+                endianness = '>' if fixed[1] == 1 else '<'
+                global_num = struct.unpack(endianness + 'H', fixed[2:4])[0]
+                n_fields = fixed[4]
+                data_fields = read_exact(f, 3 * n_fields)
+                list_fields = [(data_fields[3 * i], data_fields[3 * i + 1]) for i in range(n_fields)]
+                n_read += 5 + 3 * n_fields
+                if record_header & 0x20:
+                    n_dev_fields = read_exact(f, 1)[0]
+                    data_dev_fields = read_exact(f, 3 * n_dev_fields)
+                    n_read += 1 + 3 * n_dev_fields
+                    # Developer fields are only skipped, as a field of an unknown number
+                    list_fields += [(None, data_dev_fields[3 * i + 1]) for i in range(n_dev_fields)]
+                dict_definitions[record_header & 0x0F] = (global_num, endianness, list_fields,
+                                                          sum(size for _, size in list_fields))
+                continue
+            else:
+                local_type = record_header & 0x0F
+
+            if local_type not in dict_definitions:
+                raise ValueError("%s has a message without definition" % path)
+            global_num, endianness, list_fields, size = dict_definitions[local_type]
+            data = read_exact(f, size)
+            n_read += size
+
+            lat_semicircles = lon_semicircles = None
+            pos = 0
+            for field_num, field_size in list_fields:
+                if field_size == 4 and field_num in (FIT_FIELD_TIMESTAMP, FIT_FIELD_LAT, FIT_FIELD_LON):
+                    if field_num == FIT_FIELD_TIMESTAMP:
+                        value = struct.unpack(endianness + 'I', data[pos:pos + 4])[0]
+                        if value != 0xFFFFFFFF:
+                            timestamp_s = last_timestamp_s = value
+                    elif global_num == FIT_MSG_RECORD:
+                        value = struct.unpack(endianness + 'i', data[pos:pos + 4])[0]
+                        if value != FIT_INVALID_SINT32:
+                            if field_num == FIT_FIELD_LAT:
+                                lat_semicircles = value
+                            else:
+                                lon_semicircles = value
+                pos += field_size
+
+            if global_num == FIT_MSG_RECORD and timestamp_s is not None and lat_semicircles is not None and \
+                    lon_semicircles is not None:
+                yield ((timestamp_s + FIT_EPOCH_S) * 1000, lat_semicircles * FIT_SEMICIRCLES_TO_DEG,
+                       lon_semicircles * FIT_SEMICIRCLES_TO_DEG, accuracy_m)
+
+
+def find_column(list_header, list_names):
+    """Index of the first column of the header with one of the names, None if there is none"""
+    list_header = [name.strip().lower() for name in list_header]
+    for name in list_names:
+        if name in list_header:
+            return list_header.index(name)
+    return None
+
+
+def iter_csv(path, accuracy_m=DEFAULT_ACCURACY_M):
+    """
+    Yields (timestamp ms, latitude, longitude, accuracy) of the rows of a csv track in the order of the file. The
+    columns are found by their names in the header (see CSV_TIME_COLUMNS...). Without header the columns are time,
+    latitude, longitude and accuracy, as the location_history.csv of the auxiliar folder
+    """
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        first_row = next(reader, None)
+        if first_row is None:
+            return
+        idx_lat = find_column(first_row, CSV_LAT_COLUMNS)
+        idx_lon = find_column(first_row, CSV_LON_COLUMNS)
+        if idx_lat is not None and idx_lon is not None:
+            idx_time = find_column(first_row, CSV_TIME_COLUMNS)
+            if idx_time is None:
+                raise ValueError("%s has no time column, named one of %s" % (path, ", ".join(CSV_TIME_COLUMNS)))
+            idx_accuracy = find_column(first_row, CSV_ACCURACY_COLUMNS)
+            rows = reader
+        else:
+            idx_time, idx_lat, idx_lon = 0, 1, 2
+            idx_accuracy = 3 if len(first_row) > 3 else None
+            rows = itertools.chain([first_row], reader)
+
+        for row in rows:
+            if len(row) <= max(idx_time, idx_lat, idx_lon) or not row[idx_lat] or not row[idx_lon]:
+                continue
+            accuracy = accuracy_m
+            if idx_accuracy is not None and idx_accuracy < len(row) and row[idx_accuracy]:
+                accuracy = int(float(row[idx_accuracy]))
+            yield parse_time_ms(row[idx_time]), float(row[idx_lat]), float(row[idx_lon]), accuracy
+
+
+def open_source(path, accuracy_m=DEFAULT_ACCURACY_M):
+    """Returns the sample iterator of a track file, chosen by its extension: .json (google location history),
+    .gpx, .fit or .csv"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.json':
+        return extractGoogleLocation.iter_location_history(path, accuracy_m)
+    if extension == '.gpx':
+        return iter_gpx(path, accuracy_m)
+    if extension == '.fit':
+        return iter_fit(path, accuracy_m)
+    if extension == '.csv':
+        return iter_csv(path, accuracy_m)
+    raise ValueError("Unknown track format %s. Use .json, .gpx, .fit or .csv" % path)
+
+
+class SourceStats:
+    """Counters of a track source during a merge"""
+
+    def __init__(self, path):
+        self.path = path
+        self.n_read = 0
+        self.n_unordered = 0
+        self.n_overlapped = 0
+        self.n_written = 0
+
+
+def iter_ordered(iter_samples, priority, stats):
+    """Yields (timestamp ms, priority, sample) of a source, dropping the samples older than the previous one as the
+    merge needs each source in order"""
+    last_ms = None
+    for sample in iter_samples:
+        stats.n_read += 1
+        if last_ms is not None and sample[0] < last_ms:
+            stats.n_unordered += 1
+            continue
+        last_ms = sample[0]
+        yield sample[0], priority, sample
+
+
+def merge_sources(list_sources, list_stats, from_ms, to_ms, overlap_ms):
+    """
+    Yields the samples of the sources between from_ms (excluded) and to_ms in time order. The sources are merged as
+    streams, so only one sample per source and the samples of the last overlap_ms are held in memory.
+    Where sources overlap the one first in the list is used: a sample is dropped if a source before it has a sample
+    closer than overlap_ms, before or after it
+    :param list_sources: Sample iterators, from most to least priority. Each one must be in time order, the samples
+    that are not are dropped
+    :param list_stats: SourceStats of each source, updated with the counters
+    """
+    list_last_ms = [None] * len(list_sources)
+    deque_pending = collections.deque()  # (timestamp ms, priority, sample) waiting for overlap_ms of the others
+
+    merged = heapq.merge(*[iter_ordered(iter_samples, priority, list_stats[priority])
+                           for priority, iter_samples in enumerate(list_sources)])
+    for timestamp_ms, priority, sample in merged:
+        if timestamp_ms <= from_ms:
+            continue
+        if timestamp_ms > to_ms:
+            break
+
+        covered = any(last_ms is not None and timestamp_ms - last_ms <= overlap_ms
+                      for last_ms in list_last_ms[:priority])
+        list_last_ms[priority] = timestamp_ms
+
+        # Samples closer than overlap_ms to this one from sources with less priority are dropped
+        if any(item[1] > priority for item in deque_pending):
+            list_kept = []
+            for item in deque_pending:
+                if item[1] > priority and timestamp_ms - item[0] <= overlap_ms:
+                    list_stats[item[1]].n_overlapped += 1
+                else:
+                    list_kept.append(item)
+            deque_pending = collections.deque(list_kept)
+        while deque_pending and timestamp_ms - deque_pending[0][0] > overlap_ms:
+            item = deque_pending.popleft()
+            list_stats[item[1]].n_written += 1
+            yield item[2]
+
+        if covered:
+            list_stats[priority].n_overlapped += 1
+        else:
+            deque_pending.append((timestamp_ms, priority, sample))
+
+    for item in deque_pending:
+        list_stats[item[1]].n_written += 1
+        yield item[2]
+
+
+def extract_tracks(list_paths, folder_out, from_datetime_utc, to_datetime_utc, accuracy_m=DEFAULT_ACCURACY_M,
+                   overlap_s=DEFAULT_OVERLAP_S):
+    """
+    Extracts the samples of several track files between the input dates in UTC and stores them in the csv of
+    extract_from_location_history, so they are loaded as a location history. The files are read as streams
+    :param list_paths: Track files (.json google location history, .gpx, .fit or .csv), from most to least priority
+    :param accuracy_m: Accuracy given to the samples of the sources that do not record one
+    :param overlap_s: Where sources overlap, samples closer than this to one of a source with more priority are dropped
+    """
+    from_datetime_utc = from_datetime_utc - timedelta(hours=1)
+    to_datetime_utc = to_datetime_utc + timedelta(hours=1)
+
+    print("Extracting tracks ...")
+    print("From", from_datetime_utc, "To", to_datetime_utc, "UTC")
+    list_sources = [open_source(path, accuracy_m) for path in list_paths]
+    list_stats = [SourceStats(path) for path in list_paths]
+    with open(folder_out + "location_history.csv", "w") as f_out:
+        for timestamp_ms, lat_deg, long_deg, accuracy in merge_sources(
+                list_sources, list_stats, track.datetime_to_ms(from_datetime_utc),
+                track.datetime_to_ms(to_datetime_utc), overlap_s * 1000):
+            extractGoogleLocation.write_location(f_out, timestamp_ms, lat_deg, long_deg, accuracy)
+
+    for stats in list_stats:
+        print("%s: %d read, %d written, %d covered by other sources, %d out of order" % (
+            stats.path, stats.n_read, stats.n_written, stats.n_overlapped, stats.n_unordered))
+    print("Done Extracting tracks")
@@ -0,0 +1,336 @@
+import os
+import math
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+from collections import defaultdict
+import numpy as np
+import smopy
+from PIL import Image
+from PIL import ImageDraw
+
+# Styles of the features, in drawing order. Name: (kind, color, width in px at zoom 16, min zoom)
+STYLES = {
+    'urban': ('area', (224, 223, 223), 0, 0),
+    'green': ('area', (200, 230, 180), 0, 0),
+    'water': ('area', (170, 211, 223), 0, 0),
+    'building': ('area', (210, 200, 190), 0, 15),
+    'waterway': ('line', (170, 211, 223), 3, 10),
+    'path': ('line', (250, 250, 250), 1.5, 14),
+    'rail': ('line', (150, 150, 150), 1.5, 11),
+    'road_minor': ('line', (255, 255, 255), 4, 13),
+    'road_secondary': ('line', (247, 250, 191), 6, 10),
+    'road_major': ('line', (252, 214, 164), 8, 0),
+}
+STYLE_NAMES = list(STYLES)
+BACKGROUND_COLOR = (242, 239, 233)
+# Cells of the spatial index
+INDEX_CELL_DEG = 0.05
+
+# Tag values of each style. Ways that match none are not kept
+AREA_TAGS = [
+    ('building', None, 'building'),
+    ('natural', {'water'}, 'water'),
+    ('landuse', {'reservoir', 'basin'}, 'water'),
+    ('waterway', {'riverbank', 'dock'}, 'water'),
+    ('landuse', {'forest', 'grass', 'meadow', 'farmland', 'orchard', 'vineyard', 'recreation_ground', 'cemetery'},
+     'green'),
+    ('natural', {'wood', 'scrub', 'grassland', 'heath'}, 'green'),
+    ('leisure', {'park', 'garden', 'pitch', 'golf_course', 'nature_reserve'}, 'green'),
+    ('landuse', {'residential', 'commercial', 'industrial', 'retail'}, 'urban'),
+]
+LINE_TAGS = [
+    ('highway', {'motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary', 'primary_link'}, 'road_major'),
+    ('highway', {'secondary', 'secondary_link', 'tertiary', 'tertiary_link'}, 'road_secondary'),
+    ('highway', {'residential', 'unclassified', 'service', 'living_street', 'road'}, 'road_minor'),
+    ('highway', {'footway', 'path', 'cycleway', 'track', 'pedestrian', 'steps', 'bridleway'}, 'path'),
+    ('railway', {'rail', 'light_rail', 'tram', 'narrow_gauge'}, 'rail'),
+    ('waterway', {'river', 'stream', 'canal'}, 'waterway'),
+]
+
+
+def classify_way(dict_tags, b_closed):
+    """Returns the style name of a way from its tags, or None to not keep it. Only closed ways can be areas"""
+    if b_closed and dict_tags.get('area') != 'no':
+        for key, set_values, style in AREA_TAGS:
+            if key in dict_tags and (set_values is None or dict_tags[key] in set_values):
+                return style
+    for key, set_values, style in LINE_TAGS:
+        if dict_tags.get(key) in set_values:
+            return style
+    return None
+
+
+class VectorFeatures:
+    """
+    Ways of an OSM extract as flat numpy arrays. Vertices are stored projected to web mercator with the world from 0
+    to 1, the tile numbers of zoom 0, so a map at any zoom only scales them
+    """
+
+    def __init__(self, style_idx, offsets, merc_x, merc_y, bbox=None):
+        """
+        :param style_idx: Index in STYLE_NAMES of each feature
+        :param offsets: Feature i has the vertices from offsets[i] to offsets[i + 1]
+        :param bbox: (y_min, x_min, y_max, x_max) in degrees the extract was cut to when read. None if it was not
+        """
+        self.style_idx = np.asarray(style_idx, dtype=np.int8)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.merc_x = np.asarray(merc_x, dtype=np.float64)
+        self.merc_y = np.asarray(merc_y, dtype=np.float64)
+        self.bbox = tuple(float(v) for v in bbox) if bbox is not None else None
+
+    def __len__(self):
+        return len(self.style_idx)
+
+    @classmethod
+    def from_ways(cls, list_ways, bbox=None):
+        """Builds the arrays from a list of (style name, list of latitudes, list of longitudes)"""
+        style_idx = [STYLE_NAMES.index(style) for style, _, _ in list_ways]
+        offsets = np.cumsum([0] + [len(list_lat) for _, list_lat, _ in list_ways])
+        list_lat = [lat for _, way_lat, _ in list_ways for lat in way_lat]
+        list_lon = [lon for _, _, way_lon in list_ways for lon in way_lon]
+        merc_x, merc_y = smopy.deg2num(np.asarray(list_lat, dtype=np.float64),
+                                       np.asarray(list_lon, dtype=np.float64), 0, do_round=False)
+        return cls(style_idx, offsets, merc_x, merc_y, bbox)
+
+    def get_bounds(self):
+        """Returns the (x_min, y_min, x_max, y_max) mercator bounds of each feature as an (n, 4) array"""
+        if not len(self):
+            return np.zeros((0, 4))
+        starts = self.offsets[:-1]
+        return np.column_stack([np.minimum.reduceat(self.merc_x, starts), np.minimum.reduceat(self.merc_y, starts),
+                                np.maximum.reduceat(self.merc_x, starts), np.maximum.reduceat(self.merc_y, starts)])
+
+    def save(self, npz_path):
+        """Saves the compact format read by load_features"""
+        dict_bbox = {'bbox': np.array(self.bbox)} if self.bbox is not None else {}
+        np.savez(npz_path, style_names=np.array(STYLE_NAMES), style_idx=self.style_idx, offsets=self.offsets,
+                 merc_x=self.merc_x, merc_y=self.merc_y, **dict_bbox)
+
+    @classmethod
+    def load(cls, npz_path):
+        """Reads a file written by save"""
+        with np.load(npz_path) as data:
+            # Styles are stored by name, so files keep working if STYLES changes
+            list_names = list(data['style_names'])
+            remap = np.array([STYLE_NAMES.index(name) if name in STYLE_NAMES else -1 for name in list_names],
+                             dtype=np.int8)
+            features = cls(remap[data['style_idx']], data['offsets'], data['merc_x'], data['merc_y'],
+                           data['bbox'] if 'bbox' in data.files else None)
+        if np.any(features.style_idx < 0):
+            return features.select(np.flatnonzero(features.style_idx >= 0))
+        return features
+
+    def select(self, list_idx):
+        """Returns the features in list_idx as new arrays"""
+        list_idx = np.asarray(list_idx, dtype=np.int64)
+        lengths = self.offsets[list_idx + 1] - self.offsets[list_idx]
+        vertex_idx = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in list_idx]) \
+            if len(list_idx) else np.zeros(0, dtype=np.int64)
+        return VectorFeatures(self.style_idx[list_idx], np.concatenate([[0], np.cumsum(lengths)]),
+                              self.merc_x[vertex_idx], self.merc_y[vertex_idx], self.bbox)
+
+
+def is_in_bbox(lat_deg, long_deg, bbox):
+    """True if the point is inside the (y_min, x_min, y_max, x_max) box, or there is no box"""
+    return bbox is None or (bbox[0] <= lat_deg <= bbox[2] and bbox[1] <= long_deg <= bbox[3])
+
+
+def read_osm_xml(osm_path, bbox=None):
+    """
+    Reads the ways of an .osm XML extract. Nodes must be listed before the ways, as in the OSM exports.
+    The coordinates of the nodes are kept until the ways are read, about 200 bytes per node
+    :param bbox: (y_min, x_min, y_max, x_max) in degrees. Nodes outside it are not kept, so ways are cut to it
+    """
+    dict_nodes = {}
+    list_ways = []
+    list_refs = []
+    dict_tags = {}
+    for _, elem in ElementTree.iterparse(osm_path, events=('end',)):
+        if elem.tag == 'node':
+            lat_deg, long_deg = float(elem.get('lat')), float(elem.get('lon'))
+            if is_in_bbox(lat_deg, long_deg, bbox):
+                dict_nodes[elem.get('id')] = (lat_deg, long_deg)
+            dict_tags = {}
+            elem.clear()
+        elif elem.tag == 'nd':
+            list_refs.append(elem.get('ref'))
+        elif elem.tag == 'tag':
+            dict_tags[elem.get('k')] = elem.get('v')
+        elif elem.tag == 'way':
+            style = classify_way(dict_tags, len(list_refs) >= 4 and list_refs[0] == list_refs[-1])
+            # Ways cut by the extract or the box lose their nodes outside of it
+            list_coords = [dict_nodes[ref] for ref in list_refs if ref in dict_nodes]
+            if style is not None and len(list_coords) >= 2:
+                list_ways.append((style, [c[0] for c in list_coords], [c[1] for c in list_coords]))
+            list_refs = []
+            dict_tags = {}
+            elem.clear()
+        elif elem.tag == 'relation':
+            list_refs = []
+            dict_tags = {}
+            elem.clear()
+    return VectorFeatures.from_ways(list_ways, bbox)
+
+
+def read_osm_pbf(pbf_path, bbox=None):
+    """Reads the ways of a .pbf extract. Needs pyosmium
+    :param bbox: (y_min, x_min, y_max, x_max) in degrees. Ways are cut to it
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading .pbf extracts needs pyosmium (pip install osmium). Convert it to .osm otherwise")
+
+    class WayHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.list_ways = []
+
+        def way(self, w):
+            dict_tags = {tag.k: tag.v for tag in w.tags}
+            style = classify_way(dict_tags, len(w.nodes) >= 4 and w.is_closed())
+            if style is None:
+                return
+            list_coords = [(n.lat, n.lon) for n in w.nodes if n.location.valid() and is_in_bbox(n.lat, n.lon, bbox)]
+            if len(list_coords) >= 2:
+                self.list_ways.append((style, [c[0] for c in list_coords], [c[1] for c in list_coords]))
+
+    handler = WayHandler()
+    handler.apply_file(pbf_path, locations=True)
+    return VectorFeatures.from_ways(handler.list_ways, bbox)
+
+
+def load_features(path, cache_path=None, bbox=None):
+    """
+    Loads the features of an OSM extract: .osm, .pbf or the .npz of VectorFeatures.save.
+    With cache_path the extract is converted once and the npz is read while it is newer than the extract and was cut
+    to the same bbox
+    :param bbox: (y_min, x_min, y_max, x_max) in degrees to cut the extract to while it is read. None to read it all
+    """
+    if path.endswith('.npz'):
+        return VectorFeatures.load(path)
+    if bbox is not None:
+        bbox = tuple(float(v) for v in bbox)
+    if cache_path and os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        features = VectorFeatures.load(cache_path)
+        if features.bbox == bbox:
+            return features
+
+    time_start = time.perf_counter()
+    features = read_osm_pbf(path, bbox) if path.endswith('.pbf') else read_osm_xml(path, bbox)
+    print("Read %d basemap features in %.1fs" % (len(features), time.perf_counter() - time_start))
+    if cache_path:
+        features.save(cache_path)
+    return features
+
+
+class GridIndex:
+    """Spatial index of the features: lists of the features whose bounds touch each cell of a regular grid"""
+
+    def __init__(self, features, cell_deg=INDEX_CELL_DEG):
+        self.cell = cell_deg / 360.0  # In mercator units, the x size of the cell at the equator
+        self.dict_cells = defaultdict(list)
+        for i, (x_min, y_min, x_max, y_max) in enumerate(features.get_bounds()):
+            for cx in range(int(x_min // self.cell), int(x_max // self.cell) + 1):
+                for cy in range(int(y_min // self.cell), int(y_max // self.cell) + 1):
+                    self.dict_cells[(cx, cy)].append(i)
+
+    def query(self, x_min, y_min, x_max, y_max):
+        """Returns the sorted indexes of the features that may intersect the mercator box"""
+        list_found = []
+        for cx in range(int(x_min // self.cell), int(x_max // self.cell) + 1):
+            for cy in range(int(y_min // self.cell), int(y_max // self.cell) + 1):
+                list_found.extend(self.dict_cells.get((cx, cy), ()))
+        return np.unique(np.asarray(list_found, dtype=np.int64))
+
+
+class VectorTileSource:
+    """
+    Tile source that draws the mosaics from the features of a local OSM extract instead of downloading tiles, so maps
+    work offline and are not limited by the tile server. Only the features inside the mosaic are drawn, found with a
+    grid index. Relations are not read, e.g. multipolygon lakes or coastlines
+    """
+
+    def __init__(self, features, supersampling=2, background_color=BACKGROUND_COLOR):
+        """
+        :param features: VectorFeatures, e.g. from load_features
+        :param supersampling: Mosaics are drawn at this scale and reduced, for smooth edges. 1 to draw them directly
+        """
+        self.features = features
+        self.index = GridIndex(features)
+        self.supersampling = supersampling
+        self.background_color = background_color
+        self.lock_ = threading.Lock()  # Mosaics can be drawn from the prefetch thread
+        self.stats_maps = 0
+        self.stats_features = 0
+        self.stats_time_s = 0.0
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        """Returns the PIL mosaic of a tile range. Same arguments as smopy.fetch_map"""
+        x0, y0, x1, y1 = smopy.correct_box(box_tile, z)
+        n_tiles = 2.0 ** z
+        return self.__draw(x0 / n_tiles, y0 / n_tiles, (n_tiles * tilesize, n_tiles * tilesize),
+                           ((x1 - x0 + 1) * tilesize, (y1 - y0 + 1) * tilesize), z)
+
+    def get_view(self, bbox, size_px):
+        """
+        Returns the PIL image of exactly the (y_min, x_min, y_max, x_max) box in degrees, drawn at size_px
+        (width, height) instead of cut and resampled from a mosaic. Styles are the ones of the zoom of that scale
+        """
+        y_min_deg, x_min_deg, y_max_deg, x_max_deg = bbox
+        merc_x_min, merc_y_min = smopy.deg2num(y_max_deg, x_min_deg, 0, do_round=False)
+        merc_x_max, merc_y_max = smopy.deg2num(y_min_deg, x_max_deg, 0, do_round=False)
+        px_per_unit = (size_px[0] / (merc_x_max - merc_x_min), size_px[1] / (merc_y_max - merc_y_min))
+        # Zoom of the tiles with the same scale. Rounded so views at the scale of a zoom get its styles
+        z = round(math.log2(px_per_unit[0] / 256.0), 6)
+        return self.__draw(merc_x_min, merc_y_min, px_per_unit, size_px, z)
+
+    def __draw(self, merc_x_min, merc_y_min, px_per_unit, size_px, z):
+        """
+        Draws the features in an image of size_px (width, height) with its top left corner at the mercator point
+        :param px_per_unit: (x, y) pixels per mercator unit of the image
+        :param z: Zoom of the styles. Not an integer if the scale is not the one of a zoom
+        """
+        time_start = time.perf_counter()
+        scale = self.supersampling
+        size = (size_px[0] * scale, size_px[1] * scale)
+        img = Image.new('RGB', size, self.background_color)
+        draw = ImageDraw.Draw(img)
+
+        list_idx = self.index.query(merc_x_min, merc_y_min, merc_x_min + size_px[0] / px_per_unit[0],
+                                    merc_y_min + size_px[1] / px_per_unit[1])
+        px_per_unit_x = px_per_unit[0] * scale
+        px_per_unit_y = px_per_unit[1] * scale
+        n_drawn = 0
+        for idx_style, (kind, color, width, min_zoom) in enumerate(STYLES.values()):
+            if z < min_zoom:
+                continue
+            list_style = list_idx[self.features.style_idx[list_idx] == idx_style]
+            width_px = int(round(max(1.0, width * 2 ** ((z - 16) / 2.0)) * scale))
+            for i in list_style:
+                start, end = self.features.offsets[i], self.features.offsets[i + 1]
+                px_x = self.features.merc_x[start:end] * px_per_unit_x - merc_x_min * px_per_unit_x
+                px_y = self.features.merc_y[start:end] * px_per_unit_y - merc_y_min * px_per_unit_y
+                xy = np.column_stack([px_x, px_y]).ravel().tolist()
+                if kind == 'area':
+                    # Areas smaller than a pixel are not visible
+                    if px_x.max() - px_x.min() < scale and px_y.max() - px_y.min() < scale:
+                        continue
+                    draw.polygon(xy, fill=color)
+                else:
+                    draw.line(xy, fill=color, width=width_px, joint='curve')
+                n_drawn += 1
+
+        if scale > 1:
+            img = img.resize(tuple(size_px), Image.LANCZOS)
+        with self.lock_:
+            self.stats_maps += 1
+            self.stats_features += n_drawn
+            self.stats_time_s += time.perf_counter() - time_start
+        return img
+
+    def print_stats(self):
+        """Prints the maps drawn in the console"""
+        print("Vector basemap: %d maps drawn, %d features, %.2fs per map" % (
+            self.stats_maps, self.stats_features, self.stats_time_s / max(1, self.stats_maps)))
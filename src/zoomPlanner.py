@@ -0,0 +1,82 @@
+import math
+
+# Same limits and tile size as smopy and the OSM tile servers
+MAX_ZOOM = 19
+TILESIZE = 256
+
+
+def deg_to_tile(lat_deg, long_deg, z):
+    """Converts a lat,lon point to fractional tile coordinates at zoom z. Same formulas as smopy"""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** z
+    x_tile = (long_deg + 180.0) / 360.0 * n
+    y_tile = (1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi) / 2.0 * n
+    return x_tile, y_tile
+
+
+def get_tile_box(bbox, z):
+    """Returns the (x0, y0, x1, y1) range of tiles, both ends included, that covers a (y_min, x_min, y_max, x_max)
+    box in degrees at zoom z"""
+    y_min_deg, x_min_deg, y_max_deg, x_max_deg = bbox
+    x_a, y_a = deg_to_tile(y_min_deg, x_min_deg, z)
+    x_b, y_b = deg_to_tile(y_max_deg, x_max_deg, z)
+    n_max = 2 ** z - 1
+    x0 = max(0, int(math.floor(min(x_a, x_b))))
+    x1 = min(n_max, int(math.floor(max(x_a, x_b))))
+    y0 = max(0, int(math.floor(min(y_a, y_b))))
+    y1 = min(n_max, int(math.floor(max(y_a, y_b))))
+    return x0, y0, x1, y1
+
+
+def get_crop_size_px(bbox, z):
+    """Returns the (width, height) in pixels that a (y_min, x_min, y_max, x_max) box takes at zoom z"""
+    y_min_deg, x_min_deg, y_max_deg, x_max_deg = bbox
+    x_a, y_a = deg_to_tile(y_min_deg, x_min_deg, z)
+    x_b, y_b = deg_to_tile(y_max_deg, x_max_deg, z)
+    return abs(x_b - x_a) * TILESIZE, abs(y_b - y_a) * TILESIZE
+
+
+class ZoomPlan:
+    """Zoom level and tiles selected to show a crop at a given output size"""
+
+    def __init__(self, bbox, z, output_px):
+        self.bbox = bbox
+        self.z = z
+        self.tile_box = get_tile_box(bbox, z)
+        self.n_tiles_x = self.tile_box[2] - self.tile_box[0] + 1
+        self.n_tiles_y = self.tile_box[3] - self.tile_box[1] + 1
+        self.n_tiles = self.n_tiles_x * self.n_tiles_y
+
+        self.crop_px = get_crop_size_px(bbox, z)
+        self.mosaic_px = (self.n_tiles_x * TILESIZE, self.n_tiles_y * TILESIZE)
+        # Ratio of downloaded pixels that fall outside the crop
+        crop_area = self.crop_px[0] * self.crop_px[1]
+        self.wasted_px_ratio = 1 - crop_area / float(self.mosaic_px[0] * self.mosaic_px[1])
+        # Map pixels per output pixel. Below 1 the map is upscaled and looks blurry
+        self.resolution_ratio = max(self.crop_px[0] / float(output_px[0]), self.crop_px[1] / float(output_px[1]))
+
+
+def plan_zoom(bbox, output_px, oversampling=1.0, maxtiles=16, max_zoom=MAX_ZOOM):
+    """
+    Picks the lowest zoom level that shows the crop with at least oversampling map pixels per output pixel, and lowers
+    it if the tiles needed exceed the budget
+    :param bbox: Crop area in degrees as (y_min, x_min, y_max, x_max)
+    :param output_px: (width, height) in pixels of the image where the crop is shown. E.g. figure size times dpi
+    :param oversampling: Map pixels per output pixel wanted. 1 matches the output resolution
+    :param maxtiles: Tile budget. As in smopy, the tile count must be lower than this value
+    :param max_zoom: Highest zoom level available in the tile server
+    :return: ZoomPlan
+    """
+    # Each zoom level doubles the crop size in pixels
+    crop_w_px, crop_h_px = get_crop_size_px(bbox, 0)
+    ratio_z0 = max(crop_w_px / float(output_px[0]), crop_h_px / float(output_px[1]))
+    if ratio_z0 > 0:
+        z = int(math.ceil(math.log(oversampling / ratio_z0, 2)))
+    else:
+        z = max_zoom
+    z = min(max(z, 0), max_zoom)
+
+    plan = ZoomPlan(bbox, z, output_px)
+    while plan.n_tiles >= maxtiles and plan.z > 0:
+        plan = ZoomPlan(bbox, plan.z - 1, output_px)
+    return plan
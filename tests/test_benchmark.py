@@ -0,0 +1,38 @@
+import math
+import src.benchmark as benchmark
+
+BASE_KB = 100 * 1024
+# Rate at which run_memory_check fails with its defaults
+MAX_SLOPE_KB = 450.0 * 1024 / 10000
+
+
+def get_cache_samples_kb(n_frames, kb_per_frame=256, max_kb=64 * 1024):
+    """Memory of a cache that grows every frame until it is full"""
+    return [min(i * kb_per_frame, max_kb) for i in range(n_frames)]
+
+
+def test_memory_slope_ignores_cache_filling_up_to_its_budget():
+    list_budget_kb = get_cache_samples_kb(300)
+    list_samples_kb = [BASE_KB + budget_kb for budget_kb in list_budget_kb]
+    assert benchmark.get_memory_slope_kb(list_samples_kb, list_budget_kb) == 0
+    # Without the budget samples the filling cache looks like a leak
+    assert benchmark.get_memory_slope_kb(list_samples_kb) > MAX_SLOPE_KB
+
+
+def test_memory_slope_of_bounded_oscillation_is_small():
+    list_samples_kb = [BASE_KB + 20 * 1024 * math.sin(i / 8.0) for i in range(300)]
+    assert abs(benchmark.get_memory_slope_kb(list_samples_kb)) < MAX_SLOPE_KB / 2
+
+
+def test_memory_slope_detects_small_leak():
+    # 50 KB per frame is 488 MB over a 10000 frame render
+    list_budget_kb = get_cache_samples_kb(300, kb_per_frame=1024)
+    list_samples_kb = [BASE_KB + budget_kb + i * 50 + 2048 * math.sin(i / 5.0)
+                       for i, budget_kb in enumerate(list_budget_kb)]
+    slope_kb = benchmark.get_memory_slope_kb(list_samples_kb, list_budget_kb)
+    assert abs(slope_kb - 50) < 5
+    assert slope_kb > MAX_SLOPE_KB
+
+
+def test_memory_slope_of_too_few_samples_is_zero():
+    assert benchmark.get_memory_slope_kb([BASE_KB]) == 0
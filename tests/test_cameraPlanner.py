@@ -0,0 +1,101 @@
+import math
+import src.zoomPlanner as zoomPlanner
+import src.cameraPlanner as cameraPlanner
+
+OUTPUT_PX = (640, 480)
+
+
+def get_views(n_frames, step_deg=0.002, half_size_deg=0.01, lat_deg=40.41, lon_deg=-3.70):
+    """Views of a camera moving east and slowly zooming in and out"""
+    list_bbox = []
+    for i in range(n_frames):
+        half_deg = half_size_deg * (1.5 + math.sin(i / 7.0))
+        center_x = lon_deg + i * step_deg
+        list_bbox.append((lat_deg - half_deg, center_x - half_deg, lat_deg + half_deg, center_x + half_deg))
+    return list_bbox
+
+
+def plan_camera_reference(list_bbox, output_px, oversampling=1.0, maxtiles=16, smoothing_frames=5,
+                          min_resolution_ratio=0.7):
+    """plan_camera checking every frame of the map each time it grows, as it was first written"""
+    list_view_bbox = cameraPlanner.smooth_views(list_bbox, smoothing_frames)
+    list_z_view, list_min_ratio = [], []
+    for bbox in list_view_bbox:
+        plan = zoomPlanner.plan_zoom(bbox, output_px, oversampling, maxtiles)
+        list_z_view.append(plan.z)
+        list_min_ratio.append(min(min_resolution_ratio * oversampling, plan.resolution_ratio))
+
+    list_maps = []
+    idx_first = 0
+    while idx_first < len(list_view_bbox):
+        map_bbox = list_view_bbox[idx_first]
+        z_needed = list_z_view[idx_first]
+        z = min(cameraPlanner.get_max_zoom_in_budget(map_bbox, maxtiles, zoomPlanner.MAX_ZOOM), z_needed)
+        idx_last = idx_first
+        while idx_last + 1 < len(list_view_bbox):
+            map_bbox_next = cameraPlanner.bbox_union(map_bbox, list_view_bbox[idx_last + 1])
+            z_needed_next = max(z_needed, list_z_view[idx_last + 1])
+            z_next = min(cameraPlanner.get_max_zoom_in_budget(map_bbox_next, maxtiles, zoomPlanner.MAX_ZOOM),
+                         z_needed_next)
+            if any(zoomPlanner.ZoomPlan(list_view_bbox[j], z_next, output_px).resolution_ratio < list_min_ratio[j]
+                   for j in range(idx_first, idx_last + 2)):
+                break
+            map_bbox, z_needed, z = map_bbox_next, z_needed_next, z_next
+            idx_last += 1
+        list_maps.append((map_bbox, z, idx_first, idx_last))
+        idx_first = idx_last + 1
+    return list_maps
+
+
+def test_smooth_views_contain_the_original_views():
+    list_bbox = get_views(30, step_deg=0.01)
+    assert cameraPlanner.smooth_views(list_bbox, 1) == list_bbox
+    for bbox, bbox_smoothed in zip(list_bbox, cameraPlanner.smooth_views(list_bbox, 5)):
+        assert cameraPlanner.bbox_union(bbox, bbox_smoothed) == bbox_smoothed
+
+
+def test_plan_covers_every_frame_within_budget():
+    list_bbox = get_views(120)
+    camera_plan = cameraPlanner.plan_camera(list_bbox, OUTPUT_PX, maxtiles=16)
+
+    assert len(camera_plan.list_map_idx) == len(list_bbox)
+    idx_expected = 0
+    for idx_map, (map_bbox, z, idx_first, idx_last) in enumerate(camera_plan.list_maps):
+        assert idx_first == idx_expected
+        idx_expected = idx_last + 1
+        assert zoomPlanner.ZoomPlan(map_bbox, z, OUTPUT_PX).n_tiles < 16
+        for idx_frame in range(idx_first, idx_last + 1):
+            view_bbox = camera_plan.list_view_bbox[idx_frame]
+            assert camera_plan.list_map_idx[idx_frame] == idx_map
+            assert cameraPlanner.bbox_union(map_bbox, view_bbox) == map_bbox
+    assert idx_expected == len(list_bbox)
+
+
+def test_plan_keeps_resolution_of_every_view():
+    list_bbox = get_views(120)
+    camera_plan = cameraPlanner.plan_camera(list_bbox, OUTPUT_PX, maxtiles=16, min_resolution_ratio=0.7)
+    for idx_frame, view_bbox in enumerate(camera_plan.list_view_bbox):
+        _, z = camera_plan.get_map(idx_frame)
+        z_view = zoomPlanner.plan_zoom(view_bbox, OUTPUT_PX, maxtiles=16)
+        assert zoomPlanner.ZoomPlan(view_bbox, z, OUTPUT_PX).resolution_ratio >= \
+            min(0.7, z_view.resolution_ratio) - 1e-9
+
+
+def test_static_view_uses_a_single_map():
+    list_bbox = [(40.40, -3.72, 40.43, -3.68)] * 50
+    camera_plan = cameraPlanner.plan_camera(list_bbox, OUTPUT_PX)
+    assert len(camera_plan.list_maps) == 1
+    assert camera_plan.n_map_loads_per_frame_logic == 1
+
+
+def test_plan_loads_fewer_maps_than_frame_by_frame_logic():
+    list_bbox = get_views(200)
+    camera_plan = cameraPlanner.plan_camera(list_bbox, OUTPUT_PX)
+    assert len(camera_plan.list_maps) <= camera_plan.n_map_loads_per_frame_logic
+
+
+def test_plan_matches_full_recheck_of_the_map():
+    for step_deg, maxtiles in ((0.002, 16), (0.0005, 9), (0.01, 25)):
+        list_bbox = get_views(150, step_deg=step_deg)
+        camera_plan = cameraPlanner.plan_camera(list_bbox, OUTPUT_PX, maxtiles=maxtiles)
+        assert camera_plan.list_maps == plan_camera_reference(list_bbox, OUTPUT_PX, maxtiles=maxtiles)
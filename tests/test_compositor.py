@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import src.compositor as compositor
+
+FACECOLOR = (0, 0, 0, 1)
+
+
+def get_frame_count_panel(region):
+    """ExtraPanel of the frame_count preset in a region"""
+    size_in, fcn_static, _, fcn_draw = compositor.PANELS['frame_count']
+    return compositor.ExtraPanel(size_in, fcn_static, fcn_draw, region, FACECOLOR)
+
+
+def test_parse_region():
+    assert compositor.parse_region('10 20 300 400') == (10, 20, 300, 400)
+    assert compositor.parse_region('10, 20, 300, 400') == (10, 20, 300, 400)
+    for text in ['10 20 300', '10 20 0 400', '10 20 300 -1']:
+        with pytest.raises(ValueError):
+            compositor.parse_region(text)
+
+
+def test_fit_image_keeps_aspect():
+    rgba = np.zeros((100, 200, 4), dtype=np.uint8)
+    assert compositor.fit_image(rgba, (200, 100)) is rgba
+    assert compositor.fit_image(rgba, (100, 100)).shape == (50, 100, 4)
+    assert compositor.fit_image(rgba, (800, 300)).shape == (300, 600, 4)
+
+
+def test_panel_fits_its_region():
+    for region in [(0, 0, 500, 100), (0, 0, 400, 300), (0, 0, 1000, 90)]:
+        rgba = get_frame_count_panel(region).get_image((1, 10))
+        height, width = rgba.shape[:2]
+        assert width <= region[2] and height <= region[3]
+        # Same aspect as the 10x2 in figure, filling the region on one side
+        assert width == region[2] or height == region[3]
+        assert abs(width / height - 5) < 0.1
+
+
+def test_panel_reuses_image_of_same_content():
+    panel = get_frame_count_panel((0, 0, 500, 100))
+    rgba_first = panel.get_image((1, 10)).copy()
+    assert panel.get_image((1, 10)) is panel.get_image((1, 10))
+    assert (panel.stats_drawn, panel.stats_reused) == (1, 2)
+
+    rgba_second = panel.get_image((2, 10))
+    assert panel.stats_drawn == 2
+    assert not np.array_equal(rgba_first, rgba_second)
+    # Drawn over the cached background, without the artists of the previous content
+    assert np.array_equal(panel.get_image((1, 10)), rgba_first)
+    assert panel.stats_drawn == 3
+
+
+def test_compose_places_map_and_panels():
+    data_exif = {'timestampMs': [None] * 10}
+    dict_layout = {'map': (0, 0, 200, 200), 'frame_count': (0, 200, 500, 100)}
+    obj_compositor = compositor.DashboardCompositor(dict_layout, (500, 300), data_exif, 2)
+    rgba_map = np.full((200, 200, 4), 255, dtype=np.uint8)
+
+    canvas = obj_compositor.compose(rgba_map, 1, 2)
+    assert canvas.shape == (300, 500, 4)
+    assert np.array_equal(canvas[:200, :200], rgba_map)
+    assert np.all(canvas[:200, 200:] == (0, 0, 0, 255))
+    panel = obj_compositor.dict_panels['frame_count']
+    assert np.array_equal(canvas[200:, :], panel.get_image((1, 8)))
+
+    # Tween frames of the same image reuse its panel
+    obj_compositor.compose(rgba_map, 2, 2)
+    obj_compositor.compose(rgba_map, 3, 3)
+    assert panel.content_ == (2, 8)
+    assert panel.stats_drawn == 2
+
+
+def test_panel_out_of_canvas_is_rejected():
+    with pytest.raises(ValueError):
+        compositor.DashboardCompositor({'map': (0, 0, 200, 200)}, (150, 200), {'timestampMs': []}, 0)
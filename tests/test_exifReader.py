@@ -0,0 +1,144 @@
+import io
+import struct
+from types import SimpleNamespace
+from datetime import datetime
+from fractions import Fraction
+import exifread
+from PIL import Image
+import src.exifReader as exifReader
+import src.extractExif as extractExif
+import src.syntheticData as syntheticData
+
+LIST_TAG_NAMES = ['Image DateTime', 'GPS GPSLatitudeRef', 'GPS GPSLatitude', 'GPS GPSLongitudeRef',
+                  'GPS GPSLongitude']
+
+
+def get_jpeg_bytes():
+    """Small jpeg without exif"""
+    f = io.BytesIO()
+    Image.new('RGB', (16, 16), (40, 90, 160)).save(f, format='JPEG')
+    return f.getvalue()
+
+
+def build_tiff(endian):
+    """TIFF data of an Exif segment with DateTime and a GPS IFD at 33 deg 51' 54" S, 151 deg 12' 36" E"""
+    def entry(tag, field_type, count, value):
+        return struct.pack(endian + 'HHI', tag, field_type, count) + value
+
+    def inline_ascii(text):
+        return text.encode('ascii').ljust(4, b'\x00')
+
+    datetime_bytes = b'2023:05:01 23:00:01\x00'
+    offset_ifd0 = 8
+    offset_datetime = offset_ifd0 + 2 + 2 * 12 + 4
+    offset_gps = offset_datetime + len(datetime_bytes)
+    offset_lat = offset_gps + 2 + 4 * 12 + 4
+    offset_lon = offset_lat + 24
+    data = (b'II*\x00' if endian == '<' else b'MM\x00*') + struct.pack(endian + 'I', offset_ifd0)
+    data += struct.pack(endian + 'H', 2)
+    data += entry(exifReader.TAG_DATETIME, exifReader.TYPE_ASCII, len(datetime_bytes),
+                  struct.pack(endian + 'I', offset_datetime))
+    data += entry(exifReader.TAG_GPS_IFD, exifReader.TYPE_LONG, 1, struct.pack(endian + 'I', offset_gps))
+    data += struct.pack(endian + 'I', 0) + datetime_bytes
+    data += struct.pack(endian + 'H', 4)
+    data += entry(exifReader.TAG_GPS_LATITUDE_REF, exifReader.TYPE_ASCII, 2, inline_ascii('S'))
+    data += entry(exifReader.TAG_GPS_LATITUDE, exifReader.TYPE_RATIONAL, 3, struct.pack(endian + 'I', offset_lat))
+    data += entry(exifReader.TAG_GPS_LONGITUDE_REF, exifReader.TYPE_ASCII, 2, inline_ascii('E'))
+    data += entry(exifReader.TAG_GPS_LONGITUDE, exifReader.TYPE_RATIONAL, 3, struct.pack(endian + 'I', offset_lon))
+    data += struct.pack(endian + 'I', 0)
+    data += struct.pack(endian + '6I', 33, 1, 51, 1, 54, 1)
+    data += struct.pack(endian + '6I', 151, 1, 12, 1, 72, 2)
+    return data
+
+
+def build_jpeg(tiff_data, prefix_segment_bytes=0):
+    """Jpeg with the TIFF data in its Exif segment, after an APP2 segment of prefix_segment_bytes if not 0"""
+    jpeg = get_jpeg_bytes()
+    segments = b''
+    if prefix_segment_bytes:
+        segments += b'\xff\xe2' + struct.pack('>H', prefix_segment_bytes + 2) + b'\x00' * prefix_segment_bytes
+    payload = exifReader.EXIF_HEADER + tiff_data
+    segments += b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+    return jpeg[:2] + segments + jpeg[2:]
+
+
+def get_values(exif_tags):
+    """Tag values as plain python values, to compare the fast path with exifread"""
+    dict_values = {}
+    for name in LIST_TAG_NAMES:
+        if name in exif_tags:
+            values = exif_tags[name].values
+            if isinstance(values, list):
+                values = [Fraction(value.numerator, value.denominator) for value in values]
+            dict_values[name] = values
+    return dict_values
+
+
+def test_reads_same_tags_as_exifread(tmp_path):
+    img_path = str(tmp_path / "IMG_00000.jpg")
+    syntheticData.write_jpeg_with_exif(img_path, datetime(2023, 5, 1, 23, 0, 1), -33.865, 151.21)
+    with open(img_path, 'rb') as f:
+        exif_tags = exifReader.read_exif_tags(f)
+        f.seek(0)
+        exif_tags_exifread = exifread.process_file(f, details=False)
+
+    assert get_values(exif_tags) == get_values(exif_tags_exifread)
+    assert set(get_values(exif_tags)) == set(LIST_TAG_NAMES)
+
+
+def test_reads_both_byte_orders():
+    for endian in ('<', '>'):
+        jpeg = build_jpeg(build_tiff(endian))
+        exif_tags = exifReader.read_exif_tags(io.BytesIO(jpeg))
+        assert get_values(exif_tags) == get_values(exifread.process_file(io.BytesIO(jpeg), details=False))
+        assert exif_tags['Image DateTime'].values == '2023:05:01 23:00:01'
+        assert exif_tags['GPS GPSLatitudeRef'].values == 'S'
+        assert exif_tags['GPS GPSLongitude'].values == [Fraction(151), Fraction(12), Fraction(36)]
+        assert extractExif.extract_gps_exif(exif_tags) == (-(33 + 51 / 60.0 + 54 / 3600.0),
+                                                           151 + 12 / 60.0 + 36 / 3600.0)
+
+
+def test_gps_keeps_fractional_seconds():
+    # 34.12 seconds as a camera writes them, and as the Ratio of exifread before 3.0 that has no numerator
+    list_seconds = [Fraction(3412, 100), SimpleNamespace(num=3412, den=100)]
+    for seconds in list_seconds:
+        exif_tags = {'GPS GPSLatitude': exifReader.ExifTag([Fraction(48), Fraction(51), seconds]),
+                     'GPS GPSLatitudeRef': exifReader.ExifTag('N'),
+                     'GPS GPSLongitude': exifReader.ExifTag([Fraction(2), Fraction(2101, 100), Fraction(0)]),
+                     'GPS GPSLongitudeRef': exifReader.ExifTag('W')}
+        gps_lat, gps_lon = extractExif.extract_gps_exif(exif_tags)
+        assert abs(gps_lat - (48 + 51 / 60.0 + 34.12 / 3600.0)) < 1e-12
+        assert abs(gps_lon - -(2 + 21.01 / 60.0)) < 1e-12
+
+
+def test_photo_without_gps_has_only_datetime(tmp_path):
+    img_path = str(tmp_path / "IMG_00000.jpg")
+    syntheticData.write_jpeg_with_exif(img_path, datetime(2023, 5, 1, 23, 0, 1))
+    with open(img_path, 'rb') as f:
+        exif_tags = exifReader.read_exif_tags(f)
+    assert list(exif_tags) == ['Image DateTime']
+    assert extractExif.extract_gps_exif(exif_tags) == (91, 181)
+
+
+def test_jpeg_without_exif_has_no_tags():
+    assert exifReader.read_exif_tags(io.BytesIO(get_jpeg_bytes())) == {}
+
+
+def test_other_layouts_fall_back_to_exifread(tmp_path):
+    # Not a jpeg
+    f = io.BytesIO()
+    Image.new('RGB', (16, 16)).save(f, format='PNG')
+    f.seek(0)
+    assert exifReader.read_exif_tags(f) is None
+    # Exif segment beyond the prefix that is read
+    jpeg = build_jpeg(build_tiff('<'), prefix_segment_bytes=4096)
+    assert exifReader.read_exif_tags(io.BytesIO(jpeg), max_bytes=1024) is None
+    assert get_values(exifReader.read_exif_tags(io.BytesIO(jpeg))) == get_values(
+        exifReader.read_exif_tags(io.BytesIO(build_jpeg(build_tiff('<')))))
+    # Truncated GPS IFD
+    assert exifReader.read_exif_tags(io.BytesIO(build_jpeg(build_tiff('<')[:80]))) is None
+
+    img_path = tmp_path / "truncated.jpg"
+    img_path.write_bytes(build_jpeg(build_tiff('>')[:80]))
+    _, b_fast_path = extractExif.read_exif_tags(str(img_path))
+    assert not b_fast_path
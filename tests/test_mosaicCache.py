@@ -0,0 +1,87 @@
+import numpy as np
+from PIL import Image
+import src.memoryBudget as memoryBudget
+import src.mosaicCache as mosaicCache
+
+TILESIZE = 256
+TILE_BYTES = TILESIZE * TILESIZE * 3
+
+
+def make_mosaic(x0, y0, x1, y1):
+    """Mosaic of a tile range where each tile is filled with a color made from its x, y"""
+    pixels = np.zeros(((y1 - y0 + 1) * TILESIZE, (x1 - x0 + 1) * TILESIZE, 3), dtype=np.uint8)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            left_px, top_px = (x - x0) * TILESIZE, (y - y0) * TILESIZE
+            pixels[top_px:top_px + TILESIZE, left_px:left_px + TILESIZE] = (x % 256, y % 256, 128)
+    return Image.fromarray(pixels)
+
+
+def test_find_crops_contained_range():
+    cache = mosaicCache.MosaicCache()
+    cache.add((10, 20, 13, 22), 6, make_mosaic(10, 20, 13, 22))
+
+    img = cache.find((11, 21, 12, 22), 6)
+    assert img.size == (2 * TILESIZE, 2 * TILESIZE)
+    assert np.array_equal(np.asarray(img), np.asarray(make_mosaic(11, 21, 12, 22)))
+    assert cache.stats_hits == 1
+
+
+def test_find_misses_other_zoom_and_uncovered_range():
+    cache = mosaicCache.MosaicCache()
+    cache.add((10, 20, 13, 22), 6, make_mosaic(10, 20, 13, 22))
+
+    assert cache.find((11, 21, 12, 22), 7) is None
+    assert cache.find((12, 21, 14, 22), 6) is None
+    assert cache.stats_misses == 2
+    assert not cache.contains((12, 21, 14, 22), 6)
+
+
+def test_find_prefers_smallest_containing_mosaic():
+    cache = mosaicCache.MosaicCache()
+    cache.add((0, 0, 7, 7), 5, make_mosaic(0, 0, 7, 7))
+    small = make_mosaic(2, 2, 3, 3)
+    cache.add((2, 2, 3, 3), 5, small)
+
+    # The exact range is returned as stored, without a crop
+    assert cache.find((2, 2, 3, 3), 5) is small
+
+
+def test_evicts_least_recently_used():
+    cache = mosaicCache.MosaicCache(max_mb=2 * TILE_BYTES / 1024.0 / 1024.0)
+    cache.add((0, 0, 0, 0), 4, make_mosaic(0, 0, 0, 0))
+    cache.add((1, 0, 1, 0), 4, make_mosaic(1, 0, 1, 0))
+    # Using the first mosaic makes the second one the least recently used
+    assert cache.find((0, 0, 0, 0), 4) is not None
+    cache.add((2, 0, 2, 0), 4, make_mosaic(2, 0, 2, 0))
+
+    assert len(cache) == 2
+    assert cache.size_bytes == 2 * TILE_BYTES
+    assert cache.stats_evicted == 1
+    assert cache.contains((0, 0, 0, 0), 4)
+    assert not cache.contains((1, 0, 1, 0), 4)
+    assert cache.contains((2, 0, 2, 0), 4)
+
+
+def test_mosaic_larger_than_cache_is_not_stored():
+    cache = mosaicCache.MosaicCache(max_mb=TILE_BYTES / 1024.0 / 1024.0)
+    cache.add((0, 0, 1, 0), 4, make_mosaic(0, 0, 1, 0))
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+
+def test_memory_budget_evicts_from_cache():
+    budget = memoryBudget.MemoryBudget(max_mb=3 * TILE_BYTES / 1024.0 / 1024.0)
+    cache = mosaicCache.MosaicCache(max_mb=64, memory_budget=budget)
+    for x in range(3):
+        cache.add((x, 0, x, 0), 4, make_mosaic(x, 0, x, 0))
+    assert budget.used_bytes == 3 * TILE_BYTES
+
+    # Another user of the budget takes the room of the oldest mosaic
+    assert budget.reserve('prefetch', TILE_BYTES)
+    assert len(cache) == 2
+    assert not cache.contains((0, 0, 0, 0), 4)
+    assert budget.dict_owner_bytes['mosaic_cache'] == cache.size_bytes == 2 * TILE_BYTES
+
+    cache.clear()
+    assert budget.used_bytes == TILE_BYTES
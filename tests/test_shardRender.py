@@ -0,0 +1,85 @@
+import os
+import importlib
+import matplotlib
+matplotlib.use('Agg')
+import pytest
+import src.helpers as helpers
+import src.syntheticData as syntheticData
+import src.extractExif as extractExif
+import src.extractGoogleLocationHistory as extractGoogleLocation
+import src.mapplot as mapplot
+import src.shardRender as shardRender
+
+# Name, module, function, needs location, subfolder, params. As the cli plans them
+LIST_PRESETS = [
+    ('centered', 'src.mapplotAnimationPresets', 'centered_on_location', True, 'centered/', {'n_tween': 0}),
+    ('region_expanding_last', 'src.mapplotAnimationPresets', 'region_expanding_by_last_n_pics', True,
+     'region_expanding_last/', {'n_tween': 1, 'camera_plan': False}),
+    ('frame_count', 'src.extraAnimationPresets', 'frame_count', False, 'extra/frame_count/', {}),
+]
+IMG_START = 2
+IMG_END = 8
+
+
+@pytest.fixture
+def trip_data(tmp_path, monkeypatch):
+    """Exif and location data of a small synthetic trip, with maps from a local stub tile server"""
+    trip = syntheticData.generate_trip(str(tmp_path / 'trip') + '/', n_photos=10, n_locations=400, n_days=1)
+    aux_folder = str(tmp_path / 'auxiliar') + '/'
+    helpers.ensure_directory(aux_folder)
+    extractExif.extract_exif_folder(trip['pics_folder'], aux_folder)
+    dict_exif = extractExif.load_exif_data(aux_folder, trip['timezone_hour_diff'], autofix=False)
+    extractGoogleLocation.extract_from_location_history(
+        trip['location_history_path'], aux_folder, dict_exif['timestampMs'][0], dict_exif['timestampMs'][-1])
+    dict_loc_history = extractGoogleLocation.load_location_history_data(aux_folder)
+
+    server = syntheticData.StubTileServer().start()
+    monkeypatch.setattr(mapplot.MapPlot, 'tileserver', server.get_tileserver_url())
+    monkeypatch.setattr(mapplot.MapPlot, 'download_delay_s', 0)
+    yield dict_exif, dict_loc_history
+    server.stop()
+
+
+def get_files(folder):
+    """Contents of the files in a folder and its subfolders by relative path"""
+    dict_files = {}
+    for root, _, list_names in os.walk(folder):
+        for name in list_names:
+            with open(os.path.join(root, name), 'rb') as f:
+                dict_files[os.path.relpath(os.path.join(root, name), folder)] = f.read()
+    return dict_files
+
+
+def test_shards_render_same_frames_as_single_run(tmp_path, trip_data):
+    dict_exif, dict_loc_history = trip_data
+    list_presets = [{'name': name, 'module': module, 'function': function, 'needs_location': needs_location,
+                     'subfolder': subfolder, 'params': params}
+                    for name, module, function, needs_location, subfolder, params in LIST_PRESETS]
+
+    single_folder = str(tmp_path / 'single') + '/'
+    for preset in list_presets:
+        preset_fcn = getattr(importlib.import_module(preset['module']), preset['function'])
+        if preset['needs_location']:
+            preset_fcn(dict_exif, dict_loc_history, IMG_START, IMG_END,
+                       output_folder=single_folder + preset['subfolder'], **preset['params'])
+        else:
+            preset_fcn(dict_exif, IMG_START, IMG_END, output_folder=single_folder + preset['subfolder'])
+
+    manifest_path = str(tmp_path / 'shards.json')
+    shards_folder = str(tmp_path / 'shards') + '/'
+    merged_folder = str(tmp_path / 'merged') + '/'
+    manifest = shardRender.plan_shards(manifest_path, dict_exif, dict_loc_history, IMG_START, IMG_END, 3,
+                                       list_presets)
+    assert len(manifest['shards']) == 3
+    for shard in manifest['shards']:
+        shardRender.run_shard(manifest_path, shard['shard'], shardRender.get_shard_folder(shards_folder,
+                                                                                          shard['shard']))
+    shardRender.merge_shards(manifest_path, shards_folder, merged_folder)
+
+    dict_single = get_files(single_folder)
+    dict_merged = get_files(merged_folder)
+    # 6 images, 11 frames with the tweens, and a syncfile per preset
+    assert len(dict_single) == 6 + 11 + 6 + 3
+    assert sorted(dict_merged) == sorted(dict_single)
+    for path, content in dict_single.items():
+        assert dict_merged[path] == content, path
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+import smopy
+from PIL import Image
+import src.syntheticData as syntheticData
+import src.tilePool as tilePool
+
+TILESIZE = 256
+
+
+def make_tile(x, y, z):
+    """Tile filled with a color made from its x, y, z"""
+    return Image.new('RGB', (TILESIZE, TILESIZE), (x % 256, y % 256, 10 * z))
+
+
+class RecordingSource:
+    """Fallback source that returns black mosaics and records the ranges it was asked for"""
+
+    def __init__(self):
+        self.list_calls = []
+
+    def get_mosaic(self, box_tile, z, tileserver, tilesize, maxtiles):
+        self.list_calls.append((box_tile, z))
+        x0, y0, x1, y1 = box_tile
+        return Image.new('RGB', ((x1 - x0 + 1) * tilesize, (y1 - y0 + 1) * tilesize))
+
+
+@pytest.fixture
+def tile_server():
+    server = syntheticData.StubTileServer().start()
+    yield server
+    server.stop()
+
+
+def test_reopened_pool_returns_same_pixels(tmp_path):
+    path = str(tmp_path / 'tiles.pool')
+    pool = tilePool.TilePool.create(path, 4, 'stub')
+    list_zxy = [(6, 10, 20), (6, 11, 20), (7, 10, 20)]
+    for z, x, y in list_zxy:
+        assert pool.add_tile(x, y, z, make_tile(x, y, z))
+    pool.close()
+
+    reader = tilePool.TilePool(path)
+    assert reader.source_name == 'stub'
+    assert len(reader) == 3
+    for z, x, y in list_zxy:
+        tile = reader.get_tile(x, y, z)
+        assert not tile.flags.writeable
+        assert np.array_equal(tile, np.asarray(make_tile(x, y, z)))
+    assert reader.get_tile(12, 20, 6) is None
+    # The views over the pages are released before the pool is unmapped
+    del tile
+    reader.close()
+
+
+def test_reader_sees_tiles_added_after_it_opened(tmp_path):
+    path = str(tmp_path / 'tiles.pool')
+    pool = tilePool.TilePool.create(path, 4, 'stub')
+    reader = tilePool.TilePool(path)
+    assert reader.get_tile(10, 20, 6) is None
+
+    pool.add_tile(10, 20, 6, make_tile(10, 20, 6))
+    assert np.array_equal(reader.get_tile(10, 20, 6), np.asarray(make_tile(10, 20, 6)))
+    reader.close()
+    pool.close()
+
+
+def test_full_pool_rejects_tiles(tmp_path):
+    pool = tilePool.TilePool.create(str(tmp_path / 'tiles.pool'), 2, 'stub')
+    assert pool.add_tile(0, 0, 1, make_tile(0, 0, 1))
+    assert pool.add_tile(1, 0, 1, make_tile(1, 0, 1))
+    # A tile already stored is not added again
+    assert pool.add_tile(1, 0, 1, make_tile(1, 0, 1))
+    assert not pool.add_tile(0, 1, 1, make_tile(0, 1, 1))
+    assert len(pool) == 2
+    assert not pool.contains(0, 1, 1)
+    pool.close()
+
+
+def test_pool_mosaic_equals_downloaded_map(tmp_path, tile_server):
+    tileserver = tile_server.get_tileserver_url()
+    box_tile, z = (33, 22, 35, 24), 6
+    list_ranges = [(z,) + box_tile]
+    pool = tilePool.TilePool.create(str(tmp_path / 'tiles.pool'), 16, tileserver)
+    assert tilePool.fill_pool(pool, list_ranges, tileserver, 0) == 9
+    assert tilePool.fill_pool(pool, list_ranges, tileserver, 0) == 0
+
+    source = tilePool.TilePoolSource(tilePool.TilePool(pool.path), download_delay_s=0)
+    n_served = tile_server.tiles_served
+    img = source.get_mosaic(box_tile, z, tileserver, TILESIZE, 16)
+    assert tile_server.tiles_served == n_served
+    assert source.stats_maps_from_pool == 1
+    expected = smopy.fetch_map(box_tile, z, tileserver, TILESIZE, 16)
+    assert np.array_equal(np.asarray(img), np.asarray(expected.convert('RGB')))
+    source.pool.close()
+    pool.close()
+
+
+def test_missing_tiles_use_fallback_source(tmp_path):
+    pool = tilePool.TilePool.create(str(tmp_path / 'tiles.pool'), 4, 'stub')
+    for x in (10, 11):
+        pool.add_tile(x, 20, 6, make_tile(x, 20, 6))
+    fallback_source = RecordingSource()
+    source = tilePool.TilePoolSource(pool, fallback_source)
+
+    source.get_mosaic((10, 20, 11, 20), 6, 'stub', TILESIZE, 16)
+    assert fallback_source.list_calls == []
+    # One tile of the range is not in the pool
+    source.get_mosaic((10, 20, 12, 20), 6, 'stub', TILESIZE, 16)
+    # Another tile size cannot be assembled from the pool
+    source.get_mosaic((10, 20, 11, 20), 6, 'stub', 512, 16)
+    assert fallback_source.list_calls == [((10, 20, 12, 20), 6), ((10, 20, 11, 20), 6)]
+    assert (source.stats_maps_from_pool, source.stats_maps_fallback) == (1, 2)
+    pool.close()
+
+
+def test_full_pool_downloads_missing_tiles(tmp_path, tile_server):
+    tileserver = tile_server.get_tileserver_url()
+    pool = tilePool.TilePool.create(str(tmp_path / 'tiles.pool'), 2, tileserver)
+    assert tilePool.fill_pool(pool, [(6, 33, 22, 35, 22)], tileserver, 0) == 2
+    source = tilePool.TilePoolSource(pool, download_delay_s=0)
+
+    n_served = tile_server.tiles_served
+    img = source.get_mosaic((33, 22, 35, 22), 6, tileserver, TILESIZE, 16)
+    assert tile_server.tiles_served == n_served + 3
+    assert source.stats_maps_fallback == 1
+    expected = smopy.fetch_map((33, 22, 35, 22), 6, tileserver, TILESIZE, 16)
+    assert np.array_equal(np.asarray(img.convert('RGB')), np.asarray(expected.convert('RGB')))
+    pool.close()
+
+
+def test_open_pool_source_checks_source_name(tmp_path):
+    path = str(tmp_path / 'tiles.pool')
+    assert tilePool.open_pool_source(path, 'stub') is None
+    tilePool.TilePool.create(path, 2, 'other').close()
+    assert tilePool.open_pool_source(path, 'stub') is None
+    source = tilePool.open_pool_source(path, 'other')
+    assert source.pool.source_name == 'other'
+    source.pool.close()
@@ -0,0 +1,86 @@
+from datetime import datetime
+import numpy as np
+import src.track as track
+import src.mapplotAnimationPresets as mapplotAnimationPresets
+
+START_MS = track.datetime_to_ms(datetime(2023, 5, 1, 21, 0, 0))
+
+
+def get_dense_history(n_samples=6 * 3600, step_ms=1000, seed=0):
+    """Location history with a sample every step_ms and a jitter, moving north east"""
+    rng = np.random.default_rng(seed)
+    timestamp_ms = START_MS + np.arange(n_samples) * step_ms + rng.integers(0, step_ms // 2, n_samples)
+    latitude = 40.41 + np.cumsum(rng.uniform(0, 2e-5, n_samples))
+    longitude = -3.70 + np.cumsum(rng.uniform(0, 2e-5, n_samples))
+    return track.Track(timestamp_ms, latitude, longitude)
+
+
+def get_photos(list_offset_ms, timezone_h=2):
+    """Exif track of photos taken at START_MS plus each offset"""
+    timestamp_ms = START_MS + np.array(list_offset_ms, dtype=np.int64)
+    n_photos = len(timestamp_ms)
+    return track.Track(timestamp_ms, np.zeros(n_photos), np.zeros(n_photos),
+                       filename=["IMG_%05d.jpg" % i for i in range(n_photos)], pic_idx=np.arange(n_photos),
+                       timezone_h=timezone_h)
+
+
+def test_anchors_are_photos_and_local_day_starts():
+    # 21:00 UTC is 23:00 at UTC+2, the second photo is on the next local day. Day starts keep the milliseconds
+    data_exif = get_photos([1500, 2 * 3600 * 1000 + 250], timezone_h=2)
+    anchors_ms = track.get_anchor_timestamps_ms(data_exif)
+
+    list_day_start = [track.datetime_to_ms(datetime(2023, 4, 30, 22, 0, 0)) + 500,
+                      track.datetime_to_ms(datetime(2023, 5, 1, 22, 0, 0)) + 250]
+    assert list(anchors_ms) == sorted(list(data_exif.timestamp_ms) + list_day_start)
+
+
+def test_resample_interval_keeps_a_sample_per_interval():
+    history = get_dense_history()
+    resampled = track.resample(history, interval_s=60)
+
+    assert len(resampled) < len(history) / 30
+    assert resampled.timestamp_ms[0] == history.timestamp_ms[0]
+    assert resampled.timestamp_ms[-1] == history.timestamp_ms[-1]
+    assert np.all(np.diff(resampled.timestamp_ms // 60000) <= 1)
+    assert resampled.is_sorted
+
+
+def test_resample_distance_keeps_a_sample_per_distance():
+    history = get_dense_history()
+    resampled = track.resample(history, distance_m=100)
+
+    lat_rad = np.radians(resampled.latitude)
+    step_x = np.radians(np.diff(resampled.longitude)) * np.cos((lat_rad[1:] + lat_rad[:-1]) / 2)
+    step_m = np.hypot(step_x, np.diff(lat_rad)) * track.EARTH_RADIUS_M
+    # Consecutive kept samples are in consecutive 100 m bins, plus the step of one dense sample
+    assert len(resampled) < len(history) / 10
+    assert np.all(step_m < 200 + 5)
+
+
+def test_resample_preserves_samples_around_anchors():
+    history = get_dense_history()
+    # Photos between samples, on a sample and before and after the history
+    data_exif = get_photos([-5000, 1500, 3600 * 1000 + 123, 4 * 3600 * 1000, 8 * 3600 * 1000])
+    data_exif.timestamp_ms[3] = history.timestamp_ms[14400]
+    anchors_ms = track.get_anchor_timestamps_ms(data_exif)
+    resampled = track.resample(history, interval_s=300, anchors_ms=anchors_ms)
+    assert len(resampled) < len(history) / 100
+
+    for anchor_ms in anchors_ms:
+        target = track.ms_to_datetime(anchor_ms)
+        idx_closest = mapplotAnimationPresets.get_index_close_to_timestamp_track(history, target)
+        idx_closest_resampled = mapplotAnimationPresets.get_index_close_to_timestamp_track(resampled, target)
+        assert resampled.timestamp_ms[idx_closest_resampled] == history.timestamp_ms[idx_closest]
+
+        idx_previous = mapplotAnimationPresets.get_index_previous_timestamp(history, target, len(history) - 1)
+        idx_previous_resampled = mapplotAnimationPresets.get_index_previous_timestamp(resampled, target,
+                                                                                      len(resampled) - 1)
+        assert resampled.timestamp_ms[idx_previous_resampled] == history.timestamp_ms[idx_previous]
+
+
+def test_resample_returns_unsorted_and_disabled_tracks_unchanged():
+    history = get_dense_history(100)
+    assert track.resample(history) is history
+
+    unsorted = track.Track(history.timestamp_ms[::-1], history.latitude, history.longitude)
+    assert track.resample(unsorted, interval_s=10) is unsorted
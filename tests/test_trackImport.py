@@ -0,0 +1,136 @@
+import struct
+from datetime import datetime
+import pytest
+import src.track as track
+import src.trackImport as trackImport
+
+START_MS = track.datetime_to_ms(datetime(2023, 5, 1, 10, 0, 0))
+START_FIT_S = START_MS // 1000 - trackImport.FIT_EPOCH_S
+
+
+def to_semicircles(value_deg):
+    return int(round(value_deg / trackImport.FIT_SEMICIRCLES_TO_DEG))
+
+
+def definition(local_type, global_num, list_fields, list_dev_fields=()):
+    """Definition message of little endian fields given as (field number, size, base type)"""
+    header = 0x40 | local_type | (0x20 if list_dev_fields else 0)
+    data = struct.pack('<BBBHB', header, 0, 0, global_num, len(list_fields))
+    data += b''.join(struct.pack('<BBB', *field) for field in list_fields)
+    if list_dev_fields:
+        data += struct.pack('<B', len(list_dev_fields)) + b''.join(struct.pack('<BBB', *field)
+                                                                   for field in list_dev_fields)
+    return data
+
+
+def write_fit(path, list_messages):
+    """Writes a FIT file with the messages, given as bytes. The CRCs are not checked by the reader, they are 0"""
+    data = b''.join(list_messages)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<BBHI4sH', 14, 0x20, 2132, len(data), b'.FIT', 0))
+        f.write(data)
+        f.write(b'\x00\x00')
+
+
+def test_iter_fit_reads_full_and_compressed_timestamps(tmp_path):
+    fit_path = str(tmp_path / "ride.fit")
+    timestamp_s = START_FIT_S - START_FIT_S % 32 + 28  # Low 5 bits are 28, the compressed offsets roll over
+    list_messages = [
+        # Local type 0: record with timestamp, latitude, longitude and a developer field of 2 bytes
+        definition(0, trackImport.FIT_MSG_RECORD, [(253, 4, 0x86), (0, 4, 0x85), (1, 4, 0x85)], [(0, 2, 0)]),
+        # Local type 1: record with position only, for compressed timestamp headers
+        definition(1, trackImport.FIT_MSG_RECORD, [(0, 4, 0x85), (1, 4, 0x85)]),
+        # Local type 2: event, not a record, with a timestamp
+        definition(2, 21, [(253, 4, 0x86), (0, 1, 0x00)]),
+        struct.pack('<BIii', 0, timestamp_s, to_semicircles(40.0), to_semicircles(-3.0)) + b'\x07\x00',
+        # Offsets 30 and then 2 and 5, after the rollover
+        struct.pack('<Bii', 0x80 | (1 << 5) | 30, to_semicircles(40.001), to_semicircles(-3.001)),
+        struct.pack('<Bii', 0x80 | (1 << 5) | 2, to_semicircles(40.002), to_semicircles(-3.002)),
+        # Record without position is skipped, its timestamp is still the last one
+        struct.pack('<Bii', 0x80 | (1 << 5) | 5, trackImport.FIT_INVALID_SINT32, trackImport.FIT_INVALID_SINT32),
+        # A full timestamp of another message is the base of the next compressed ones
+        struct.pack('<BIB', 2, timestamp_s + 100, 0),
+        struct.pack('<Bii', 0x80 | (1 << 5) | ((timestamp_s + 103) & 0x1F), to_semicircles(40.003),
+                    to_semicircles(-3.003)),
+    ]
+    write_fit(fit_path, list_messages)
+
+    list_samples = list(trackImport.iter_fit(fit_path, accuracy_m=5))
+    assert [sample[0] for sample in list_samples] == [
+        (trackImport.FIT_EPOCH_S + timestamp_s + offset_s) * 1000 for offset_s in (0, 2, 6, 103)]
+    assert [round(sample[1], 6) for sample in list_samples] == [40.0, 40.001, 40.002, 40.003]
+    assert [round(sample[2], 6) for sample in list_samples] == [-3.0, -3.001, -3.002, -3.003]
+    assert all(sample[3] == 5 for sample in list_samples)
+
+
+def test_iter_fit_rejects_other_files(tmp_path):
+    not_fit_path = tmp_path / "track.fit"
+    not_fit_path.write_bytes(struct.pack('<BBHI4sH', 14, 0x20, 2132, 0, b'.GPX', 0))
+    with pytest.raises(ValueError):
+        list(trackImport.iter_fit(str(not_fit_path)))
+
+
+def write_gpx(path, list_timestamp_ms):
+    """GPX track with a point at each timestamp"""
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0"?>\n<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">'
+                '<trk><trkseg>\n')
+        for i, timestamp_ms in enumerate(list_timestamp_ms):
+            time_text = track.ms_to_datetime(timestamp_ms).strftime("%Y-%m-%dT%H:%M:%SZ")
+            f.write('<trkpt lat="%f" lon="%f"><ele>650</ele><time>%s</time></trkpt>\n' % (
+                40.4 + i * 1e-4, -3.7 + i * 1e-4, time_text))
+        f.write('</trkseg></trk></gpx>\n')
+
+
+def write_csv(path, list_timestamp_ms):
+    """csv track with a header and a row at each timestamp, in seconds since epoch"""
+    with open(path, 'w') as f:
+        f.write("Time,Lat,Lon,Accuracy\n")
+        for i, timestamp_ms in enumerate(list_timestamp_ms):
+            f.write("%d,%f,%f,%d\n" % (timestamp_ms // 1000, 40.5 + i * 1e-4, -3.6 + i * 1e-4, 20))
+
+
+def get_merge_reference(list_list_samples, from_ms, to_ms, overlap_ms):
+    """Samples of each source in the time range that no source before it has within overlap_ms, in time order"""
+    list_list_samples = [[sample for sample in list_samples if from_ms < sample[0] <= to_ms]
+                         for list_samples in list_list_samples]
+    list_kept = []
+    for priority, list_samples in enumerate(list_list_samples):
+        for sample in list_samples:
+            if not any(abs(sample[0] - other[0]) <= overlap_ms for list_other in list_list_samples[:priority]
+                       for other in list_other):
+                list_kept.append((sample[0], priority, sample))
+    return [sample for _, _, sample in sorted(list_kept, key=lambda item: item[:2])]
+
+
+def test_merge_sources_drops_overlapped_samples(tmp_path):
+    # GPX every 10 s for 10 minutes, csv every 30 s from 5 minutes before to 5 minutes after, with a gap in the GPX
+    list_gpx_ms = [START_MS + i * 10000 for i in range(61) if not 20 <= i < 40]
+    list_csv_ms = [START_MS + (i - 10) * 30000 for i in range(41)]
+    write_gpx(str(tmp_path / "watch.gpx"), list_gpx_ms)
+    write_csv(str(tmp_path / "phone.csv"), list_csv_ms)
+    list_paths = [str(tmp_path / "watch.gpx"), str(tmp_path / "phone.csv")]
+    from_ms, to_ms, overlap_ms = START_MS - 200000, START_MS + 700000, 60000
+
+    list_stats = [trackImport.SourceStats(path) for path in list_paths]
+    list_merged = list(trackImport.merge_sources([trackImport.open_source(path) for path in list_paths], list_stats,
+                                                 from_ms, to_ms, overlap_ms))
+
+    list_reference = get_merge_reference([list(trackImport.open_source(path)) for path in list_paths], from_ms,
+                                         to_ms, overlap_ms)
+    assert list_merged == list_reference
+    assert [sample[0] for sample in list_merged] == sorted(sample[0] for sample in list_merged)
+    # csv samples are kept only more than overlap_ms away from the GPX: before, after and in the middle of its gap
+    list_csv_kept = [sample[0] for sample in list_merged if sample[3] == 20]
+    assert list_csv_kept == [START_MS + offset_s * 1000 for offset_s in (-180, -150, -120, -90, 270, 300, 330, 690)]
+    assert list_stats[0].n_written == len(list_gpx_ms)
+    assert list_stats[1].n_written == len(list_csv_kept)
+    assert list_stats[1].n_overlapped == sum(from_ms < t <= to_ms for t in list_csv_ms) - len(list_csv_kept)
+
+
+def test_merge_sources_drops_unordered_samples():
+    list_samples = [(START_MS + offset_ms, 40.0, -3.0, 10) for offset_ms in (0, 1000, 500, 2000)]
+    stats = trackImport.SourceStats("unordered")
+    list_merged = list(trackImport.merge_sources([iter(list_samples)], [stats], START_MS - 1, START_MS + 10000, 0))
+    assert [sample[0] - START_MS for sample in list_merged] == [0, 1000, 2000]
+    assert stats.n_unordered == 1
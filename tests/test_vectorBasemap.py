@@ -0,0 +1,80 @@
+import numpy as np
+import smopy
+import src.vectorBasemap as vectorBasemap
+
+OSM_XML = """<?xml version="1.0"?>
+<osm version="0.6">
+<node id="1" lat="40.40" lon="-3.72"/>
+<node id="2" lat="40.41" lon="-3.70"/>
+<node id="3" lat="40.42" lon="-3.68"/>
+<node id="4" lat="40.60" lon="-3.50"/>
+<node id="5" lat="40.405" lon="-3.715"/>
+<node id="6" lat="40.405" lon="-3.705"/>
+<node id="7" lat="40.415" lon="-3.705"/>
+<way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><tag k="highway" v="primary"/></way>
+<way id="11"><nd ref="5"/><nd ref="6"/><nd ref="7"/><nd ref="5"/><tag k="leisure" v="park"/></way>
+<way id="12"><nd ref="3"/><nd ref="4"/><tag k="highway" v="residential"/></way>
+<way id="13"><nd ref="1"/><nd ref="2"/><tag k="highway" v="bus_stop"/></way>
+</osm>
+"""
+
+
+def write_osm(tmp_path):
+    osm_path = str(tmp_path / 'extract.osm')
+    with open(osm_path, 'w') as f:
+        f.write(OSM_XML)
+    return osm_path
+
+
+def test_read_osm_xml_keeps_styled_ways(tmp_path):
+    features = vectorBasemap.read_osm_xml(write_osm(tmp_path))
+    assert [vectorBasemap.STYLE_NAMES[i] for i in features.style_idx] == ['road_major', 'green', 'road_minor']
+    assert list(features.offsets) == [0, 4, 8, 10]
+    assert features.bbox is None
+
+
+def test_read_osm_xml_cuts_ways_to_bbox(tmp_path):
+    bbox = (40.3, -3.8, 40.5, -3.6)
+    features = vectorBasemap.read_osm_xml(write_osm(tmp_path), bbox)
+    # The residential way only has one node inside
+    assert [vectorBasemap.STYLE_NAMES[i] for i in features.style_idx] == ['road_major', 'green']
+    assert list(features.offsets) == [0, 3, 7]
+    assert features.bbox == bbox
+
+
+def test_cache_is_read_again_for_another_bbox(tmp_path):
+    osm_path = write_osm(tmp_path)
+    cache_path = str(tmp_path / 'basemap.npz')
+    assert len(vectorBasemap.load_features(osm_path, cache_path)) == 3
+    bbox = (40.3, -3.8, 40.5, -3.6)
+    features = vectorBasemap.load_features(osm_path, cache_path, bbox)
+    assert len(features) == 2
+    assert vectorBasemap.load_features(osm_path, cache_path, bbox).bbox == bbox
+    assert vectorBasemap.load_features(cache_path).bbox == bbox
+
+
+def test_view_of_tile_range_equals_mosaic(tmp_path):
+    source = vectorBasemap.VectorTileSource(vectorBasemap.read_osm_xml(write_osm(tmp_path)))
+    for z in (12, 15):
+        x, y = smopy.deg2num(40.41, -3.70, z)
+        mosaic = source.get_mosaic((x - 1, y - 1, x + 1, y), z, None, 256, 16)
+        lat_max_deg, long_min_deg = smopy.num2deg(x - 1, y - 1, z)
+        lat_min_deg, long_max_deg = smopy.num2deg(x + 2, y + 1, z)
+        view = source.get_view((lat_min_deg, long_min_deg, lat_max_deg, long_max_deg), mosaic.size)
+        assert np.array_equal(np.asarray(view), np.asarray(mosaic))
+
+
+def test_view_is_drawn_at_output_size(tmp_path):
+    source = vectorBasemap.VectorTileSource(vectorBasemap.read_osm_xml(write_osm(tmp_path)))
+    bbox = (40.40, -3.72, 40.42, -3.68)
+    view_small = np.asarray(source.get_view(bbox, (200, 100)))
+    view_large = np.asarray(source.get_view(bbox, (800, 400)))
+    assert view_small.shape == (100, 200, 3)
+    assert view_large.shape == (400, 800, 3)
+    # Same area: the park is at the same place at both sizes, up to the road over it that is wider in the small one
+    list_centers = []
+    for view in (view_small, view_large):
+        mask = np.all(view == vectorBasemap.STYLES['green'][1], axis=2)
+        y_px, x_px = np.nonzero(mask)
+        list_centers.append((x_px.mean() / view.shape[1], y_px.mean() / view.shape[0]))
+    assert np.allclose(list_centers[0], list_centers[1], atol=0.02)
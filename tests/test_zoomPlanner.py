@@ -0,0 +1,51 @@
+import smopy
+import src.zoomPlanner as zoomPlanner
+
+BBOX = (40.40, -3.72, 40.43, -3.68)  # (y_min, x_min, y_max, x_max) in degrees
+OUTPUT_PX = (640, 480)
+
+
+def test_tile_box_matches_smopy():
+    # smopy gives the y range from the bottom, the range it fetches is the sorted one
+    for z in (3, 10, 14, 17):
+        assert zoomPlanner.get_tile_box(BBOX, z) == smopy.correct_box(smopy.get_tile_box(BBOX, z), z)
+
+
+def test_plan_zoom_is_lowest_zoom_with_resolution():
+    plan = zoomPlanner.plan_zoom(BBOX, OUTPUT_PX, oversampling=1.0, maxtiles=1000)
+    assert plan.resolution_ratio >= 1.0
+    assert zoomPlanner.ZoomPlan(BBOX, plan.z - 1, OUTPUT_PX).resolution_ratio < 1.0
+
+
+def test_plan_zoom_oversampling_adds_a_level_per_doubling():
+    plan = zoomPlanner.plan_zoom(BBOX, OUTPUT_PX, oversampling=1.0, maxtiles=1000)
+    plan_2x = zoomPlanner.plan_zoom(BBOX, OUTPUT_PX, oversampling=2.0, maxtiles=1000)
+    assert plan_2x.z == plan.z + 1
+
+
+def test_plan_zoom_lowers_zoom_to_fit_tile_budget():
+    plan_free = zoomPlanner.plan_zoom(BBOX, OUTPUT_PX, oversampling=4.0, maxtiles=1000)
+    plan = zoomPlanner.plan_zoom(BBOX, OUTPUT_PX, oversampling=4.0, maxtiles=4)
+    assert plan.n_tiles < 4
+    assert plan.z < plan_free.z
+    assert zoomPlanner.ZoomPlan(BBOX, plan.z + 1, OUTPUT_PX).n_tiles >= 4
+
+
+def test_plan_zoom_limits():
+    # A point needs infinite resolution, it gets the highest zoom available
+    point = (40.41, -3.70, 40.41, -3.70)
+    assert zoomPlanner.plan_zoom(point, OUTPUT_PX, max_zoom=15).z == 15
+    # The whole world fits in the single tile of zoom 0
+    world = (-85.0, -180.0, 85.0, 179.9)
+    assert zoomPlanner.plan_zoom(world, OUTPUT_PX, maxtiles=2).z == 0
+
+
+def test_zoom_plan_counts_tiles_and_waste():
+    plan = zoomPlanner.ZoomPlan(BBOX, 14, OUTPUT_PX)
+    x0, y0, x1, y1 = plan.tile_box
+    assert plan.n_tiles == (x1 - x0 + 1) * (y1 - y0 + 1)
+    assert plan.mosaic_px == (plan.n_tiles_x * zoomPlanner.TILESIZE, plan.n_tiles_y * zoomPlanner.TILESIZE)
+    assert 0 <= plan.wasted_px_ratio < 1
+    # One more zoom level doubles the crop size
+    plan_next = zoomPlanner.ZoomPlan(BBOX, 15, OUTPUT_PX)
+    assert abs(plan_next.resolution_ratio - 2 * plan.resolution_ratio) < 1e-9